@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""Bounded read-ahead and write-behind stages of the batch pipeline.
+
+Inside each worker, a batch used to read, match, warp and encode one image
+after another. The CPU therefore idled while a frame was decoded from disk
+or an output was compressed. :class:`Prefetcher` loads the next frames on
+a reader thread while the workers compute. :class:`WriteBehind` runs every
+GeoTIFF write and encode on a writer thread, which the workers feed. Each
+stage has a bound (frames loaded ahead, writes waiting), so memory does
+not grow with the batch. The batch then runs at the pace of its slowest
+stage rather than the sum of all of them. This module has no QGIS
+dependency.
+"""
+
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Optional, Sequence
+
+
+def run_now(fn: Callable, *args, **kwargs) -> Future:
+    """Call `fn` right away; same interface as WriteBehind.submit, for runs without a writer thread."""
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except BaseException as e:
+        future.set_exception(e)
+    return future
+
+
+def completed(value: Any) -> Future:
+    """Future already resolved to `value`."""
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def chain(future: Future, on_result: Callable[[Any], Any],
+          on_error: Callable[[BaseException], Any]) -> Future:
+    """Future resolved to on_result(result) or on_error(exception) once `future` is done."""
+    chained = Future()
+
+    def resolve(done: Future):
+        try:
+            error = done.exception()
+            chained.set_result(on_error(error) if error is not None else on_result(done.result()))
+        except BaseException as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(resolve)
+    return chained
+
+
+def flatten(future: Future) -> Future:
+    """Future resolved like the Future that `future` itself resolves to."""
+    flat = Future()
+
+    def settle(done: Future, inner: bool):
+        if done.cancelled():
+            flat.cancel()
+            flat.set_running_or_notify_cancel()  # Only this wakes concurrent.futures.wait()
+        elif done.exception() is not None:
+            flat.set_exception(done.exception())
+        elif inner:
+            flat.set_result(done.result())
+        else:
+            done.result().add_done_callback(lambda result: settle(result, True))
+
+    future.add_done_callback(lambda outer: settle(outer, False))
+    return flat
+
+
+class Prefetcher:
+    """Loads `items` in order on a reader thread, at most `depth` items ahead of the consumers."""
+
+    def __init__(self, items: Sequence, load: Callable[[Any], Any], depth: int,
+                 release: Optional[Callable[[Any], None]] = None):
+        """Constructor.
+
+        Args:
+            items: Items to load, taken back by position with take()
+            load: Called on the reader thread for each item; its errors are
+                raised by take()
+            depth: Loaded items waiting to be taken, at most (>= 1)
+            release: Called on loaded items that are never taken (after close())
+        """
+        self._items = items
+        self._load = load
+        self._release = release
+        self._slots = threading.Semaphore(max(1, depth))
+        self._condition = threading.Condition()
+        self._loaded = {}  # position -> (value, error)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="georef-prefetch", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        for index, item in enumerate(self._items):
+            self._slots.acquire()
+            if self._closed:
+                return
+            try:
+                loaded = self._load(item), None
+            except Exception as e:
+                loaded = None, e
+            with self._condition:
+                if not self._closed:
+                    self._loaded[index] = loaded
+                    self._condition.notify_all()
+                    continue
+            if loaded[0] is not None and self._release:
+                self._release(loaded[0])
+            return
+
+    def take(self, index: int) -> Any:
+        """Item `index` once loaded (waits for it), or None if closed first; raises its load error."""
+        with self._condition:
+            while index not in self._loaded and not self._closed:
+                self._condition.wait()
+            if index not in self._loaded:
+                return None
+            value, error = self._loaded.pop(index)
+        self._slots.release()
+        if error is not None:
+            raise error
+        return value
+
+    def close(self):
+        """Stop loading, wake waiting consumers and release what was loaded but not taken."""
+        with self._condition:
+            self._closed = True
+            leftovers = list(self._loaded.values())
+            self._loaded.clear()
+            self._condition.notify_all()
+        self._slots.release()  # The reader may be waiting for a free slot
+        self._thread.join()
+        for value, _ in leftovers:
+            if value is not None and self._release:
+                self._release(value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class WriteBehind:
+    """Runs submitted calls, in order, on one writer thread; submit() blocks while `depth` calls wait."""
+
+    def __init__(self, depth: int):
+        self._queue = queue.Queue(maxsize=max(1, depth))
+        self._thread = threading.Thread(target=self._run, name="georef-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs); the Future holds its result or exception."""
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            future, fn, args, kwargs = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def close(self):
+        """Finish every queued call, then stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
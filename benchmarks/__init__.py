@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the georeferencing core (no QGIS needed).
+
+Run them from the directory that contains the plugin folder, for example
+``python -m georef_auto.benchmarks.bench_matching``.
+"""
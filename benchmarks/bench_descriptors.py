@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Descriptor storage benchmark: float32 vs. float16 vs. uint8 RootSIFT.
+
+Builds the same synthetic reference once per storage type and georeferences
+the same frames against it. For each type it reports the memory taken by
+the reference descriptors, their compressed size (as in the disk cache),
+the size of the context pickled for worker processes, the matching time
+and the frame corner error against the ground-truth transformation, in
+reference pixels.
+
+Usage, from the directory containing the plugin folder::
+
+    python -m georef_auto.benchmarks.bench_descriptors --size 6000 --frames 4
+"""
+
+import argparse
+import io
+import logging
+import pickle
+import time
+
+import cv2
+import numpy as np
+
+from ..feature_backends import DESCRIPTOR_STORAGES, RootSiftFeatures
+from ..georef_core import build_reference_context, estimate_homography
+from .synthetic import capture, make_scene, scene_bounds, scene_renderer
+
+
+def frame_homographies(size: int, count: int, seed: int):
+    """Ground-truth frame -> scene transformations: rotated, scaled frames inside the scene."""
+    rng = np.random.default_rng(seed)
+    frame_w, frame_h = size // 4, size * 3 // 16
+    result = []
+    for _ in range(count):
+        angle, scale = np.deg2rad(rng.uniform(-20, 20)), rng.uniform(1.0, 1.6)
+        x0 = rng.uniform(0.1, 0.5) * size
+        y0 = rng.uniform(0.1, 0.4) * size * 3 / 4
+        H = np.array([[scale * np.cos(angle), -scale * np.sin(angle), x0],
+                      [scale * np.sin(angle), scale * np.cos(angle), y0],
+                      [0, 0, 1]])
+        result.append((H, frame_w, frame_h))
+    return result
+
+
+def corner_error(H_est: np.ndarray, level, H_true: np.ndarray, width: int, height: int) -> float:
+    """Mean distance, in scene pixels, between estimated and true frame corners."""
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+    estimated = cv2.perspectiveTransform(corners, H_est).reshape(-1, 2) * level.pixel_size
+    true = cv2.perspectiveTransform(corners, H_true).reshape(-1, 2)
+    return float(np.linalg.norm(estimated - true, axis=1).mean())
+
+
+def compressed_size(arrays) -> int:
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, *arrays)
+    return buffer.tell()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size", type=int, default=6000, help="Reference width in pixels (height is 3/4 of it)")
+    parser.add_argument("--frames", type=int, default=4, help="Frames georeferenced per storage type")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    scene = make_scene(args.size, args.size * 3 // 4, args.seed)
+    frames = [(capture(scene, H, w, h), H) for H, w, h in frame_homographies(args.size, args.frames, args.seed)]
+
+    print(f"{'storage':10}{'desc MB':>10}{'cache MB':>10}{'pickle MB':>11}{'match s':>9}"
+          f"{'err px':>9}{'max err':>9}")
+    for storage in DESCRIPTOR_STORAGES:
+        context = build_reference_context(scene_bounds(scene), "EPSG:32723", scene_renderer(scene),
+                                          native_pixel_size=1.0, features=RootSiftFeatures(20000, storage))
+        detached = context.detached(max_tiles=64)
+        descriptors = [t.descriptors for level in detached.levels for t in detached.tiles(level.index)
+                       if t.descriptors is not None]
+        pickled = len(pickle.dumps(detached, protocol=pickle.HIGHEST_PROTOCOL))
+
+        errors, start = [], time.perf_counter()
+        for frame, H_true in frames:
+            H_est, level = estimate_homography(frame, detached)
+            errors.append(corner_error(H_est, level, H_true, frame.shape[1], frame.shape[0]))
+        elapsed = time.perf_counter() - start
+
+        print(f"{storage:10}{sum(d.nbytes for d in descriptors) / 1e6:10.1f}"
+              f"{compressed_size(descriptors) / 1e6:10.1f}{pickled / 1e6:11.1f}{elapsed:9.2f}"
+              f"{np.mean(errors):9.3f}{np.max(errors):9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Matching stage benchmark: per-DMatch Python loop vs. NumPy arrays end to end.
+
+Featurizes a synthetic reference and a rotated, scaled frame of it, then
+times, on the same descriptors, the former matching stage (FlannBasedMatcher
+``knnMatch``, a ``for m, n in matches`` ratio test and list comprehensions
+over DMatch/KeyPoint objects) against the current one (``flann_Index``
+``knnSearch`` into arrays, vectorized ratio test and point gathering).
+FLANN indexes are built before timing in both cases.
+
+Usage, from the directory containing the plugin folder::
+
+    python -m georef_auto.benchmarks.bench_matching --size 6000 --repeat 5
+"""
+
+import argparse
+import logging
+import time
+
+import cv2
+import numpy as np
+
+from ..georef_core import LOWE_RATIO, build_reference_context, root_sift_detect_and_compute
+from .synthetic import capture, make_scene, scene_bounds, scene_renderer
+
+
+def best_time(fn, repeat: int):
+    """Smallest wall time of `repeat` calls, and the last result."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def legacy_matching(matcher, tiles, keypoints, descriptors):
+    raw_matches = matcher.knnMatch(np.float32(descriptors), k=2)
+    start = time.perf_counter()
+    good_matches = []
+    for m, n in raw_matches:
+        if m.distance < LOWE_RATIO * n.distance:
+            good_matches.append(m)
+    pts1 = np.float32([keypoints[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+    pts2 = np.float32([tiles[m.imgIdx].points[m.trainIdx] for m in good_matches]).reshape(-1, 1, 2)
+    return time.perf_counter() - start, pts1, pts2
+
+
+def vectorized_matching(context, keypoints, descriptors):
+    distances, indices, ref_points = context.knn_match(descriptors, 0, k=2)
+    start = time.perf_counter()
+    good = (distances[:, 0] < LOWE_RATIO * distances[:, 1]) & (indices[:, 1] >= 0)
+    pts1 = cv2.KeyPoint_convert(keypoints)[good].reshape(-1, 1, 2)
+    pts2 = ref_points[indices[good, 0]].reshape(-1, 1, 2)
+    return time.perf_counter() - start, pts1, pts2
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size", type=int, default=6000, help="Reference width in pixels (height is 3/4 of it)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per variant; the best one is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    scene = make_scene(args.size, args.size * 3 // 4, args.seed)
+    context = build_reference_context(scene_bounds(scene), "EPSG:32723", scene_renderer(scene),
+                                      native_pixel_size=1.0, target_width_px=args.size)
+    tiles = context.tiles(0)
+    angle = np.deg2rad(12.0)
+    H = np.array([[1.3 * np.cos(angle), -1.3 * np.sin(angle), args.size * 0.2],
+                  [1.3 * np.sin(angle), 1.3 * np.cos(angle), args.size * 0.1],
+                  [0, 0, 1]])
+    frame = capture(scene, H, args.size // 2, args.size * 3 // 8)
+    keypoints, descriptors = root_sift_detect_and_compute(frame)
+
+    matcher = cv2.FlannBasedMatcher(dict(algorithm=1, trees=5), dict(checks=50))
+    matcher.add([t.descriptors for t in tiles])
+    matcher.train()
+    context.knn_match(descriptors[:1], 0, k=2)  # Builds and caches the index
+
+    legacy_total, (_, pts1_a, _) = best_time(
+        lambda: legacy_matching(matcher, tiles, keypoints, descriptors), args.repeat)
+    vector_total, (_, pts1_b, _) = best_time(
+        lambda: vectorized_matching(context, keypoints, descriptors), args.repeat)
+    legacy_post = min(legacy_matching(matcher, tiles, keypoints, descriptors)[0] for _ in range(args.repeat))
+    vector_post = min(vectorized_matching(context, keypoints, descriptors)[0] for _ in range(args.repeat))
+
+    print(f"reference features: {context.feature_count(0)}, query features: {len(keypoints)}")
+    print(f"good matches: loop {len(pts1_a)}, vectorized {len(pts1_b)}")
+    print(f"{'':12}{'total (s)':>12}{'ratio test + points (ms)':>28}")
+    print(f"{'loop':12}{legacy_total:12.3f}{legacy_post * 1000:28.2f}")
+    print(f"{'vectorized':12}{vector_total:12.3f}{vector_post * 1000:28.2f}")
+    print(f"speedup: {legacy_total / vector_total:.2f}x total, "
+          f"{legacy_post / max(vector_post, 1e-9):.0f}x ratio test + points")
+
+
+if __name__ == "__main__":
+    main()
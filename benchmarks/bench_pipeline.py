@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""End-to-end pipeline benchmark on synthetic frames of 2 to 100 megapixels.
+
+Writes a synthetic reference mosaic (a tiled GeoTIFF with overviews) and,
+for each frame size, frames captured from it through known homographies
+(rotation, scale and a slight perspective tilt), saved as JPEG-compressed
+RGB TIFFs. Every frame covers the same ground footprint, so larger frames
+have a finer ground resolution, as with a higher-resolution camera. The
+frames then go through the same batch pipeline as the plugin (run_batch,
+with its reader, workers and writer). The pipeline records, for each
+frame, the time of each stage, the peak memory and the keypoint, match
+and inlier counts. The estimated image -> map transformation is then
+compared with the ground truth on a grid of frame points.
+
+Results are written as JSON: the environment (plugin version and commit,
+Python and library versions, CPU count), the parameters, one record per
+frame and a summary per size. With the same parameters and seed the inputs
+are identical from run to run, so two result files can be compared, and
+``--baseline`` prints that comparison.
+
+Usage, from the directory containing the plugin folder::
+
+    python -m georef_auto.benchmarks.bench_pipeline --sizes 2,12,50,100 --output before.json
+    python -m georef_auto.benchmarks.bench_pipeline --sizes 2,12,50,100 --output after.json --baseline before.json
+"""
+
+import argparse
+import configparser
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+import rasterio
+
+from ..georef_core import (
+    DEFAULT_PREFETCH_FRAMES, OUTPUT_EXTENSIONS, PRESETS, GeorefOptions, build_raster_reference_context,
+    default_output_path, run_batch
+)
+from ..stage_metrics import STAGES, report_row
+from .synthetic import make_scene, scene_bounds, write_frame, write_reference
+
+FOOTPRINT = 0.3  # Ground width covered by every frame, as a fraction of the reference width
+GRID_POINTS = 5  # Frame points per side compared with the ground truth
+RESULTS_VERSION = 1  # Layout of the JSON results; changed when records are renamed or removed
+_PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def frame_size(megapixels: float) -> Tuple[int, int]:
+    """Width and height of a 4:3 frame of `megapixels`."""
+    width = int(round(math.sqrt(megapixels * 1e6 * 4 / 3)))
+    return width, int(round(width * 3 / 4))
+
+
+def frame_homography(rng: np.random.Generator, scene_shape, width: int, height: int) -> np.ndarray:
+    """Random frame -> scene transformation whose footprint lies inside the scene."""
+    scene_height, scene_width = scene_shape[:2]
+    scale = FOOTPRINT * scene_width / width
+    angle = np.deg2rad(rng.uniform(-25, 25))
+    centred = np.array([[1, 0, -width / 2], [0, 1, -height / 2], [0, 0, 1]])
+    tilt = np.array([[1, 0, 0], [0, 1, 0],
+                     [rng.uniform(-0.1, 0.1) / width, rng.uniform(-0.1, 0.1) / height, 1]])
+    rotation = np.array([[scale * np.cos(angle), -scale * np.sin(angle), 0],
+                         [scale * np.sin(angle), scale * np.cos(angle), 0],
+                         [0, 0, 1]])
+    local = rotation @ tilt @ centred
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+    extent_x, extent_y = np.abs(cv2.perspectiveTransform(corners, local).reshape(-1, 2)).max(axis=0)
+    cx = rng.uniform(extent_x, scene_width - extent_x)
+    cy = rng.uniform(extent_y, scene_height - extent_y)
+    return np.array([[1, 0, cx], [0, 1, cy], [0, 0, 1]]) @ local
+
+
+def transform_errors(image_to_map, H_true: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Distances, in map units (reference pixels), between estimated and true positions of frame points."""
+    xs, ys = np.linspace(0, width - 1, GRID_POINTS), np.linspace(0, height - 1, GRID_POINTS)
+    grid = np.float64([(x, y) for y in ys for x in xs]).reshape(-1, 1, 2)
+    estimated = cv2.perspectiveTransform(grid, np.float64(image_to_map)).reshape(-1, 2)
+    scene = cv2.perspectiveTransform(grid, H_true).reshape(-1, 2)
+    true = np.column_stack([scene[:, 0] + 0.5, -(scene[:, 1] + 0.5)])  # Scene pixel centres; map y = -row
+    return np.linalg.norm(estimated - true, axis=1)
+
+
+def environment() -> dict:
+    """Versions and machine the results were measured with."""
+    metadata = configparser.ConfigParser(interpolation=None, strict=False)
+    metadata.read(os.path.join(_PLUGIN_DIR, "metadata.txt"), encoding="utf-8")
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_PLUGIN_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "plugin_version": metadata.get("general", "version", fallback=None),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "rasterio": rasterio.__version__,
+        "gdal": rasterio.__gdal_version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _mean(values) -> float:
+    values = [v for v in values if v is not None]
+    return round(float(np.mean(values)), 3) if values else None
+
+
+def summarize(records: List[dict], sizes: List[float]) -> List[dict]:
+    """Per-size means (times, errors), maxima (memory, errors) and throughput."""
+    summary = []
+    for megapixels in sizes:
+        group = [r for r in records if r["size_mp"] == megapixels]
+        succeeded = [r for r in group if r["status"] == "ok"]
+        total = _mean(r.get("total_s") for r in succeeded)
+        row = {"size_mp": megapixels, "frames": len(group), "succeeded": len(succeeded), "total_s": total}
+        for name in STAGES:
+            row[f"{name}_s"] = _mean(r.get(f"{name}_s") for r in succeeded)
+        peaks = [r["peak_rss_mb"] for r in group if r.get("peak_rss_mb") is not None]
+        row["peak_rss_mb"] = max(peaks) if peaks else None
+        row["error_mean_px"] = _mean(r.get("error_mean_px") for r in succeeded)
+        errors = [r["error_max_px"] for r in succeeded if r.get("error_max_px") is not None]
+        row["error_max_px"] = max(errors) if errors else None
+        row["megapixels_per_s"] = round(megapixels / total, 3) if total else None
+        summary.append(row)
+    return summary
+
+
+def print_summary(summary: List[dict], out=sys.stderr):
+    print(f"{'size MP':>8}{'ok':>6}{'total s':>9}{'read s':>8}{'detect s':>10}{'match s':>9}{'warp s':>8}"
+          f"{'write s':>9}{'peak MB':>9}{'err px':>8}{'max err':>9}", file=out)
+    for row in summary:
+        cells = [row["total_s"], row["read_s"], row["detect_s"], row["match_s"], row["warp_s"], row["write_s"]]
+        widths = (9, 8, 10, 9, 8, 9)
+        text = "".join(f"{c:{w}.2f}" if c is not None else f"{'-':>{w}}" for c, w in zip(cells, widths))
+        extra = [(row["peak_rss_mb"], 9, ".0f"), (row["error_mean_px"], 8, ".3f"), (row["error_max_px"], 9, ".3f")]
+        text += "".join(f"{c:{w}{f}}" if c is not None else f"{'-':>{w}}" for c, w, f in extra)
+        print(f"{row['size_mp']:8g}{row['succeeded']:>3}/{row['frames']:<2}{text}", file=out)
+
+
+def compare(results: dict, baseline: dict, out=sys.stderr):
+    """Print, per size, the change of the total time, peak memory and mean error against `baseline`."""
+    if baseline.get("parameters") != results["parameters"]:
+        print("Warning: the baseline was run with other parameters; the inputs differ.", file=out)
+    before = {row["size_mp"]: row for row in baseline.get("summary", [])}
+    print(f"Against {baseline['environment'].get('commit') or 'baseline'}:", file=out)
+    for row in results["summary"]:
+        old = before.get(row["size_mp"])
+        if old is None:
+            continue
+        changes = []
+        for key, label in (("total_s", "time"), ("peak_rss_mb", "memory"), ("error_mean_px", "error")):
+            if row.get(key) is not None and old.get(key):
+                changes.append(f"{label} {old[key]:g} -> {row[key]:g} ({row[key] / old[key] - 1:+.1%})")
+        print(f"  {row['size_mp']:g} MP: " + ", ".join(changes), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="2,12,50,100", help="Frame sizes in megapixels, comma-separated")
+    parser.add_argument("--frames", type=int, default=2, help="Frames per size")
+    parser.add_argument("--reference-size", type=int, default=8000,
+                        help="Reference mosaic width in pixels (height is 3/4 of it)")
+    parser.add_argument("--preset", choices=PRESETS, default=PRESETS[0])
+    parser.add_argument("--output-mode", choices=sorted(OUTPUT_EXTENSIONS), default="warp")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Frames processed in parallel (default: 1, so stage times are not shared)")
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH_FRAMES, help="Frames read ahead")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Where inputs and outputs are written (default: a temporary "
+                                          "directory, removed afterwards)")
+    parser.add_argument("--output", help="JSON results file (default: standard output)")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare with")
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    sizes = [float(s) for s in args.sizes.split(",")]
+    parameters = {key: getattr(args, key) for key in
+                  ("frames", "reference_size", "preset", "output_mode", "workers", "prefetch", "seed")}
+    parameters["sizes"] = sizes
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="georef_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        rng = np.random.default_rng(args.seed)
+        scene = make_scene(args.reference_size, args.reference_size * 3 // 4, args.seed)
+        bounds = scene_bounds(scene)
+        reference_path = os.path.join(workdir, "reference.tif")
+        write_reference(reference_path, scene)
+        frames = []
+        for megapixels in sizes:
+            width, height = frame_size(megapixels)
+            for i in range(args.frames):
+                H = frame_homography(rng, scene.shape, width, height)
+                path = os.path.join(workdir, f"frame_{megapixels:g}mp_{i}.tif")
+                print(f"Writing {os.path.basename(path)} ({width}x{height})...", file=sys.stderr)
+                write_frame(path, scene, H, width, height)
+                frames.append(dict(path=path, size_mp=megapixels, H=H, width=width, height=height))
+        del scene
+
+        options = GeorefOptions(output_mode=args.output_mode, feature_preset=args.preset,
+                                prefetch_frames=args.prefetch)
+        started = time.perf_counter()
+        context = build_raster_reference_context(reference_path, bounds, features=options.feature_backend())
+        reference_s = time.perf_counter() - started
+
+        stats_by_path = {}
+
+        def collect(image_path, success, message, output_path, stats):
+            stats_by_path[image_path] = report_row(image_path, success, message, output_path, stats), stats
+            print(f"{'OK    ' if success else 'FAILED'} {os.path.basename(image_path)}: "
+                  f"{stats.get('total_s', 0):.2f} s", file=sys.stderr)
+
+        image_paths = [f["path"] for f in frames]
+        output_paths = [default_output_path(p, workdir, options.output_extension) for p in image_paths]
+        started = time.perf_counter()
+        run_batch(image_paths, context, output_paths, max_workers=args.workers, options=options,
+                  result_callback=collect)
+        batch_s = time.perf_counter() - started
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    records = []
+    for frame in frames:
+        row, stats = stats_by_path[frame["path"]]
+        record = dict(size_mp=frame["size_mp"], width=frame["width"], height=frame["height"],
+                      frame_gsd=round(FOOTPRINT * args.reference_size / frame["width"], 4))
+        record.update({key: value for key, value in row.items() if key != "output"})
+        if row["status"] == "ok":
+            record.pop("message")
+            errors = transform_errors(stats["image_to_map"], frame["H"], frame["width"], frame["height"])
+            record["error_mean_px"] = round(float(errors.mean()), 4)
+            record["error_max_px"] = round(float(errors.max()), 4)
+        records.append(record)
+
+    results = {
+        "benchmark": "pipeline",
+        "results_version": RESULTS_VERSION,
+        "environment": environment(),
+        "parameters": parameters,
+        "reference_s": round(reference_s, 3),
+        "batch_s": round(batch_s, 3),
+        "frames": records,
+        "summary": summarize(records, sizes),
+    }
+    print_summary(results["summary"])
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    return 0 if all(r["status"] == "ok" for r in records) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
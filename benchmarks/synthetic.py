@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Synthetic reference scenes for the benchmarks.
+
+A scene is a textured 8-bit gray image in map coordinates x = column,
+y = -row (one map unit per pixel), so map bounds (0, -height, width, 0)
+cover it exactly. Scenes and frames can also be written to disk, as a
+reference GeoTIFF and as frame files, to benchmark the whole file pipeline.
+"""
+
+import warnings
+
+import cv2
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.errors import NotGeoreferencedWarning
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+_SHAPES_PER_MEGAPIXEL = 130
+
+
+def make_scene(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Random circles and rectangles over sensor-like noise: plenty of distinctive features."""
+    rng = np.random.default_rng(seed)
+    scene = np.zeros((height, width), np.uint8)
+    for _ in range(max(1, int(width * height / 1e6 * _SHAPES_PER_MEGAPIXEL))):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        r, value = int(rng.integers(5, 60)), int(rng.integers(30, 255))
+        if rng.random() < 0.5:
+            cv2.circle(scene, (x, y), r, value, -1)
+        else:
+            cv2.rectangle(scene, (x, y), (int(x + r * 1.7), y + r), value, -1)
+    noise = rng.normal(0, 8, (height, width))
+    return np.clip(cv2.GaussianBlur(scene, (3, 3), 0) + noise, 0, 255).astype(np.uint8)
+
+
+def scene_bounds(scene: np.ndarray):
+    """Map bounds (xmin, ymin, xmax, ymax) covered by `scene`."""
+    height, width = scene.shape[:2]
+    return 0.0, float(-height), float(width), 0.0
+
+
+def scene_renderer(scene: np.ndarray):
+    """``(bounds, width, height) -> gray`` tile renderer over `scene`, zero outside it."""
+    def render(bounds, width, height):
+        xmin, ymin, xmax, ymax = bounds
+        sx, sy = (xmax - xmin) / width, (ymax - ymin) / height
+        M = np.float32([[sx, 0, xmin], [0, sy, -ymax]])
+        return cv2.warpAffine(scene, M, (width, height), flags=cv2.INTER_AREA | cv2.WARP_INVERSE_MAP)
+    render.thread_safe = True
+    return render
+
+
+def capture(scene: np.ndarray, H: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Frame of `width` x `height` whose pixels map to scene pixels through `H` (frame -> scene)."""
+    return cv2.warpPerspective(scene, np.linalg.inv(H), (width, height), flags=cv2.INTER_LINEAR)
+
+
+def write_reference(path: str, scene: np.ndarray, crs: str = "EPSG:32723"):
+    """Save `scene` as a tiled GeoTIFF with overviews, georeferenced as in scene_bounds."""
+    height, width = scene.shape[:2]
+    with warnings.catch_warnings():
+        # GDAL warns that a north-up transform at the origin looks like "no transform"; GTiff still writes it
+        warnings.simplefilter("ignore", NotGeoreferencedWarning)
+        with rasterio.open(path, "w", driver="GTiff", width=width, height=height, count=1, dtype="uint8",
+                           crs=crs, transform=from_origin(0, 0, 1, 1), tiled=True, blockxsize=512,
+                           blockysize=512, compress="DEFLATE") as dst:
+            dst.write(scene, 1)
+            dst.build_overviews([2, 4, 8, 16], Resampling.average)
+
+
+def write_frame(path: str, scene: np.ndarray, H: np.ndarray, width: int, height: int,
+                bands: int = 3, strip_rows: int = 1024):
+    """Save capture(scene, H, width, height) as a JPEG-compressed TIFF without georeferencing.
+
+    The frame is warped and written by strips of `strip_rows`, so frames of
+    hundreds of megapixels do not need to fit in memory. The gray capture
+    is repeated in each of the `bands` bands (3 for an RGB camera frame).
+    """
+    profile = dict(driver="GTiff", width=width, height=height, count=bands, dtype="uint8", tiled=True,
+                   blockxsize=512, blockysize=512, compress="JPEG", jpeg_quality=90)
+    if bands == 3:
+        profile["photometric"] = "YCBCR"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", NotGeoreferencedWarning)
+        with rasterio.open(path, "w", **profile) as dst:
+            for row in range(0, height, strip_rows):
+                rows = min(strip_rows, height - row)
+                # Strip pixels -> frame pixels -> scene pixels
+                M = H @ np.array([[1, 0, 0], [0, 1, row], [0, 0, 1]], dtype=np.float64)
+                strip = cv2.warpPerspective(scene, M, (width, rows), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP)
+                dst.write(np.broadcast_to(strip, (bands, rows, width)),
+                          window=Window(0, row, width, rows))
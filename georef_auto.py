@@ -1,9 +1,11 @@
 from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction
+from qgis.core import QgsApplication
 import os.path
 
 from .georef_auto_dialog import GeorefAutoDialog
+from .georef_processing_provider import GeorefAutoProvider
 
 class GeorefAuto:
     """QGIS Plugin for automatic georeferencing of aerial images"""
@@ -23,7 +25,7 @@ class GeorefAuto:
         self.plugin_dir = os.path.dirname(__file__)
         
         # Initialize locale
-        locale = QSettings().value('locale/userLocale')[0:2]
+        locale = (QSettings().value('locale/userLocale') or '')[0:2]
         locale_path = os.path.join(
             self.plugin_dir,
             'i18n',
@@ -37,11 +39,12 @@ class GeorefAuto:
         # Declare instance attributes
         self.actions = []
         self.menu = 'Automatic Georeferencing'
-        self.toolbar = self.iface.addToolBar('Automatic Georeferencing')
-        self.toolbar.setObjectName('AutomaticGeoreferencing')
+        # Created in initGui: under qgis_process there is no GUI and iface is None
+        self.toolbar = None
         
         # Check if plugin was started the first time in current QGIS session
         self.first_start = None
+        self.provider = None
 
     def add_action(
         self,
@@ -102,8 +105,17 @@ class GeorefAuto:
 
         return action
 
+    def initProcessing(self):
+        """Register the Processing provider (also used by qgis_process)."""
+        self.provider = GeorefAutoProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
+
     def initGui(self):
         """Create the menu entries and toolbar icons inside the QGIS GUI."""
+        self.initProcessing()
+
+        self.toolbar = self.iface.addToolBar('Automatic Georeferencing')
+        self.toolbar.setObjectName('AutomaticGeoreferencing')
 
         icon_path = os.path.join(self.plugin_dir, 'icon.png')
         self.add_action(
@@ -123,7 +135,12 @@ class GeorefAuto:
                 action)
             self.iface.removeToolBarIcon(action)
         # remove the toolbar
-        del self.toolbar
+        if self.toolbar is not None:
+            self.toolbar.deleteLater()
+            self.toolbar = None
+        if self.provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
+            self.provider = None
 
     def run(self):
         """Run method that performs all the real work"""
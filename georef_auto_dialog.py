@@ -3,14 +3,20 @@ from PyQt5.QtCore import Qt
 from .maptool_polygon import MapToolPolygon
 from qgis.core import (
     QgsProject, QgsRasterLayer, QgsGeometry, QgsMapLayer, QgsLayerTree,
-    QgsVectorLayer, QgsCoordinateReferenceSystem, QgsMapLayerType
+    QgsVectorLayer, QgsCoordinateReferenceSystem, QgsMapLayerType, QgsApplication
 )
 from qgis.PyQt.QtWidgets import QDialog, QFileDialog, QMessageBox, QListWidgetItem
 from .georef_auto_dialog_base import Ui_GeorefAutoDialog
-from .georeferencing import georeference_image, batch_georeference, get_area_in_square_km, MAX_POLYGON_AREA
+from .georeferencing import (
+    default_output_path, get_area_in_square_km, invalidate_reference_cache, MAX_POLYGON_AREA, DEFAULT_MAX_WORKERS,
+    GeorefOptions, OUTPUT_MODE_WARP, OUTPUT_MODE_VRT, OUTPUT_COMPRESSIONS,
+    PRESET_ACCURATE, PRESET_BALANCED, PRESET_FAST
+)
+from .georef_task import BatchGeoreferenceTask
 from .georef_report_dialog import GeorefReportDialog # Import the report dialog
 import os
 import logging # Use logging
+import traceback
 
 # Setup logginlogging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -35,6 +41,7 @@ class GeorefAutoDialog(QDialog, Ui_GeorefAutoDialog):
         self.btnClearImages.clicked.connect(self.clear_all_images)
         self.btnDrawPolygon.clicked.connect(self.draw_polygon)
         self.btnGeoreference.clicked.connect(self.execute_georeferencing)
+        self.btnClearCache.clicked.connect(self.clear_reference_cache)
         self.btnCancel.clicked.connect(self.close)
 
         # Initialize variables
@@ -44,6 +51,16 @@ class GeorefAutoDialog(QDialog, Ui_GeorefAutoDialog):
         self.available_layers = []
         self.batch_output_dir = None  # Initialize batch output directory
         self.polygon_tool = None  # Initialize polygon tool
+        self.batch_task = None  # Running BatchGeoreferenceTask, if any
+        self.report_dialog = None
+        self.spinBoxWorkers.setValue(DEFAULT_MAX_WORKERS)
+        self.comboPreset.addItem("Accurate (RootSIFT)", PRESET_ACCURATE)
+        self.comboPreset.addItem("Balanced (AKAZE)", PRESET_BALANCED)
+        self.comboPreset.addItem("Fast (ORB, quick look)", PRESET_FAST)
+        self.comboOutputMode.addItem("Warped GeoTIFF", OUTPUT_MODE_WARP)
+        self.comboOutputMode.addItem("Original image + GCPs (VRT, fast)", OUTPUT_MODE_VRT)
+        for compression in OUTPUT_COMPRESSIONS:
+            self.comboCompression.addItem(compression, compression)
 
         # Initialize polygon area display and button state
         self.update_polygon_area_display()
@@ -128,7 +145,7 @@ class GeorefAutoDialog(QDialog, Ui_GeorefAutoDialog):
         
         # Enable/disable georeference button based on area validity
         # Also check if images are loaded
-        self.btnGeoreference.setEnabled(is_area_valid and bool(self.image_paths))
+        self.btnGeoreference.setEnabled(is_area_valid and bool(self.image_paths) and self.batch_task is None)
 
     def refresh_layers(self, layers=None):
         """
@@ -423,6 +440,27 @@ class GeorefAutoDialog(QDialog, Ui_GeorefAutoDialog):
         # Update button state even if layer selection fails or changes to None
         self.update_polygon_area_display()
 
+    def clear_reference_cache(self):
+        """
+        Invalidate cached reference renders for the selected layer, or the whole cache.
+        """
+        if self.reference_layer:
+            removed = invalidate_reference_cache(self.reference_layer)
+            target = self.reference_layer.name()
+        else:
+            removed = invalidate_reference_cache()
+            target = "all layers"
+        self.iface.messageBar().pushMessage(
+            "Reference Cache", f"Removed {removed} cached entries for {target}.", level=0, duration=5
+        ) # Qgis.Info = 0
+
+    def georef_options(self):
+        """Output options selected in the dialog."""
+        return GeorefOptions(output_mode=self.comboOutputMode.currentData(),
+                             output_resolution=self.spinBoxResolution.value() or None,
+                             compression=self.comboCompression.currentData(),
+                             feature_preset=self.comboPreset.currentData())
+
     def execute_georeferencing(self):
         """
         Execute the georeferencing process for all loaded images.
@@ -446,6 +484,8 @@ class GeorefAutoDialog(QDialog, Ui_GeorefAutoDialog):
              QMessageBox.critical(self, "Error", f"Polygon area ({area_km2:.2f} km²) exceeds the maximum allowed ({MAX_POLYGON_AREA:,.0f} km²). Please redraw the polygon.")
              return
 
+        options = self.georef_options()
+
         # Get output directory
         if len(self.image_paths) > 1:
             # Batch mode: Ask for output directory
@@ -456,9 +496,10 @@ class GeorefAutoDialog(QDialog, Ui_GeorefAutoDialog):
         else:
             # Single image mode: Ask for output file path
             input_filename = os.path.basename(self.image_paths[0])
-            default_output_name = os.path.splitext(input_filename)[0] + "_georef.tif"
+            default_output_name = os.path.splitext(input_filename)[0] + "_georef" + options.output_extension
+            file_filter = "GeoTIFF (*.tif)" if options.output_mode == OUTPUT_MODE_WARP else "GDAL VRT (*.vrt)"
             output_path, _ = QFileDialog.getSaveFileName(
-                self, "Save Georeferenced Image", default_output_name, "GeoTIFF (*.tif)"
+                self, "Save Georeferenced Image", default_output_name, file_filter
             )
             if not output_path:
                 return # User cancelled
@@ -470,54 +511,83 @@ class GeorefAutoDialog(QDialog, Ui_GeorefAutoDialog):
             # Store the specific output path for the single image
             single_output_path = output_path 
 
+        if len(self.image_paths) > 1:
+            output_paths = [default_output_path(p, self.batch_output_dir, options.output_extension)
+                            for p in self.image_paths]
+        else:
+            output_paths = [single_output_path]
+
         logging.info(f"Starting georeferencing. Images: {len(self.image_paths)}, Output Dir/Path: {self.batch_output_dir if len(self.image_paths) > 1 else single_output_path}")
         
-        # Execute georeferencing
+        # Execute georeferencing in a background task; results stream into the report dialog
         try:
-            successful_outputs, failed_images = batch_georeference(
+            self.batch_task = BatchGeoreferenceTask(
                 self.image_paths,
                 self.polygon_geometry,
                 self.reference_layer,
-                self # Pass the dialog instance
+                output_paths,
+                max_workers=self.spinBoxWorkers.value(),
+                use_processes=self.checkBoxProcesses.isChecked(),
+                options=options,
+                resume=self.checkBoxResume.isChecked()
             )
-            
-            logging.info(f"Georeferencing finished. Success: {len(successful_outputs)}, Failed: {len(failed_images)}")
-            
-            # Show report dialog
-            report_dialog = GeorefReportDialog(successful_outputs, failed_images, self)
-            report_dialog.exec_()
-            
-            # --- ADD LAYER TO PROJECT --- 
-            # Check if the option is enabled
-            if self.checkBoxAddToProject.isChecked():
-                logging.info("Adding successful outputs to the project.")
-                added_count = 0
-                for output_path in successful_outputs:
-                    try:
-                        layer_name = os.path.basename(output_path)
-                        # Use iface.addRasterLayer to add the layer
-                        rlayer = self.iface.addRasterLayer(output_path, layer_name)
-                        if rlayer and rlayer.isValid():
-                            logging.info(f"Successfully added layer: {layer_name}")
-                            added_count += 1
-                        else:
-                            logging.warning(f"Failed to add layer: {layer_name} from path: {output_path}")
-                            # Optionally inform user via message box or keep in report
-                            # QMessageBox.warning(self, "Layer Loading Error", f"Could not load the georeferenced layer: {layer_name}")
-                    except Exception as add_e:
-                        logging.error(f"Error adding layer {output_path} to project: {add_e}")
-                        # Optionally inform user
-                        # QMessageBox.critical(self, "Layer Loading Error", f"An error occurred while adding {os.path.basename(output_path)}: {add_e}")
-                if added_count > 0:
-                     self.iface.messageBar().pushMessage("Success", f"{added_count} georeferenced image(s) added to the project.", level=1, duration=5) # Qgis.Success = 1
-            else:
-                logging.info("Option to add layers to project is disabled.")
-            # --- END ADD LAYER TO PROJECT ---
-            
+            self.report_dialog = GeorefReportDialog(parent=self)
+            self.batch_task.image_finished.connect(self.report_dialog.add_result)
+            self.batch_task.status_changed.connect(self.report_dialog.set_status)
+            self.batch_task.progressChanged.connect(self.report_dialog.set_progress)
+            self.report_dialog.cancel_requested.connect(self.batch_task.cancel)
+            self.batch_task.taskCompleted.connect(self.on_batch_finished)
+            self.batch_task.taskTerminated.connect(self.on_batch_finished)
+
+            self.report_dialog.show()
+            QgsApplication.taskManager().addTask(self.batch_task)
+            self.update_polygon_area_display() # Disable the button while the task runs
         except Exception as e:
+            self.batch_task = None
             logging.error(f"An unexpected error occurred during batch georeferencing: {e}")
             logging.error(traceback.format_exc())
             QMessageBox.critical(self, "Georeferencing Error", f"An unexpected error occurred: {str(e)}")
+
+    def on_batch_finished(self):
+        """
+        Handle completion (or cancellation) of the background georeferencing task.
+        """
+        task = self.batch_task
+        self.batch_task = None
+        if task is None:
+            return
+
+        successful_outputs = task.successful
+        logging.info(f"Georeferencing finished. Success: {len(successful_outputs)}, Failed: {len(task.failed)}")
+        if task.exception is not None:
+            QMessageBox.critical(self, "Georeferencing Error", f"An unexpected error occurred: {str(task.exception)}")
+        if self.report_dialog is not None:
+            self.report_dialog.finish(canceled=task.isCanceled())
+
+        # --- ADD LAYER TO PROJECT --- 
+        # Check if the option is enabled
+        if self.checkBoxAddToProject.isChecked():
+            logging.info("Adding successful outputs to the project.")
+            added_count = 0
+            for output_path in successful_outputs:
+                try:
+                    layer_name = os.path.basename(output_path)
+                    # Use iface.addRasterLayer to add the layer
+                    rlayer = self.iface.addRasterLayer(output_path, layer_name)
+                    if rlayer and rlayer.isValid():
+                        logging.info(f"Successfully added layer: {layer_name}")
+                        added_count += 1
+                    else:
+                        logging.warning(f"Failed to add layer: {layer_name} from path: {output_path}")
+                except Exception as add_e:
+                    logging.error(f"Error adding layer {output_path} to project: {add_e}")
+            if added_count > 0:
+                 self.iface.messageBar().pushMessage("Success", f"{added_count} georeferenced image(s) added to the project.", level=1, duration=5) # Qgis.Success = 1
+        else:
+            logging.info("Option to add layers to project is disabled.")
+        # --- END ADD LAYER TO PROJECT ---
+
+        self.update_polygon_area_display() # Re-enable the button
        
     def closeEvent(self, event):
         """
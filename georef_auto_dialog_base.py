@@ -74,6 +74,65 @@ class Ui_GeorefAutoDialog(object):
         self.checkBoxAddToProject.setChecked(True)
         self.checkBoxAddToProject.setObjectName("checkBoxAddToProject")
         self.verticalLayout_5.addWidget(self.checkBoxAddToProject)
+        self.checkBoxResume = QtWidgets.QCheckBox(self.groupBoxOptions)
+        self.checkBoxResume.setChecked(True)
+        self.checkBoxResume.setObjectName("checkBoxResume")
+        self.verticalLayout_5.addWidget(self.checkBoxResume)
+        self.horizontalLayoutPreset = QtWidgets.QHBoxLayout()
+        self.horizontalLayoutPreset.setObjectName("horizontalLayoutPreset")
+        self.labelPreset = QtWidgets.QLabel(self.groupBoxOptions)
+        self.labelPreset.setObjectName("labelPreset")
+        self.horizontalLayoutPreset.addWidget(self.labelPreset)
+        self.comboPreset = QtWidgets.QComboBox(self.groupBoxOptions)
+        self.comboPreset.setObjectName("comboPreset")
+        self.horizontalLayoutPreset.addWidget(self.comboPreset)
+        self.verticalLayout_5.addLayout(self.horizontalLayoutPreset)
+        self.horizontalLayoutOutputMode = QtWidgets.QHBoxLayout()
+        self.horizontalLayoutOutputMode.setObjectName("horizontalLayoutOutputMode")
+        self.labelOutputMode = QtWidgets.QLabel(self.groupBoxOptions)
+        self.labelOutputMode.setObjectName("labelOutputMode")
+        self.horizontalLayoutOutputMode.addWidget(self.labelOutputMode)
+        self.comboOutputMode = QtWidgets.QComboBox(self.groupBoxOptions)
+        self.comboOutputMode.setObjectName("comboOutputMode")
+        self.horizontalLayoutOutputMode.addWidget(self.comboOutputMode)
+        self.verticalLayout_5.addLayout(self.horizontalLayoutOutputMode)
+        self.horizontalLayoutResolution = QtWidgets.QHBoxLayout()
+        self.horizontalLayoutResolution.setObjectName("horizontalLayoutResolution")
+        self.labelResolution = QtWidgets.QLabel(self.groupBoxOptions)
+        self.labelResolution.setObjectName("labelResolution")
+        self.horizontalLayoutResolution.addWidget(self.labelResolution)
+        self.spinBoxResolution = QtWidgets.QDoubleSpinBox(self.groupBoxOptions)
+        self.spinBoxResolution.setDecimals(6)
+        self.spinBoxResolution.setMaximum(100000.0)
+        self.spinBoxResolution.setObjectName("spinBoxResolution")
+        self.horizontalLayoutResolution.addWidget(self.spinBoxResolution)
+        self.verticalLayout_5.addLayout(self.horizontalLayoutResolution)
+        self.horizontalLayoutCompression = QtWidgets.QHBoxLayout()
+        self.horizontalLayoutCompression.setObjectName("horizontalLayoutCompression")
+        self.labelCompression = QtWidgets.QLabel(self.groupBoxOptions)
+        self.labelCompression.setObjectName("labelCompression")
+        self.horizontalLayoutCompression.addWidget(self.labelCompression)
+        self.comboCompression = QtWidgets.QComboBox(self.groupBoxOptions)
+        self.comboCompression.setObjectName("comboCompression")
+        self.horizontalLayoutCompression.addWidget(self.comboCompression)
+        self.verticalLayout_5.addLayout(self.horizontalLayoutCompression)
+        self.horizontalLayoutWorkers = QtWidgets.QHBoxLayout()
+        self.horizontalLayoutWorkers.setObjectName("horizontalLayoutWorkers")
+        self.labelWorkers = QtWidgets.QLabel(self.groupBoxOptions)
+        self.labelWorkers.setObjectName("labelWorkers")
+        self.horizontalLayoutWorkers.addWidget(self.labelWorkers)
+        self.spinBoxWorkers = QtWidgets.QSpinBox(self.groupBoxOptions)
+        self.spinBoxWorkers.setMinimum(1)
+        self.spinBoxWorkers.setMaximum(64)
+        self.spinBoxWorkers.setObjectName("spinBoxWorkers")
+        self.horizontalLayoutWorkers.addWidget(self.spinBoxWorkers)
+        self.checkBoxProcesses = QtWidgets.QCheckBox(self.groupBoxOptions)
+        self.checkBoxProcesses.setObjectName("checkBoxProcesses")
+        self.horizontalLayoutWorkers.addWidget(self.checkBoxProcesses)
+        self.verticalLayout_5.addLayout(self.horizontalLayoutWorkers)
+        self.btnClearCache = QtWidgets.QPushButton(self.groupBoxOptions)
+        self.btnClearCache.setObjectName("btnClearCache")
+        self.verticalLayout_5.addWidget(self.btnClearCache)
         self.verticalLayout.addWidget(self.groupBoxOptions)
         self.horizontalLayout_3 = QtWidgets.QHBoxLayout()
         self.horizontalLayout_3.setObjectName("horizontalLayout_3")
@@ -100,9 +159,26 @@ class Ui_GeorefAutoDialog(object):
         self.groupBoxPolygon.setTitle(_translate("GeorefAutoDialog", "Bounding Polygon"))
         self.btnDrawPolygon.setText(_translate("GeorefAutoDialog", "Draw Bounding Polygon"))
         self.labelPolygonStatus.setText(_translate("GeorefAutoDialog", "No polygon drawn"))
-        self.labelPolygonArea.setText(_translate("GeorefAutoDialog", "Area: 0.00 km² (max: 3,050 km²)"))
+        self.labelPolygonArea.setText(_translate("GeorefAutoDialog", "Area: 0.00 km² (max: 10,000 km²)"))
         self.labelPolygonArea.setStyleSheet(_translate("GeorefAutoDialog", "font-weight: bold;"))
         self.groupBoxOptions.setTitle(_translate("GeorefAutoDialog", "Options"))
         self.checkBoxAddToProject.setText(_translate("GeorefAutoDialog", "Add georeferenced images to project"))
+        self.checkBoxResume.setText(_translate("GeorefAutoDialog", "Skip images already georeferenced"))
+        self.checkBoxResume.setToolTip(_translate("GeorefAutoDialog", "Skip images the job manifest of the output folder records as already georeferenced with the same inputs and parameters; failed and canceled images are processed again"))
+        self.labelPreset.setText(_translate("GeorefAutoDialog", "Speed / accuracy:"))
+        self.comboPreset.setToolTip(_translate("GeorefAutoDialog", "Feature detector used to match images to the reference; Fast (ORB) runs several times faster and suits quick-look batches, Accurate (RootSIFT) is the most robust"))
+        self.labelOutputMode.setText(_translate("GeorefAutoDialog", "Output:"))
+        self.comboOutputMode.setToolTip(_translate("GeorefAutoDialog", "Warped GeoTIFF resamples each image onto the map grid; the VRT mode only writes a small VRT with ground control points next to the untouched original"))
+        self.labelResolution.setText(_translate("GeorefAutoDialog", "Output resolution:"))
+        self.spinBoxResolution.setSpecialValueText(_translate("GeorefAutoDialog", "Auto"))
+        self.spinBoxResolution.setToolTip(_translate("GeorefAutoDialog", "Output pixel size in reference CRS units; Auto keeps each image's native ground resolution"))
+        self.labelCompression.setText(_translate("GeorefAutoDialog", "Compression:"))
+        self.comboCompression.setToolTip(_translate("GeorefAutoDialog", "Compression of the warped Cloud-Optimized GeoTIFFs; JPEG and WEBP are lossy, DEFLATE and ZSTD are lossless"))
+        self.labelWorkers.setText(_translate("GeorefAutoDialog", "Parallel workers:"))
+        self.spinBoxWorkers.setToolTip(_translate("GeorefAutoDialog", "Number of images georeferenced in parallel"))
+        self.checkBoxProcesses.setText(_translate("GeorefAutoDialog", "Separate processes"))
+        self.checkBoxProcesses.setToolTip(_translate("GeorefAutoDialog", "Run each worker in its own process (no QGIS loaded); scales better on many cores"))
+        self.btnClearCache.setToolTip(_translate("GeorefAutoDialog", "Delete cached reference renders and features for the selected layer (or all layers if none is selected)"))
+        self.btnClearCache.setText(_translate("GeorefAutoDialog", "Clear Reference Cache"))
         self.btnGeoreference.setText(_translate("GeorefAutoDialog", "Execute Georeferencing"))
         self.btnCancel.setText(_translate("GeorefAutoDialog", "Cancel"))
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Headless command-line entry point for batch georeferencing.
+
+Runs the same pipeline as the plugin dialog without a desktop session.
+From the directory containing the plugin folder, with the QGIS Python
+environment active::
+
+    python -m georef_auto.georef_cli --images "/data/flight/*.tif" \\
+        --polygon aoi.gpkg --reference ortho.vrt --output-dir georef_out
+
+The same run is available through QGIS Processing::
+
+    qgis_process run georef_auto:batch_georeference -- \\
+        INPUT_IMAGES="/data/flight/*.tif" POLYGON=aoi.gpkg \\
+        REFERENCE=ortho.vrt OUTPUT_FOLDER=georef_out
+
+With ``--output-mode vrt`` each image only gets a small VRT with ground
+control points next to the untouched original. Those VRTs can be turned
+into warped GeoTIFFs later, without QGIS::
+
+    python -m georef_auto.georef_cli --materialize --images "georef_out/*.vrt" \\
+        --output-dir georef_tif
+
+``--stats report.csv`` (or ``.json``) saves, per image, the time of each
+stage, the peak and growth of the process memory, the keypoint, match and
+inlier counts and the output size, for tracking performance across runs.
+
+Every run records its results in ``georef_manifest.json`` in the output
+directory. Running the same command again after a crash or cancellation
+skips the images already done with the same inputs, parameters and
+reference, and retries the failures; ``--no-resume`` processes them all.
+
+Exit status: 0 if every image succeeded, 1 if some failed, 2 on invalid inputs.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+
+def parse_args(argv=None):
+    from .georef_core import PRECHECK_MIN_INLIERS, PRECHECK_MIN_RATIO
+
+    parser = argparse.ArgumentParser(
+        prog="georef_cli",
+        description="Automatic georeferencing of aerial images (RootSIFT, FLANN, RANSAC).",
+    )
+    parser.add_argument("--images", required=True, nargs="+",
+                        help="Input images: paths, glob patterns, directories or .txt/.lst files listing one path per line")
+    parser.add_argument("--polygon",
+                        help="Bounding polygon file (GeoJSON, GPKG, Shapefile...); all features are merged")
+    parser.add_argument("--reference", help="Reference raster or VRT")
+    parser.add_argument("--output-dir", required=True, help="Directory for the <image>_georef.tif outputs")
+    parser.add_argument("--output-mode", choices=["warp", "vrt"], default="warp",
+                        help="warp: resampled GeoTIFF (default); vrt: untouched original plus a VRT with GCPs")
+    parser.add_argument("--resolution", type=float, default=None,
+                        help="Output pixel size in reference CRS units (default: each image's native ground resolution)")
+    parser.add_argument("--preset", choices=["accurate", "balanced", "fast"], default="accurate",
+                        help="Speed/accuracy preset: accurate (RootSIFT, default), balanced (AKAZE) or fast (ORB)")
+    parser.add_argument("--nfeatures", type=int, default=None,
+                        help="Maximum features per image or reference tile (default: the preset's; 0 = unlimited)")
+    parser.add_argument("--descriptor-storage", choices=["float32", "float16", "uint8"], default="float32",
+                        help="Storage of reference RootSIFT descriptors in memory, cache and worker processes")
+    parser.add_argument("--flann-trees", type=int, default=None,
+                        help="FLANN KD-trees, or LSH hash tables for binary presets (default: the preset's)")
+    parser.add_argument("--flann-checks", type=int, default=None,
+                        help="Leaves visited per FLANN KD-tree search; more is slower and more exact (default: the preset's)")
+    parser.add_argument("--estimator", choices=["ransac", "lo-ransac", "magsac", "usac-accurate"], default="magsac",
+                        help="Robust homography estimator (default: magsac, i.e. MAGSAC++)")
+    parser.add_argument("--confidence", type=float, default=0.995,
+                        help="Confidence at which the estimator stops early (default: 0.995)")
+    parser.add_argument("--max-iterations", type=int, default=2000,
+                        help="Iteration cap of the estimator (default: 2000)")
+    parser.add_argument("--no-precheck", dest="precheck", action="store_false",
+                        help="Skip the similarity pre-fit that rejects hopeless images before the homography")
+    parser.add_argument("--precheck-min-inliers", type=int, default=PRECHECK_MIN_INLIERS, metavar="N",
+                        help="Matches the similarity pre-fit must explain for an image to be kept "
+                             f"(default: {PRECHECK_MIN_INLIERS})")
+    parser.add_argument("--precheck-min-ratio", type=float, default=PRECHECK_MIN_RATIO, metavar="R",
+                        help="Share of the matches that keeps an image with fewer consistent matches, "
+                             f"as low-texture frames have (default: {PRECHECK_MIN_RATIO})")
+    parser.add_argument("--compression", choices=["JPEG", "WEBP", "DEFLATE", "ZSTD"], default="JPEG",
+                        help="Compression of warped GeoTIFFs (default: JPEG)")
+    parser.add_argument("--quality", type=int, default=85, help="JPEG/WEBP quality, 1-100 (default: 85)")
+    parser.add_argument("--no-cog", dest="cog", action="store_false",
+                        help="Write plain tiled GeoTIFFs instead of Cloud-Optimized GeoTIFFs with overviews")
+    parser.add_argument("--warp-memory", type=float, default=None, metavar="MB",
+                        help="Memory budget of each output chunk warped and written at a time; frames read ahead "
+                             "are decoded whole up to twice this size (default: 256 MB)")
+    parser.add_argument("--materialize", action="store_true",
+                        help="Turn VRTs written with --output-mode vrt (given as --images) into warped GeoTIFFs")
+    parser.add_argument("--workers", type=int, default=None, help="Images processed in parallel")
+    parser.add_argument("--processes", action="store_true",
+                        help="Run the workers as separate processes instead of threads")
+    parser.add_argument("--prefetch", type=int, default=2, metavar="N",
+                        help="Frames read ahead of the thread workers while a writer thread encodes the outputs; "
+                             "0 makes each worker read, compute and write in turn (default: 2)")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="Process every image again, even those the output directory's job manifest records as done")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="Save per-image stage timings, memory and counts to FILE (.csv or .json)")
+    parser.add_argument("--quiet", action="store_true", help="Only log warnings and errors")
+    args = parser.parse_args(argv)
+    if not args.materialize and not (args.polygon and args.reference):
+        parser.error("--polygon and --reference are required unless --materialize is given")
+    return args
+
+
+def materialize(args) -> int:
+    """Warp the VRTs of a fast (--output-mode vrt) run into GeoTIFFs. Needs no QGIS."""
+    from .georef_core import GeorefOptions, default_output_path, expand_image_inputs, materialize_vrt
+
+    vrt_paths = expand_image_inputs(args.images)
+    if not vrt_paths:
+        logging.error("No input VRTs found.")
+        return 2
+    os.makedirs(args.output_dir, exist_ok=True)
+    options = GeorefOptions(output_resolution=args.resolution, warp_memory_mb=args.warp_memory,
+                            compression=args.compression, quality=args.quality, cog=args.cog)
+    failed = 0
+    for vrt_path in vrt_paths:
+        # <image>_georef.vrt -> <image>_georef.tif
+        output_path = os.path.join(args.output_dir, os.path.splitext(os.path.basename(vrt_path))[0] + ".tif")
+        try:
+            materialize_vrt(vrt_path, output_path, options=options)
+            print(f"OK     {vrt_path}: {output_path}", flush=True)
+        except Exception as e:
+            failed += 1
+            print(f"FAILED {vrt_path}: {e}", flush=True)
+    print(f"Finished: {len(vrt_paths) - failed} succeeded, {failed} failed.", flush=True)
+    return 0 if not failed else 1
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING if args.quiet else logging.INFO)
+    if args.materialize:
+        return materialize(args)
+
+    # No display needed: render with Qt's offscreen platform unless told otherwise
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    from qgis.core import QgsApplication, QgsRasterLayer, QgsVectorLayer, QgsProject
+    from .georeferencing import (
+        batch_georeference, default_output_path, expand_image_inputs, polygon_from_features,
+        get_area_in_square_km, MAX_POLYGON_AREA, DEFAULT_MAX_WORKERS, GeorefOptions, report_row, write_report
+    )
+
+    app = QgsApplication([], False)
+    app.initQgis()
+    try:
+        image_paths = expand_image_inputs(args.images)
+        if not image_paths:
+            logging.error("No input images found.")
+            return 2
+
+        reference_layer = QgsRasterLayer(args.reference, os.path.basename(args.reference), "gdal")
+        if not reference_layer.isValid():
+            logging.error(f"Invalid reference raster: {args.reference}")
+            return 2
+
+        polygon_layer = QgsVectorLayer(args.polygon, "polygon", "ogr")
+        if not polygon_layer.isValid():
+            logging.error(f"Invalid polygon file: {args.polygon}")
+            return 2
+        try:
+            polygon_geom = polygon_from_features(
+                polygon_layer.getFeatures(), polygon_layer.crs(), reference_layer.crs(),
+                QgsProject.instance().transformContext())
+        except ValueError as e:
+            logging.error(str(e))
+            return 2
+
+        area_km2 = get_area_in_square_km(polygon_geom, reference_layer.crs().authid())
+        if area_km2 > MAX_POLYGON_AREA:
+            logging.error(f"Polygon area ({area_km2:.2f} km²) exceeds the maximum allowed ({MAX_POLYGON_AREA:,.0f} km²).")
+            return 2
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        options = GeorefOptions(output_mode=args.output_mode, output_resolution=args.resolution,
+                                warp_memory_mb=args.warp_memory, compression=args.compression,
+                                quality=args.quality, cog=args.cog, feature_preset=args.preset,
+                                nfeatures=args.nfeatures, descriptor_storage=args.descriptor_storage,
+                                flann_trees=args.flann_trees, flann_checks=args.flann_checks,
+                                estimator=args.estimator, confidence=args.confidence,
+                                max_iterations=args.max_iterations, precheck=args.precheck,
+                                precheck_min_inliers=args.precheck_min_inliers,
+                                precheck_min_ratio=args.precheck_min_ratio,
+                                prefetch_frames=args.prefetch)
+        output_paths = [default_output_path(p, args.output_dir, options.output_extension) for p in image_paths]
+
+        stats_rows = []
+
+        def report_result(image_path, success, message, output_path, stats):
+            status = "OK    " if success else "FAILED"
+            print(f"{status} {image_path}: {output_path if success else message}", flush=True)
+            stats_rows.append(report_row(image_path, success, message, output_path, stats))
+
+        successful, failed = batch_georeference(
+            image_paths,
+            polygon_geom,
+            reference_layer,
+            output_paths=output_paths,
+            max_workers=args.workers or DEFAULT_MAX_WORKERS,
+            result_callback=report_result,
+            use_processes=args.processes,
+            options=options,
+            resume=args.resume,
+        )
+        print(f"Finished: {len(successful)} succeeded, {len(failed)} failed.", flush=True)
+        if args.stats:
+            write_report(stats_rows, args.stats)
+            print(f"Stage statistics saved to {args.stats}", flush=True)
+        return 0 if not failed else 1
+    finally:
+        app.exitQgis()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1310 @@
+# -*- coding: utf-8 -*-
+"""Georeferencing core with no QGIS or Qt dependency.
+
+Everything here works on NumPy arrays, file paths, bounds tuples and CRS
+strings, so it runs in plain worker processes (or on other machines)
+without initializing QGIS: a spawned worker only imports NumPy, OpenCV and
+rasterio. Rendering reference layers, QGIS geometries and the user
+interface stay in thin adapters (georeferencing.py and the dialogs).
+"""
+
+import glob
+import logging
+import math
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+import traceback
+import warnings
+import xml.etree.ElementTree as ET
+from concurrent.futures import (
+    Future, ThreadPoolExecutor, ProcessPoolExecutor, CancelledError, FIRST_COMPLETED, wait
+)
+from functools import partial, wraps
+from queue import Empty
+from typing import Callable, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+import rasterio
+import rasterio.shutil
+import rasterio.transform
+from rasterio.errors import NotGeoreferencedWarning
+from rasterio.windows import Window
+
+from .batch_pipeline import Prefetcher, WriteBehind, chain, completed, flatten, run_now
+from .feature_backends import (
+    DESCRIPTOR_STORAGES, PRESET_ACCURATE, PRESETS, FeatureBackend, RootSiftFeatures, feature_backend
+)
+from .input_image import ArrayImage, InputImage, open_input_image
+from .job_manifest import STATUS_CANCELED, STATUS_FAILED, STATUS_OK, JobManifest
+from .reference_cache import ReferenceCache, TileCacheKey
+from .reference_pyramid import (
+    Bounds, CacheKeyFn, ReferenceContext, ReferenceLevel, RenderTileFn, build_pyramid_levels
+)
+from .reference_raster import CACHE_VERSION as RASTER_CACHE_VERSION, open_reference_raster
+from .stage_metrics import current, recording, sample_memory, stage
+
+MIN_FEATURES = 4 # Minimum matches for homography
+RENDER_WIDTH_PX = 2000 # Width of the coarsest (overview) level of the reference pyramid
+COARSE_QUERY_PX = 1024 # Longest side of the input image in the coarse (localization) stage
+FINE_QUERY_MAX_PX = 4096 # Longest side of the input image in the fine (refinement) stage
+FOOTPRINT_MARGIN = 0.25 # Fraction of the predicted footprint added around it in the fine stage
+LOWE_RATIO = 0.75 # Nearest neighbour must be this much closer than the second one
+RETRIEVAL_TOP_K = 4 # Reference tiles shortlisted per image when a level is searched without a predicted footprint
+RETRIEVAL_MAX_TILES = 256 # Largest level searched through the shortlist when the overview is too coarse for an image
+COARSE_MIN_INLIERS = 15 # With fewer inliers on the overview, the shortlist search of a finer level is tried too
+REPROJECTION_THRESHOLD_PX = 5.0 # Inlier tolerance of the homography estimators
+ESTIMATORS = { # Robust homography estimators: OpenCV method and display name
+    "ransac": (cv2.RANSAC, "RANSAC"),
+    "lo-ransac": (cv2.USAC_DEFAULT, "LO-RANSAC"),
+    "magsac": (cv2.USAC_MAGSAC, "MAGSAC++"),
+    "usac-accurate": (cv2.USAC_ACCURATE, "GC-RANSAC"),
+}
+DEFAULT_CONFIDENCE = 0.995 # Estimators stop once they are this sure no better model is left
+DEFAULT_MAX_ITERATIONS = 2000
+PRECHECK_THRESHOLD_PX = 15.0 # Tolerance of the similarity pre-fit: loose, it only weeds out hopeless images
+PRECHECK_MAX_ITERATIONS = 500 # 2-point samples: enough even at a few % inliers
+PRECHECK_MIN_INLIERS = 10 # Random matches reach 4-7 consistent ones: this many are kept whatever their share
+PRECHECK_MIN_RATIO = 0.3 # Fewer (down to MIN_FEATURES) are kept if they are this share of the matches (low texture)
+DEFAULT_MAX_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1)) # Images processed in parallel
+CANCELED_MESSAGE = "Cancelado pelo usuário."
+SKIPPED_MESSAGE = "Já georreferenciada com os mesmos parâmetros (manifesto do lote)."
+IMAGE_EXTENSIONS = (".tif", ".tiff", ".jpg", ".jpeg", ".png")
+IMAGE_LIST_EXTENSIONS = (".txt", ".lst")
+OUTPUT_MODE_WARP = "warp" # Warped and resampled GeoTIFF
+OUTPUT_MODE_VRT = "vrt" # Original image, untouched, referenced by a VRT with GCPs derived from H
+OUTPUT_EXTENSIONS = {OUTPUT_MODE_WARP: ".tif", OUTPUT_MODE_VRT: ".vrt"}
+GCP_GRID_SIZE = 5 # GCPs per side of the grid written in VRT output mode
+VRT_METADATA_DOMAIN = "GEOREF_AUTO"
+_GDAL_DATA_TYPES = {"uint8": "Byte", "int8": "Int8", "uint16": "UInt16", "int16": "Int16",
+                    "uint32": "UInt32", "int32": "Int32", "float32": "Float32", "float64": "Float64"}
+OUTPUT_BLOCK_PX = 512 # Internal tile size of warped GeoTIFFs and unit of the block-streamed warp
+DEFAULT_WARP_MEMORY_MB = 256 # Memory budget of the output chunk warped and written at a time
+OUTPUT_COMPRESSIONS = ("JPEG", "WEBP", "DEFLATE", "ZSTD") # Lossy first, then lossless
+DEFAULT_OUTPUT_QUALITY = 85 # JPEG/WEBP quality of warped GeoTIFFs (75-95 is a good range)
+_POLL_INTERVAL_S = 0.2 # How often the batch loop checks for cancellation and worker progress
+DEFAULT_PREFETCH_FRAMES = 2 # Frames the batch reader stage loads ahead of the workers
+PREFETCH_FRAME_BUDGETS = 2 # Frames up to this many warp memory budgets are decoded whole by the reader; larger ones by windows
+WRITE_BEHIND_CHUNKS = 2 # Warped chunks per worker waiting for the writer stage
+
+ProgressFn = Callable[[float, str], None]
+ImageSource = Union[np.ndarray, InputImage, ArrayImage] # Array (OpenCV BGR or gray) or image read on demand
+
+
+class GeorefOptions:
+    """Output options shared by every image of a batch (picklable, for worker processes)."""
+
+    def __init__(self, output_mode: str = OUTPUT_MODE_WARP, output_resolution: Optional[float] = None,
+                 warp_memory_mb: Optional[float] = None, compression: str = "JPEG",
+                 quality: int = DEFAULT_OUTPUT_QUALITY, cog: bool = True,
+                 feature_preset: str = PRESET_ACCURATE, nfeatures: Optional[int] = None,
+                 descriptor_storage: str = "float32", flann_trees: Optional[int] = None,
+                 flann_checks: Optional[int] = None, estimator: str = "magsac",
+                 confidence: float = DEFAULT_CONFIDENCE, max_iterations: int = DEFAULT_MAX_ITERATIONS,
+                 precheck: bool = True, precheck_min_inliers: int = PRECHECK_MIN_INLIERS,
+                 precheck_min_ratio: float = PRECHECK_MIN_RATIO,
+                 prefetch_frames: int = DEFAULT_PREFETCH_FRAMES):
+        """Constructor.
+
+        Args:
+            output_mode: OUTPUT_MODE_WARP or OUTPUT_MODE_VRT
+            output_resolution: Output pixel size in reference CRS units; None (or 0)
+                derives it from each image's ground sample distance
+            warp_memory_mb: Memory budget, in MB, of the output chunk warped and
+                written at a time, whatever the output size; None (or 0) uses
+                DEFAULT_WARP_MEMORY_MB. The batch reader stage also decodes
+                frames whole only up to PREFETCH_FRAME_BUDGETS times this size
+            compression: Compression of warped GeoTIFFs, one of OUTPUT_COMPRESSIONS
+            quality: JPEG/WEBP quality (1-100)
+            cog: Write warped GeoTIFFs as Cloud-Optimized GeoTIFFs with internal
+                overviews; False writes a plain tiled GeoTIFF
+            feature_preset: Speed/accuracy preset of the feature backend, one of
+                feature_backends.PRESETS (RootSIFT, AKAZE or ORB)
+            nfeatures: Maximum features per image or reference tile; None uses the
+                preset's default, 0 keeps them all
+            descriptor_storage: Storage of reference RootSIFT descriptors in memory,
+                the disk cache and worker processes: "float32", "float16" (half
+                the size) or "uint8" (a quarter); matching always uses float32
+            flann_trees: FLANN KD-trees (LSH hash tables for binary presets); None
+                uses the preset's default
+            flann_checks: Leaves visited per FLANN KD-tree search; None uses the
+                preset's default
+            estimator: Robust homography estimator, one of ESTIMATORS
+            confidence: Confidence at which the estimator stops early (0-1)
+            max_iterations: Iteration cap of the estimator
+            precheck: Reject images whose matches no similarity transform
+                explains before running the full estimator
+            precheck_min_inliers: Matches the similarity pre-fit must explain for
+                the image to go on to the estimator, whatever their share
+            precheck_min_ratio: Share of the matches (0-1) that lets an image with
+                fewer consistent matches, down to MIN_FEATURES, go on anyway:
+                low-texture frames have few matches but most of them agree,
+                frames from elsewhere have a few random agreements among many
+            prefetch_frames: Frames loaded ahead of the workers by the reader
+                stage of a thread batch, whose outputs are encoded by a writer
+                thread; 0 makes each worker read, compute and write in turn
+        """
+        if output_mode not in OUTPUT_EXTENSIONS:
+            raise ValueError(f"Modo de saída desconhecido: {output_mode}")
+        if output_resolution is not None and output_resolution < 0:
+            raise ValueError(f"Resolução de saída inválida: {output_resolution}")
+        if warp_memory_mb is not None and warp_memory_mb < 0:
+            raise ValueError(f"Orçamento de memória inválido: {warp_memory_mb}")
+        if compression not in OUTPUT_COMPRESSIONS:
+            raise ValueError(f"Compressão desconhecida: {compression}")
+        if not 1 <= quality <= 100:
+            raise ValueError(f"Qualidade inválida: {quality}")
+        if feature_preset not in PRESETS:
+            raise ValueError(f"Preset de características desconhecido: {feature_preset}")
+        if nfeatures is not None and nfeatures < 0:
+            raise ValueError(f"Número de características inválido: {nfeatures}")
+        if descriptor_storage not in DESCRIPTOR_STORAGES:
+            raise ValueError(f"Armazenamento de descritores desconhecido: {descriptor_storage}")
+        if flann_trees is not None and flann_trees < 1:
+            raise ValueError(f"Número de árvores FLANN inválido: {flann_trees}")
+        if flann_checks is not None and flann_checks < 1:
+            raise ValueError(f"Número de verificações FLANN inválido: {flann_checks}")
+        if estimator not in ESTIMATORS:
+            raise ValueError(f"Estimador desconhecido: {estimator}")
+        if not 0 < confidence < 1:
+            raise ValueError(f"Confiança inválida: {confidence}")
+        if max_iterations < 1:
+            raise ValueError(f"Número máximo de iterações inválido: {max_iterations}")
+        if precheck_min_inliers < MIN_FEATURES:
+            raise ValueError(f"Mínimo de inliers da pré-verificação inválido: {precheck_min_inliers}")
+        if not 0 <= precheck_min_ratio <= 1:
+            raise ValueError(f"Proporção mínima de inliers da pré-verificação inválida: {precheck_min_ratio}")
+        if prefetch_frames < 0:
+            raise ValueError(f"Número de imagens pré-carregadas inválido: {prefetch_frames}")
+        self.output_mode = output_mode
+        self.output_resolution = output_resolution or None
+        self.warp_memory_mb = warp_memory_mb or DEFAULT_WARP_MEMORY_MB
+        self.compression = compression
+        self.quality = int(quality)
+        self.cog = cog
+        self.feature_preset = feature_preset
+        self.nfeatures = nfeatures
+        self.descriptor_storage = descriptor_storage
+        self.flann_trees = flann_trees
+        self.flann_checks = flann_checks
+        self.estimator = estimator
+        self.confidence = float(confidence)
+        self.max_iterations = int(max_iterations)
+        self.precheck = precheck
+        self.precheck_min_inliers = int(precheck_min_inliers)
+        self.precheck_min_ratio = float(precheck_min_ratio)
+        self.prefetch_frames = int(prefetch_frames)
+
+    @property
+    def output_extension(self) -> str:
+        return OUTPUT_EXTENSIONS[self.output_mode]
+
+    def feature_backend(self) -> FeatureBackend:
+        """Feature backend used to build the reference context (and then to match)."""
+        return feature_backend(self.feature_preset, self.nfeatures, self.descriptor_storage,
+                               self.flann_trees, self.flann_checks)
+
+
+# --- Entradas e saídas ---
+
+def expand_image_inputs(spec) -> List[str]:
+    """Resolve entradas de imagens para execuções sem interface.
+
+    Aceita padrões glob, diretórios, listas separadas por ';' (ou uma lista
+    Python) e arquivos .txt/.lst com um caminho por linha (relativos ao
+    arquivo; linhas vazias e iniciadas por '#' são ignoradas).
+    """
+    items = spec if isinstance(spec, (list, tuple)) else str(spec).split(";")
+    paths = []
+    for item in items:
+        item = item.strip()
+        if not item:
+            continue
+        if any(c in item for c in "*?["):
+            paths.extend(sorted(glob.glob(item, recursive=True)))
+        elif os.path.isdir(item):
+            paths.extend(sorted(os.path.join(item, f) for f in os.listdir(item)
+                                if f.lower().endswith(IMAGE_EXTENSIONS)))
+        elif item.lower().endswith(IMAGE_LIST_EXTENSIONS):
+            base_dir = os.path.dirname(os.path.abspath(item))
+            with open(item, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+        else:
+            paths.append(item)
+    # Remove duplicatas preservando a ordem
+    return list(dict.fromkeys(paths))
+
+def default_output_path(image_path: str, output_dir: str, extension: str = ".tif") -> str:
+    """Caminho de saída padrão: `<nome>_georef.tif` (ou outra `extension`) em `output_dir`."""
+    output_filename = f"{os.path.splitext(os.path.basename(image_path))[0]}_georef{extension}"
+    return os.path.join(output_dir, output_filename)
+
+# --- Características e referência ---
+
+_ROOT_SIFT = RootSiftFeatures()
+
+def root_sift_detect_and_compute(image_gray):
+    """Detect SIFT features and compute RootSIFT descriptors."""
+    return _ROOT_SIFT(image_gray)
+
+def build_reference_context(bounds: Bounds, crs: str, render_tile: RenderTileFn,
+                            native_pixel_size: Optional[float] = None,
+                            target_width_px: int = RENDER_WIDTH_PX,
+                            cache: Optional[ReferenceCache] = None,
+                            cache_key: Optional[CacheKeyFn] = None,
+                            features: Optional[FeatureBackend] = None) -> ReferenceContext:
+    """Monta a pirâmide de referência em tiles e caracteriza o nível de visão geral.
+
+    `bounds` (xmin, ymin, xmax, ymax) e `native_pixel_size` estão nas
+    unidades de `crs`; `render_tile(bounds, largura, altura)` devolve o tile
+    em tons de cinza. Os níveis mais finos são caracterizados sob demanda.
+    `features` (RootSIFT por padrão) é usado na referência e nas consultas;
+    `cache_key` deve distinguir backends (veja FeatureBackend.cache_tag).
+    """
+    xmin, ymin, xmax, ymax = bounds
+    if not xmax > xmin or not ymax > ymin:
+        raise ValueError("Extensão (bounding box) do polígono inválida ou com dimensão zero.")
+
+    levels = build_pyramid_levels(bounds, target_width_px, native_pixel_size)
+    context = ReferenceContext(
+        tuple(bounds), crs, levels,
+        render_tile=render_tile,
+        detect=features or RootSiftFeatures(),
+        cache=cache, cache_key=cache_key,
+    )
+
+    # Caracteriza a visão geral já na construção, para falhar cedo se a referência for inutilizável
+    n_features = context.feature_count(0)
+    if n_features < MIN_FEATURES:
+        raise ValueError(f"Não foi possível extrair descritores suficientes com {context.detect.name} "
+                         f"na imagem de referência.")
+
+    logging.info(f"Pirâmide de referência: {len(levels)} níveis, "
+                 f"{levels[0].pixel_size:.3f} a {levels[-1].pixel_size:.3f} unidades/pixel, "
+                 f"{n_features} keypoints {context.detect.name} na visão geral, CRS {crs[:40]}.")
+    return context
+
+def build_raster_reference_context(raster_path: str, bounds: Bounds,
+                                   target_width_px: int = RENDER_WIDTH_PX,
+                                   cache: Optional[ReferenceCache] = None,
+                                   features: Optional[FeatureBackend] = None) -> ReferenceContext:
+    """Contexto de referência lido diretamente de um raster (GeoTIFF, VRT...) em `bounds`.
+
+    `bounds` está no CRS do raster; os tiles são lidos com rasterio, sem QGIS.
+    """
+    reader = open_reference_raster(raster_path)
+    if reader is None:
+        raise ValueError(f"Não foi possível ler a referência diretamente: {raster_path}")
+    features = features or RootSiftFeatures()
+    cache_key = None
+    if cache is not None:
+        cache_key = TileCacheKey(raster_path, reader.crs, f"{RASTER_CACHE_VERSION}|{features.cache_tag}")
+    return build_reference_context(bounds, reader.crs, reader, reader.pixel_size, target_width_px,
+                                   cache, cache_key, features)
+
+def portable_reference_context(reference_context: ReferenceContext) -> ReferenceContext:
+    """The context itself if it can be pickled, otherwise a detached copy of it."""
+    try:
+        pickle.dumps((reference_context.render_tile, reference_context.cache_key))
+        return reference_context
+    except Exception:
+        logging.info("Renderizador da referência não serializável; caracterizando níveis para os processos.")
+        return reference_context.detached()
+
+# --- Correspondência ---
+
+def scale_matrix(scale: float) -> np.ndarray:
+    """Homografia de escala uniforme (3x3)."""
+    return np.diag([scale, scale, 1.0])
+
+def ransac_iterations(inliers: int, matches: int, confidence: float, max_iterations: int,
+                      sample_size: int = 4) -> int:
+    """Iterações até a parada adaptativa de um estimador, dada a fração final de inliers.
+
+    O OpenCV não informa as iterações executadas; este é o critério de
+    parada que ele aplica, avaliado com a fração de inliers encontrada.
+    """
+    if matches <= 0 or inliers <= 0:
+        return max_iterations
+    p_clean = (inliers / matches) ** sample_size # Probabilidade de uma amostra só de inliers
+    if p_clean >= 1:
+        return 1
+    denominator = math.log1p(-p_clean)
+    if denominator == 0:
+        return max_iterations
+    return int(min(max_iterations, max(1, math.ceil(math.log(1 - confidence) / denominator))))
+
+def match_and_estimate(query_gray: np.ndarray, reference_context: ReferenceContext,
+                       level_index: int, tile_ids=None, top_k: Optional[int] = None,
+                       options: Optional[GeorefOptions] = None,
+                       stats: Optional[dict] = None) -> Tuple[np.ndarray, int, int]:
+    """Características + FLANN + estimador robusto da consulta contra tiles de um nível da pirâmide.
+
+    A consulta é caracterizada com o mesmo backend da referência. Sem
+    `tile_ids`, com `top_k` a busca se limita aos `top_k` tiles do nível
+    pré-selecionados por palavras visuais; sem nenhum dos dois, usa o nível inteiro.
+    O estimador, sua confiança, seu limite de iterações e a pré-verificação
+    por semelhança vêm de `options`. Se dado, `stats` acumula o estimador, os
+    matches e inliers da última estimativa, as iterações, o tempo de estimação
+    e os pontos-chave da consulta e da referência comparados.
+
+    Retorna a homografia (pixels da consulta -> pixels do nível), o número de
+    matches bons e o número de inliers.
+    """
+    options = options or GeorefOptions()
+    with stage("detect"):
+        kp1, desc1 = reference_context.detect(query_gray)
+    if stats is not None:
+        stats["keypoints"] = stats.get("keypoints", 0) + len(kp1)
+    if desc1 is None or len(kp1) < MIN_FEATURES:
+        detector_name = getattr(reference_context.detect, "name", "o detector da referência")
+        raise ValueError(f"Não foi possível extrair descritores suficientes com {detector_name} na imagem de entrada.")
+
+    # Tiles renderizados e caracterizados no caminho contam nas próprias etapas
+    with stage("match"):
+        if tile_ids is None and top_k:
+            tile_ids = reference_context.candidate_tiles(desc1, level_index, top_k)
+            if len(tile_ids) < reference_context.levels[level_index].n_tiles:
+                logging.info(f"Pré-seleção (nível {level_index}): tiles {tile_ids}.")
+
+        distances, indices, ref_points = reference_context.knn_match(desc1, level_index, tile_ids, k=2)
+
+        # Filtro de razão de Lowe, vetorizado; consultas com menos de dois vizinhos não podem ser testadas
+        if distances.shape[1] < 2:
+            good = np.zeros(len(distances), dtype=bool)
+        else:
+            good = (distances[:, 0] < LOWE_RATIO * distances[:, 1]) & (indices[:, 1] >= 0)
+        num_good = int(np.count_nonzero(good))
+    if stats is not None:
+        stats["reference_keypoints"] = stats.get("reference_keypoints", 0) + len(ref_points)
+
+    logging.info(f"FLANN (nível {level_index}): {len(distances)} matches brutos, {num_good} matches bons após filtro de razão.")
+
+    if num_good < MIN_FEATURES:
+        raise ValueError(f"Poucos matches válidos ({num_good}) encontrados para estimar homografia (mínimo: {MIN_FEATURES}).")
+
+    pts1 = cv2.KeyPoint_convert(kp1)[good].reshape(-1, 1, 2)
+    pts2 = ref_points[indices[good, 0]].reshape(-1, 1, 2)
+
+    started = time.perf_counter()
+    method, estimator_name = ESTIMATORS[options.estimator]
+    iterations = 0
+    try:
+        if options.precheck:
+            # Semelhança (amostras de 2 pontos, poucas iterações): se nem ela explica
+            # os matches, a homografia também não vai explicar; descarta cedo
+            _, precheck_mask = cv2.estimateAffinePartial2D(
+                pts1, pts2, method=cv2.RANSAC, ransacReprojThreshold=PRECHECK_THRESHOLD_PX,
+                maxIters=PRECHECK_MAX_ITERATIONS, confidence=options.confidence)
+            precheck_inliers = int(np.sum(precheck_mask)) if precheck_mask is not None else 0
+            iterations += ransac_iterations(precheck_inliers, num_good, options.confidence,
+                                            PRECHECK_MAX_ITERATIONS, sample_size=2)
+            if precheck_inliers < options.precheck_min_inliers and (
+                    precheck_inliers < MIN_FEATURES or precheck_inliers < options.precheck_min_ratio * num_good):
+                raise ValueError(f"Pré-verificação: apenas {precheck_inliers} de {num_good} matches consistentes "
+                                 f"com uma semelhança (mínimo: {options.precheck_min_inliers}, ou "
+                                 f"{options.precheck_min_ratio:.0%} dos matches).")
+
+        H, mask = cv2.findHomography(pts1, pts2, method, REPROJECTION_THRESHOLD_PX,
+                                     maxIters=options.max_iterations, confidence=options.confidence)
+        if H is None:
+            iterations += options.max_iterations
+            raise ValueError(f"Homografia não pôde ser estimada com {estimator_name}.")
+        inliers = int(np.sum(mask))
+        iterations += ransac_iterations(inliers, num_good, options.confidence, options.max_iterations)
+    finally:
+        elapsed = time.perf_counter() - started
+        if stats is not None:
+            stats["estimator"] = estimator_name
+            stats["iterations"] = stats.get("iterations", 0) + iterations
+            stats["estimation_s"] = stats.get("estimation_s", 0.0) + elapsed
+
+    logging.info(f"Homografia estimada com {estimator_name}: {inliers} inliers de {num_good} matches, "
+                 f"~{iterations} iterações, {elapsed * 1000:.1f} ms.")
+    if inliers < MIN_FEATURES:
+         raise ValueError(f"Poucos inliers ({inliers}) após {estimator_name} para homografia (mínimo: {MIN_FEATURES}).")
+    return H, num_good, inliers
+
+def estimate_ground_sample_distance(H: np.ndarray, image_shape, pixel_size: float) -> float:
+    """GSD (unidades do CRS por pixel da imagem) no centro da imagem, dado H (imagem -> nível)."""
+    h, w = image_shape[:2]
+    cx, cy = w / 2.0, h / 2.0
+    pts = np.float32([[cx, cy], [cx + 1, cy], [cx, cy + 1]]).reshape(-1, 1, 2)
+    p = cv2.perspectiveTransform(pts, H).reshape(-1, 2)
+    # Raiz do determinante do jacobiano local = escala média
+    jac = np.array([p[1] - p[0], p[2] - p[0]])
+    return float(np.sqrt(abs(np.linalg.det(jac)))) * pixel_size
+
+def select_fine_level(reference_context: ReferenceContext, image_shape, gsd: float) -> Tuple[int, float]:
+    """Escolhe o nível mais fino útil para a imagem e a escala de redução da consulta.
+
+    Não vale renderizar a referência mais fina que a própria imagem, nem usar
+    uma consulta maior que FINE_QUERY_MAX_PX.
+    """
+    longest = max(image_shape[:2])
+    for level in reversed(reference_context.levels):
+        if level.pixel_size < gsd * 0.75:
+            continue  # Referência mais fina que a imagem: só custo, sem ganho
+        scale = min(1.0, gsd / level.pixel_size)
+        if longest * scale <= FINE_QUERY_MAX_PX:
+            return level.index, scale
+    return 0, min(1.0, gsd / reference_context.levels[0].pixel_size, FINE_QUERY_MAX_PX / longest)
+
+def retrieval_level(reference_context: ReferenceContext) -> Optional[int]:
+    """Nível mais fino, além da visão geral, com até RETRIEVAL_MAX_TILES tiles (None se não houver)."""
+    candidates = [level.index for level in reference_context.levels[1:] if level.n_tiles <= RETRIEVAL_MAX_TILES]
+    return candidates[-1] if candidates else None
+
+def locate_coarse(query_gray: np.ndarray, reference_context: ReferenceContext,
+                  options: Optional[GeorefOptions] = None,
+                  stats: Optional[dict] = None) -> Tuple[np.ndarray, int, int]:
+    """Homografia (pixels de `query_gray` -> pixels do nível 0) da etapa grosseira.
+
+    Tenta a visão geral; se ela falhar ou der menos de COARSE_MIN_INLIERS
+    inliers (área de referência grande demais para a imagem), busca também
+    num nível mais fino, só nos tiles pré-selecionados, de modo que o custo
+    por imagem não cresce com a área, e fica com o resultado de mais inliers.
+    Retorna a homografia, os matches bons e os inliers, como match_and_estimate.
+    """
+    index = retrieval_level(reference_context)
+    try:
+        result = match_and_estimate(query_gray, reference_context, 0, top_k=RETRIEVAL_TOP_K,
+                                    options=options, stats=stats)
+        if index is None or result[2] >= COARSE_MIN_INLIERS:
+            return result
+        reason = f"apenas {result[2]} inliers"
+    except ValueError as e:
+        if index is None:
+            raise
+        result, reason = None, str(e)
+    logging.warning(f"Visão geral insuficiente ({reason}); buscando nos {RETRIEVAL_TOP_K} "
+                    f"tiles mais prováveis do nível {index}.")
+    try:
+        H_fine, num_good, inliers = match_and_estimate(query_gray, reference_context, index, top_k=RETRIEVAL_TOP_K,
+                                                       options=options, stats=stats)
+    except ValueError:
+        if result is None:
+            raise
+        return result
+    if result is not None and inliers <= result[2]:
+        return result
+    # Níveis compartilham a origem: pixels do nível `index` -> pixels do nível 0
+    to_level0 = scale_matrix(reference_context.levels[index].pixel_size / reference_context.levels[0].pixel_size)
+    return to_level0 @ H_fine, num_good, inliers
+
+def estimate_homography(image: ImageSource, reference_context: ReferenceContext,
+                        progress_callback: Optional[ProgressFn] = None,
+                        options: Optional[GeorefOptions] = None,
+                        stats: Optional[dict] = None) -> Tuple[np.ndarray, ReferenceLevel]:
+    """Localiza a imagem na referência, da visão geral ao nível mais fino útil.
+
+    `image` é um array (tons de cinza ou BGR) ou uma InputImage, da qual só
+    são lidas as versões reduzidas usadas em cada etapa. Retorna a
+    homografia (pixels da imagem em resolução total -> pixels do nível) e o
+    nível da pirâmide a que ela se refere. Se dado, `stats`
+    recebe o estimador, os matches e inliers da homografia retornada e a
+    soma das iterações e do tempo de estimação de todas as etapas.
+    """
+    if isinstance(image, np.ndarray):
+        image = ArrayImage(image)
+    h_in, w_in = image.shape
+    if progress_callback:
+        progress_callback(25, "Localizando imagem na visão geral (etapa grosseira)...")
+
+    # Etapa grosseira: imagem reduzida contra o nível de visão geral da pirâmide
+    coarse_scale = min(1.0, COARSE_QUERY_PX / max(h_in, w_in))
+    coarse_query = image.read_gray(coarse_scale)
+    H_coarse, num_good, inliers = locate_coarse(coarse_query, reference_context, options, stats)
+    # Imagem em resolução total -> pixels do nível 0
+    H_level0 = H_coarse @ scale_matrix(coarse_scale)
+
+    gsd = estimate_ground_sample_distance(H_level0, image.shape, reference_context.levels[0].pixel_size)
+    fine_index, fine_scale = select_fine_level(reference_context, image.shape, gsd)
+    level = reference_context.levels[fine_index]
+    # Níveis compartilham a origem; mudar de nível é só uma mudança de escala
+    H = scale_matrix(reference_context.levels[0].pixel_size / level.pixel_size) @ H_level0
+    logging.info(f"Etapa grosseira: GSD estimado {gsd:.3f} unidades/pixel; refinando no nível {fine_index} "
+                 f"({level.pixel_size:.3f} unidades/pixel) com a imagem na escala {fine_scale:.3f}.")
+
+    if progress_callback:
+        progress_callback(50, "Refinando na área prevista (etapa fina)...")
+
+    # Etapa fina: apenas os tiles sob a área prevista, com a imagem em maior resolução
+    if fine_index > 0 or fine_scale > coarse_scale * 1.01:
+        corners = np.float32([[0, 0], [w_in, 0], [w_in, h_in], [0, h_in]]).reshape(-1, 1, 2)
+        predicted = cv2.perspectiveTransform(corners, H).reshape(-1, 2)
+        x0, y0 = predicted.min(axis=0)
+        x1, y1 = predicted.max(axis=0)
+        mx, my = (x1 - x0) * FOOTPRINT_MARGIN, (y1 - y0) * FOOTPRINT_MARGIN
+        tile_ids = level.tiles_in_window(x0 - mx, y0 - my, x1 + mx, y1 + my)
+        if tile_ids:
+            try:
+                fine_query = image.read_gray(fine_scale)
+                H_fine, num_good, inliers = match_and_estimate(fine_query, reference_context, fine_index, tile_ids,
+                                                               options=options, stats=stats)
+                H = H_fine @ scale_matrix(fine_scale)
+            except ValueError as e:
+                logging.warning(f"Etapa fina falhou ({e}); usando a homografia da etapa grosseira.")
+        else:
+            logging.warning("Área prevista fora da referência; usando a homografia da etapa grosseira.")
+    if stats is not None:
+        stats["matches"], stats["inliers"] = num_good, inliers
+    return H, level
+
+# --- Warp e gravação ---
+
+def output_resolution_from_homography(H: np.ndarray, image_shape, pixel_size: float) -> float:
+    """Resolução de saída que preserva o GSD nativo da imagem, arredondada a 3 algarismos significativos."""
+    gsd = estimate_ground_sample_distance(H, image_shape, pixel_size)
+    if not np.isfinite(gsd) or gsd <= 0:
+        raise ValueError("Não foi possível estimar o GSD da imagem a partir da homografia.")
+    return float(f"{gsd:.3g}")
+
+def level_to_map(level: ReferenceLevel) -> np.ndarray:
+    """Afim pixels de `level` -> coordenadas do mapa, como matriz 3x3."""
+    return np.array([[level.pixel_size, 0, level.origin_x],
+                     [0, -level.pixel_size, level.origin_y],
+                     [0, 0, 1]], dtype=np.float64)
+
+def _output_chunks(width: int, height: int, bytes_per_pixel: int, budget_bytes: float) -> List[Window]:
+    """Janelas de saída alinhadas aos tiles internos, cada uma dentro do orçamento de memória.
+
+    Faixas de largura total quando uma linha de tiles cabe no orçamento;
+    caso contrário, grupos de tiles dentro de uma linha de tiles.
+    """
+    block = OUTPUT_BLOCK_PX
+    row_bytes = width * block * bytes_per_pixel
+    if row_bytes <= budget_bytes:
+        chunk_w, chunk_h = width, block * int(budget_bytes // row_bytes)
+    else:
+        chunk_w, chunk_h = block * max(1, int(budget_bytes // (block * block * bytes_per_pixel))), block
+    return [Window(col, row, min(chunk_w, width - col), min(chunk_h, height - row))
+            for row in range(0, height, chunk_h) for col in range(0, width, chunk_w)]
+
+def _creation_options(options: GeorefOptions, count: int = 3, dtype=np.uint8) -> dict:
+    """Opções de criação GDAL da compressão escolhida, para o driver GTiff ou COG.
+
+    JPEG só vale para 1 ou 3 bandas de 8 bits e WEBP para 3; outras saídas
+    (16 bits, multiespectrais) caem para DEFLATE, sem perdas.
+    """
+    compression = options.compression
+    lossy_ok = np.dtype(dtype) == np.uint8 and count in ((1, 3) if compression == "JPEG" else (3,))
+    if compression in ("JPEG", "WEBP") and not lossy_ok:
+        logging.warning(f"{compression} não suporta {count} banda(s) {np.dtype(dtype).name}; usando DEFLATE.")
+        compression = "DEFLATE"
+    if compression == "JPEG":
+        if options.cog:
+            return dict(compress='JPEG', quality=options.quality) # O driver COG já usa YCbCr
+        if count == 3:
+            return dict(compress='JPEG', jpeg_quality=options.quality, photometric='YCBCR')
+        return dict(compress='JPEG', jpeg_quality=options.quality)
+    if compression == "WEBP":
+        return dict(compress='WEBP', quality=options.quality) if options.cog else \
+            dict(compress='WEBP', webp_level=options.quality)
+    # DEFLATE/ZSTD, sem perdas; preditor de ponto flutuante para dados float
+    return dict(compress=compression, predictor=3 if np.dtype(dtype).kind == 'f' else 2)
+
+def _warp_dtype(dtype: np.dtype) -> np.dtype:
+    """Tipo em que o OpenCV reamostra `dtype` (ele não interpola int8 nem inteiros de 32 bits)."""
+    return dtype if dtype in (np.uint8, np.uint16, np.int16, np.float32, np.float64) else np.dtype(np.float32)
+
+def _warp_bands(bands: np.ndarray, H: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """warpPerspective cúbico de (bandas, linhas, colunas); até 4 bandas numa só passada."""
+    work = bands.astype(_warp_dtype(bands.dtype), copy=False)
+    warp = partial(cv2.warpPerspective, M=H, dsize=size, flags=cv2.INTER_CUBIC,
+                   borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    if len(work) == 1:
+        warped = warp(work[0])[np.newaxis]
+    elif len(work) <= 4:
+        warped = warp(np.ascontiguousarray(work.transpose(1, 2, 0))).transpose(2, 0, 1)
+    else:
+        warped = np.stack([warp(band) for band in work])
+    return warped.astype(bands.dtype, copy=False)
+
+def _source_window(H_inverse: np.ndarray, window: Window, image_shape, margin: int) -> Optional[Window]:
+    """Janela da imagem de entrada que cobre o bloco de saída `window` (None se não houver)."""
+    rect = np.float32([[window.col_off, window.row_off],
+                       [window.col_off + window.width, window.row_off],
+                       [window.col_off + window.width, window.row_off + window.height],
+                       [window.col_off, window.row_off + window.height]]).reshape(-1, 1, 2)
+    source = cv2.perspectiveTransform(rect, H_inverse).reshape(-1, 2)
+    h_in, w_in = image_shape[:2]
+    x0 = max(0, int(np.floor(source[:, 0].min())) - margin)
+    y0 = max(0, int(np.floor(source[:, 1].min())) - margin)
+    x1 = min(w_in, int(np.ceil(source[:, 0].max())) + margin)
+    y1 = min(h_in, int(np.ceil(source[:, 1].max())) + margin)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return Window(x0, y0, x1 - x0, y1 - y0)
+
+def _write_stage(method):
+    """Conta o método de _OutputStream na etapa "write" da imagem que criou a saída."""
+    @wraps(method)
+    def timed(self, *args, **kwargs):
+        with recording(self.stats), stage("write"):
+            return method(self, *args, **kwargs)
+    return timed
+
+class _OutputStream:
+    """GeoTIFF de saída gravado por blocos.
+
+    Todos os métodos rodam no gravador: na thread do WriteBehind em lotes
+    com pipeline ou na hora (run_now). Depois da primeira falha, as escritas
+    seguintes são ignoradas e finish() levanta o erro. O tempo de gravação e
+    o tamanho da saída vão para as estatísticas da imagem (stage_metrics).
+    """
+
+    def __init__(self, output_path: str, profile: dict, creation_options: dict, cog: bool):
+        self.output_path = output_path
+        self.stats = current() # Estatísticas da imagem, registradas também da thread do gravador
+        # COG: os blocos vão para um GeoTIFF temporário sem perdas, copiado depois
+        # pelo driver COG (que só grava por cópia) com overviews internas
+        self.stream_path = os.path.splitext(output_path)[0] + ".part.tif" if cog else output_path
+        stream_options = dict(compress='DEFLATE', zlevel=1) if cog else creation_options
+        self._profile = dict(profile, **stream_options)
+        self._creation_options = creation_options
+        self._cog = cog
+        self._dst = None
+        self.error: Optional[BaseException] = None
+
+    @_write_stage
+    def open(self):
+        try:
+            self._dst = rasterio.open(self.stream_path, 'w', **self._profile)
+        except BaseException as e:
+            self.error = e
+            raise
+
+    @_write_stage
+    def write(self, data: np.ndarray, window: Window):
+        if self.error is not None:
+            return
+        try:
+            self._dst.write(data, window=window)
+        except BaseException as e:
+            self.error = e
+            raise
+
+    @_write_stage
+    def finish(self, progress_callback: Optional[ProgressFn], progress: int):
+        """Fecha o GeoTIFF e, para COG, gera a cópia final com overviews."""
+        try:
+            if self.error is not None:
+                raise self.error
+            self._dst.close()
+            if self._cog:
+                if progress_callback:
+                    progress_callback(progress, "Gerando Cloud-Optimized GeoTIFF com overviews...")
+                rasterio.shutil.copy(self.stream_path, self.output_path, driver='COG',
+                                     blocksize=OUTPUT_BLOCK_PX, num_threads='ALL_CPUS', **self._creation_options)
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            if self.stream_path != self.output_path and os.path.exists(self.stream_path):
+                os.remove(self.stream_path)
+        if self.stats is not None:
+            self.stats["output_mb"] = os.path.getsize(self.output_path) / (1024 * 1024)
+        logging.info(f"Imagem georreferenciada salva com sucesso em: {self.output_path}")
+
+    @_write_stage
+    def abort(self):
+        """Não deixa um GeoTIFF incompleto (erro ou cancelamento no meio dos blocos)."""
+        if self._dst is not None and not self._dst.closed:
+            self._dst.close()
+        for path in {self.output_path, self.stream_path}:
+            if os.path.exists(path):
+                os.remove(path)
+
+def write_georeferenced(image: ImageSource, H: np.ndarray, level: ReferenceLevel, crs: str,
+                        output_path: str, progress_callback: Optional[ProgressFn] = None,
+                        options: Optional[GeorefOptions] = None) -> float:
+    """Aplica H (imagem -> pixels de `level`) e grava o GeoTIFF em `output_path`.
+
+    H é composta com a afim nível -> grade de saída, de modo que cada pixel
+    de saída é reamostrado uma única vez, direto da imagem de entrada. A
+    saída é produzida em blocos alinhados aos tiles do GeoTIFF, gravados
+    com escritas por janela; para cada bloco só é lida a janela da entrada
+    que ele cobre (de uma InputImage, direto do arquivo), de modo que a
+    memória fica limitada a `options.warp_memory_mb` qualquer que seja o
+    tamanho da entrada e da saída. As bandas e o tipo de dado da entrada
+    são preservados (16 bits, multiespectral), exceto a banda alfa. Por
+    padrão grava um Cloud-Optimized GeoTIFF com overviews internas. Sem
+    `options.output_resolution`, a resolução de saída é o GSD da imagem
+    estimado por H. Retorna a resolução de saída, em unidades de `crs` por pixel.
+    """
+    target_resolution, written = _write_georeferenced(image, H, level, crs, output_path, progress_callback,
+                                                      options, run_now)
+    written.result()
+    return target_resolution
+
+def _write_georeferenced(image: ImageSource, H: np.ndarray, level: ReferenceLevel, crs: str,
+                         output_path: str, progress_callback: Optional[ProgressFn],
+                         options: Optional[GeorefOptions], submit: Callable) -> Tuple[float, Future]:
+    """write_georeferenced com a gravação entregue a `submit` (WriteBehind.submit ou run_now).
+
+    Os blocos são calculados nesta thread e gravados (e comprimidos) pelo
+    gravador. Retorna a resolução de saída e um Future concluído quando o
+    arquivo estiver completo, ou com o erro da gravação.
+    """
+    options = options or GeorefOptions()
+    if isinstance(image, np.ndarray):
+        image = ArrayImage(image)
+    if progress_callback:
+        progress_callback(85, "Aplicando transformação (warp)...")
+
+    h_in, w_in = image.shape
+    gsd = estimate_ground_sample_distance(H, image.shape, level.pixel_size)
+    if options.output_resolution:
+        target_resolution = options.output_resolution
+        logging.info(f"Resolução alvo definida pelo usuário: {target_resolution} unidades do CRS.")
+    else:
+        target_resolution = output_resolution_from_homography(H, image.shape, level.pixel_size)
+        logging.info(f"Resolução alvo derivada do GSD da imagem: {target_resolution} unidades do CRS.")
+
+    # Imagem -> coordenadas do mapa: H seguida da afim do nível da pirâmide
+    H_map = level_to_map(level) @ H
+
+    # Extensão de saída: envelope da projeção da imagem, limitado à área de referência
+    corners = np.float32([[0, 0], [w_in, 0], [w_in, h_in], [0, h_in]]).reshape(-1, 1, 2)
+    footprint = cv2.perspectiveTransform(corners, H_map).reshape(-1, 2)
+    out_xmin = max(level.origin_x, float(footprint[:, 0].min()))
+    out_xmax = min(level.origin_x + level.width * level.pixel_size, float(footprint[:, 0].max()))
+    out_ymax = min(level.origin_y, float(footprint[:, 1].max()))
+    out_ymin = max(level.origin_y - level.height * level.pixel_size, float(footprint[:, 1].min()))
+    if not (out_xmax > out_xmin and out_ymax > out_ymin):
+        raise ValueError("A projeção da imagem cai fora da área de referência.")
+
+    final_width = max(1, int(np.ceil((out_xmax - out_xmin) / target_resolution)))
+    final_height = max(1, int(np.ceil((out_ymax - out_ymin) / target_resolution)))
+    logging.info(f"Calculadas dimensões finais: {final_width}x{final_height} pixels para resolução {target_resolution}.")
+
+    # Mapa -> pixels de saída; composta com H_map, leva a imagem direto à grade final
+    dst_transform = rasterio.transform.from_origin(out_xmin, out_ymax, target_resolution, target_resolution)
+    map_to_output = np.array(~dst_transform, dtype=np.float64).reshape(3, 3)
+    H_output = map_to_output @ H_map
+    H_inverse = np.linalg.inv(H_output)
+    quad = cv2.perspectiveTransform(corners, H_output).reshape(-1, 1, 2)
+
+    # Saída bem mais grossa que o GSD: a janela da entrada é lida já reduzida por
+    # média (overviews do arquivo, se houver), já que a interpolação do warp não filtra
+    scale = gsd / target_resolution if np.isfinite(gsd) and gsd > 0 else 1.0
+    read_scale = scale if scale < 0.5 else 1.0
+    margin = int(np.ceil(2 / read_scale)) # Vizinhança da interpolação cúbica, em pixels da entrada
+
+    dtype, count = image.dtype, image.count
+    # Por pixel de saída: o bloco warpado, a cópia gravada pelo rasterio e a janela
+    # lida da entrada (até cerca de 4x o bloco, já reduzida)
+    chunks = _output_chunks(final_width, final_height, (2 + 4) * count * dtype.itemsize,
+                            options.warp_memory_mb * 1024 * 1024)
+    logging.info(f"Warp em {len(chunks)} bloco(s) de até {chunks[0].width}x{chunks[0].height} pixels "
+                 f"({count} banda(s) {dtype.name}).")
+
+    creation_options = _creation_options(options, count, dtype)
+    profile = dict(driver='GTiff', height=final_height, width=final_width, count=count, dtype=dtype, crs=crs,
+                   transform=dst_transform,
+                   nodata=0, # Pixels fora da imagem
+                   tiled=True, blockxsize=OUTPUT_BLOCK_PX, blockysize=OUTPUT_BLOCK_PX,
+                   num_threads='ALL_CPUS') # Compressão multithread dos tiles
+    stream = _OutputStream(output_path, profile, creation_options, options.cog)
+    stream_end = 93 if options.cog else 95
+    submit(stream.open)
+    try:
+        reported = 85
+        for i, window in enumerate(chunks):
+            if stream.error is not None:
+                raise stream.error
+            rect = np.float32([[window.col_off, window.row_off],
+                               [window.col_off + window.width, window.row_off],
+                               [window.col_off + window.width, window.row_off + window.height],
+                               [window.col_off, window.row_off + window.height]]).reshape(-1, 1, 2)
+            overlap, _ = cv2.intersectConvexConvex(quad, rect)
+            source_window = _source_window(H_inverse, window, image.shape, margin) if overlap > 0 else None
+            if source_window is not None:
+                read_shape = (max(1, int(round(source_window.height * read_scale))),
+                              max(1, int(round(source_window.width * read_scale))))
+                bands = image.read_window(source_window, read_shape)
+                # Pixels lidos -> pixels da entrada -> pixels do bloco de saída
+                read_to_source = np.array([[source_window.width / read_shape[1], 0, source_window.col_off],
+                                           [0, source_window.height / read_shape[0], source_window.row_off],
+                                           [0, 0, 1]], dtype=np.float64)
+                H_chunk = np.array([[1, 0, -window.col_off], [0, 1, -window.row_off], [0, 0, 1]],
+                                   dtype=np.float64) @ H_output @ read_to_source
+                with stage("warp"):
+                    warped = _warp_bands(bands, H_chunk, (window.width, window.height))
+                submit(stream.write, warped, window)
+            progress = 85 + ((stream_end - 85) * (i + 1)) // len(chunks)
+            if progress_callback and progress > reported:
+                reported = progress
+                progress_callback(progress, "Aplicando transformação e salvando imagem georreferenciada...")
+    except BaseException:
+        submit(stream.abort)
+        raise
+    return target_resolution, submit(stream.finish, progress_callback, stream_end)
+
+# --- Saída rápida: VRT com GCPs ---
+
+def _vrt_source_path(image_path: str, vrt_path: str) -> Tuple[str, bool]:
+    """Caminho da imagem como gravado no VRT: relativo ao VRT quando possível."""
+    try:
+        relative = os.path.relpath(os.path.abspath(image_path), os.path.dirname(os.path.abspath(vrt_path)))
+        return relative.replace(os.sep, "/"), True
+    except ValueError:  # Drives diferentes no Windows
+        return os.path.abspath(image_path), False
+
+def write_gcp_vrt(image_path: str, image_shape, H: np.ndarray, level: ReferenceLevel, crs: str,
+                  output_path: str) -> int:
+    """Grava um VRT que referencia a imagem original, intocada, com GCPs derivados de H.
+
+    A homografia exata e a grade do nível vão nos metadados (domínio
+    GEOREF_AUTO), para que materialize_vrt reproduza depois a saída
+    reamostrada. Retorna o número de GCPs.
+    """
+    h, w = image_shape[:2]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", NotGeoreferencedWarning)
+        with rasterio.open(image_path) as src:
+            dtypes, colorinterp = src.dtypes, src.colorinterp
+
+    # Grade regular de pontos da imagem -> pixels do nível -> coordenadas do mapa
+    cols, rows = np.linspace(0, w, GCP_GRID_SIZE), np.linspace(0, h, GCP_GRID_SIZE)
+    grid = np.float32([(c, r) for r in rows for c in cols])
+    level_px = cv2.perspectiveTransform(grid.reshape(-1, 1, 2), H).reshape(-1, 2)
+    map_x = level.origin_x + level_px[:, 0] * level.pixel_size
+    map_y = level.origin_y - level_px[:, 1] * level.pixel_size
+
+    root = ET.Element("VRTDataset", rasterXSize=str(w), rasterYSize=str(h))
+    gcp_list = ET.SubElement(root, "GCPList", Projection=crs)
+    for i, ((col, row), x, y) in enumerate(zip(grid, map_x, map_y)):
+        ET.SubElement(gcp_list, "GCP", Id=str(i + 1), Pixel=f"{col:.3f}", Line=f"{row:.3f}",
+                      X=f"{x:.6f}", Y=f"{y:.6f}")
+    metadata = ET.SubElement(root, "Metadata", domain=VRT_METADATA_DOMAIN)
+    grid_values = (level.origin_x, level.origin_y, level.pixel_size, level.width, level.height)
+    for key, value in (("HOMOGRAPHY", ",".join(repr(float(v)) for v in np.ravel(H))),
+                       ("LEVEL_GRID", ",".join(repr(float(v)) for v in grid_values)),
+                       ("CRS", crs)):
+        ET.SubElement(metadata, "MDI", key=key).text = value
+
+    source, relative = _vrt_source_path(image_path, output_path)
+    for band, (dtype, ci) in enumerate(zip(dtypes, colorinterp), start=1):
+        band_el = ET.SubElement(root, "VRTRasterBand", dataType=_GDAL_DATA_TYPES.get(dtype, "Byte"), band=str(band))
+        ET.SubElement(band_el, "ColorInterp").text = ci.name.capitalize()
+        source_el = ET.SubElement(band_el, "SimpleSource")
+        ET.SubElement(source_el, "SourceFilename", relativeToVRT="1" if relative else "0").text = source
+        ET.SubElement(source_el, "SourceBand").text = str(band)
+
+    ET.ElementTree(root).write(output_path, encoding="utf-8")
+    logging.info(f"VRT com {len(grid)} GCPs gravado em: {output_path}")
+    return len(grid)
+
+def materialize_vrt(vrt_path: str, output_path: str,
+                    progress_callback: Optional[ProgressFn] = None,
+                    options: Optional[GeorefOptions] = None) -> float:
+    """Gera, a partir de um VRT do modo rápido, o mesmo GeoTIFF reamostrado do modo padrão.
+
+    Usa a homografia exata guardada nos metadados, não os GCPs.
+    Retorna a resolução de saída.
+    """
+    with rasterio.open(vrt_path) as src:
+        tags = src.tags(ns=VRT_METADATA_DOMAIN)
+    if "HOMOGRAPHY" not in tags:
+        raise ValueError(f"VRT sem a homografia do GeorefAuto: {vrt_path}")
+    H = np.array([float(v) for v in tags["HOMOGRAPHY"].split(",")]).reshape(3, 3)
+    origin_x, origin_y, pixel_size, width, height = (float(v) for v in tags["LEVEL_GRID"].split(","))
+    level = ReferenceLevel(0, origin_x, origin_y, pixel_size, int(width), int(height))
+    # O VRT é lido por janelas, como qualquer entrada: a imagem original nunca é carregada inteira
+    with InputImage(vrt_path) as image:
+        return write_georeferenced(image, H, level, tags["CRS"], output_path, progress_callback, options)
+
+# --- Georreferenciamento ---
+
+def estimation_summary(stats: dict) -> str:
+    """Resumo da estimação robusta de uma imagem, a partir do `stats` de estimate_homography."""
+    return (f"({stats['estimator']}: {stats['inliers']} de {stats['matches']} inliers, "
+            f"~{stats['iterations']} iterações, {stats['estimation_s'] * 1000:.0f} ms)")
+
+def georeference_array(image_color: ImageSource, reference_context: ReferenceContext, output_path: str,
+                       progress_callback: Optional[ProgressFn] = None,
+                       options: Optional[GeorefOptions] = None, stats: Optional[dict] = None) -> float:
+    """Georreferencia uma imagem já carregada (BGR ou cinza) ou uma InputImage; erros são propagados como exceções.
+
+    Retorna a resolução de saída, em unidades do CRS da referência por pixel.
+    `stats` é preenchido como em estimate_homography.
+    """
+    if isinstance(image_color, np.ndarray):
+        image_color = ArrayImage(image_color)
+    options = options or GeorefOptions()
+    H, level = estimate_homography(image_color, reference_context, progress_callback, options, stats)
+    return write_georeferenced(image_color, H, level, reference_context.crs, output_path, progress_callback,
+                               options)
+
+def _georeference_input(image: ImageSource, image_path: str, reference_context: ReferenceContext,
+                        output_path: str, progress_callback: Optional[ProgressFn],
+                        options: GeorefOptions, submit: Callable = run_now,
+                        stats: Optional[dict] = None) -> Future:
+    """Georreferencia uma imagem já aberta, com a gravação entregue a `submit`.
+
+    Erros da estimação são levantados aqui; o Future retornado recebe a
+    mensagem de sucesso quando a saída estiver gravada, ou o erro da gravação.
+    `stats` é preenchido como em estimate_homography, com a homografia
+    pixels da imagem -> mapa ("image_to_map", lista 3x3) e com o tamanho da saída.
+    """
+    stats = {} if stats is None else stats
+    H, level = estimate_homography(image, reference_context, progress_callback, options, stats)
+    stats["image_to_map"] = (level_to_map(level) @ H).tolist()
+    if options.output_mode == OUTPUT_MODE_VRT:
+        # Só a posição é necessária: a imagem nunca é reamostrada
+        if progress_callback:
+            progress_callback(95, "Gravando VRT com GCPs...")
+        with stage("write"):
+            n_gcps = write_gcp_vrt(image_path, image.shape, H, level, reference_context.crs, output_path)
+        stats["output_mb"] = os.path.getsize(output_path) / (1024 * 1024)
+        return completed(f"Georreferenciamento concluído (VRT com {n_gcps} GCPs, sem reamostragem): "
+                         f"{os.path.basename(output_path)} {estimation_summary(stats)}")
+
+    target_resolution, written = _write_georeferenced(image, H, level, reference_context.crs, output_path,
+                                                      progress_callback, options, submit)
+    message = (f"Georreferenciamento concluído com sucesso (resolução {target_resolution:g} unidades/pixel): "
+               f"{os.path.basename(output_path)} {estimation_summary(stats)}")
+    return chain(written, lambda _: message, _raise)
+
+def _raise(error: BaseException):
+    raise error
+
+def _failure_result(image_path: str, error: BaseException) -> Tuple[bool, str]:
+    """(False, mensagem) de uma falha do georreferenciamento de `image_path`, registrada no log."""
+    if isinstance(error, InterruptedError):
+        logging.info(f"Georreferenciamento cancelado: {os.path.basename(image_path)}")
+        return False, CANCELED_MESSAGE
+    details = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    if isinstance(error, ValueError):
+        logging.error(f"Erro de valor durante georreferenciamento: {error}")
+        logging.error(details)
+        return False, str(error)
+    if isinstance(error, ImportError):
+        logging.error(f"Erro de importação: {error}. Verifique as dependências (ex: opencv-contrib-python, rasterio).")
+        return False, f"Erro de dependência: {error}"
+    logging.error(f"Erro inesperado durante georreferenciamento: {error}")
+    logging.error(details)
+    # Check for common OpenCV/SIFT issues
+    if "SIFT" in str(error) and not hasattr(cv2, 'SIFT_create'):
+        msg = "Erro: SIFT não disponível. Instale 'opencv-contrib-python'."
+        logging.error(msg)
+        return False, msg
+    return False, f"Erro inesperado: {str(error)}"
+
+def _finish_stats(stats: dict, started: float) -> dict:
+    """Completa as estatísticas de uma imagem com o tempo total e uma última amostra de memória."""
+    stats["total_s"] = time.perf_counter() - started
+    sample_memory(stats)
+    return stats
+
+def georeference_file(image_path: str, reference_context: ReferenceContext, output_path: str,
+                      progress_callback: Optional[ProgressFn] = None,
+                      options: Optional[GeorefOptions] = None,
+                      stats: Optional[dict] = None) -> Tuple[bool, str]:
+    """Georreferencia o arquivo `image_path` contra a referência e grava `output_path`.
+
+    Nunca levanta exceção: retorna (sucesso, mensagem). A mensagem de
+    sucesso resume a estimação robusta (estimador, inliers, iterações, tempo).
+    Se dado, `stats` recebe o tempo de cada etapa, o pico de memória, as
+    contagens de pontos-chave, matches e inliers e o tamanho da saída
+    (chaves de stage_metrics.REPORT_COLUMNS), mesmo em caso de falha, e a
+    homografia imagem -> mapa estimada ("image_to_map").
+    """
+    options = options or GeorefOptions()
+    stats = {} if stats is None else stats
+    started = time.perf_counter()
+    try:
+        with recording(stats):
+            if progress_callback:
+                progress_callback(15, "Carregando imagem de entrada...")
+
+            # Leituras reduzidas para as características e por janelas para o warp:
+            # a imagem nunca é carregada inteira em resolução total
+            with stage("read"):
+                image = open_input_image(image_path)
+            with image:
+                message = _georeference_input(image, image_path, reference_context, output_path,
+                                              progress_callback, options, stats=stats).result()
+        return True, message
+    except Exception as e:
+        return _failure_result(image_path, e)
+    finally:
+        _finish_stats(stats, started)
+
+# --- Lote ---
+
+def _georeference_job(reference_context: ReferenceContext, options: GeorefOptions, image_path: str,
+                      output_path: str, cancel_event, report: ProgressFn) -> Tuple[bool, str, dict]:
+    """Georreferencia uma imagem do lote, parando na próxima etapa se o lote for cancelado.
+
+    Retorna (sucesso, mensagem, estatísticas da imagem).
+    """
+    stats = {}
+    if cancel_event.is_set():
+        return False, CANCELED_MESSAGE, stats
+
+    def report_progress(percentage, message):
+        if cancel_event.is_set():
+            raise InterruptedError(CANCELED_MESSAGE)
+        report(percentage, message)
+
+    success, message = georeference_file(image_path, reference_context, output_path, report_progress, options, stats)
+    return success, message, stats
+
+def _load_input(image_path: str, max_bytes: float):
+    """Etapa de leitura do pipeline: abre a imagem e a decodifica inteira se couber em `max_bytes`.
+
+    Retorna a imagem e as estatísticas da imagem, já com o tempo de leitura.
+    """
+    stats = {}
+    with recording(stats), stage("read"):
+        image = open_input_image(image_path)
+        try:
+            image.load(max_bytes)
+        except BaseException:
+            image.close()
+            raise
+    return image, stats
+
+def _pipeline_job(reference_context: ReferenceContext, options: GeorefOptions, prefetcher: Prefetcher,
+                  index: int, image_path: str, output_path: str, cancel_event, report: ProgressFn,
+                  submit: Callable) -> Future:
+    """Etapa de cálculo do pipeline: localiza e warpa a imagem `index`, já lida pelo Prefetcher.
+
+    Os blocos vão para o gravador (`submit`), de modo que a thread passa à
+    próxima imagem sem esperar a compressão. Retorna um Future de
+    (sucesso, mensagem, estatísticas), concluído quando a saída estiver gravada.
+    """
+    stats = {}
+    if cancel_event.is_set():
+        return completed((False, CANCELED_MESSAGE, stats))
+    started = time.perf_counter()
+
+    def report_progress(percentage, message):
+        if cancel_event.is_set():
+            raise InterruptedError(CANCELED_MESSAGE)
+        report(percentage, message)
+
+    def submit_write(fn, *args, **kwargs):
+        with stage("wait"): # Fila do gravador cheia
+            return submit(fn, *args, **kwargs)
+
+    def failed(error):
+        return _failure_result(image_path, error) + (_finish_stats(stats, started),)
+
+    try:
+        with recording(stats):
+            with stage("wait"): # Imagem ainda não lida
+                loaded = prefetcher.take(index)
+            if loaded is None:
+                return completed((False, CANCELED_MESSAGE, stats))
+            image, read_stats = loaded
+            stats.update(read_stats)
+            with image:
+                written = _georeference_input(image, image_path, reference_context, output_path, report_progress,
+                                              options, submit_write, stats)
+    except Exception as e:
+        return completed(failed(e))
+    return chain(written, lambda message: (True, message, _finish_stats(stats, started)), failed)
+
+# Estado de cada processo trabalhador, definido por _init_process_worker
+_worker_context = None
+_worker_options = None
+_worker_cancel_event = None
+_worker_progress_queue = None
+
+def _init_process_worker(reference_context, options, cancel_event, progress_queue):
+    global _worker_context, _worker_options, _worker_cancel_event, _worker_progress_queue
+    _worker_context = reference_context
+    _worker_options = options
+    _worker_cancel_event = cancel_event
+    _worker_progress_queue = progress_queue
+
+def _process_job(index: int, image_path: str, output_path: str) -> Tuple[bool, str, dict]:
+    def report(percentage, message):
+        _worker_progress_queue.put((index, percentage, message))
+    return _georeference_job(_worker_context, _worker_options, image_path, output_path,
+                             _worker_cancel_event, report)
+
+def _process_pool_context():
+    """Contexto 'spawn': processos limpos, sem herdar o estado de Qt/QGIS do processo pai."""
+    mp_context = multiprocessing.get_context("spawn")
+    # Dentro do QGIS, sys.executable é o binário do QGIS e não um interpretador Python
+    if not os.path.basename(sys.executable).lower().startswith("python"):
+        if os.name == "nt":
+            interpreter = os.path.join(sys.exec_prefix, "python.exe")
+        else:
+            interpreter = os.path.join(sys.exec_prefix, "bin", f"python{sys.version_info[0]}")
+        if os.path.exists(interpreter):
+            mp_context.set_executable(interpreter)
+    return mp_context
+
+def skip_completed(image_paths: List[str], output_paths: List[str], manifest: JobManifest,
+                   result_callback: Optional[Callable[[str, bool, str, str, dict], None]] = None
+                   ) -> Tuple[List[str], List[str], List[str]]:
+    """Separa as imagens que o manifesto dá como concluídas das que ainda precisam ser processadas.
+
+    São puladas as imagens cuja última execução deu certo com os mesmos
+    parâmetros, cuja saída continua lá, inalterada, e cuja entrada não
+    mudou; falhas e cancelamentos são refeitos. `result_callback` é chamado
+    para cada imagem pulada, com a homografia registrada nas estatísticas.
+    Devolve (imagens pendentes, saídas pendentes, saídas já concluídas).
+    """
+    pending_images, pending_outputs, skipped = [], [], []
+    for image_path, output_path in zip(image_paths, output_paths):
+        entry = manifest.completed(image_path, output_path)
+        if entry is None:
+            pending_images.append(image_path)
+            pending_outputs.append(output_path)
+            continue
+        skipped.append(output_path)
+        if result_callback:
+            stats = dict(entry.get("stats") or {}, image_to_map=entry.get("homography"))
+            result_callback(image_path, True, SKIPPED_MESSAGE, output_path, stats)
+    manifest.save()
+    if skipped:
+        logging.info(f"{len(skipped)} imagem(ns) já georreferenciada(s) segundo {manifest.path}; "
+                     f"{len(pending_images)} a processar.")
+    return pending_images, pending_outputs, skipped
+
+def run_batch(image_paths: List[str], reference_context: ReferenceContext, output_paths: List[str],
+              max_workers: int = DEFAULT_MAX_WORKERS,
+              use_processes: bool = False,
+              options: Optional[GeorefOptions] = None,
+              progress_callback: Optional[ProgressFn] = None,
+              result_callback: Optional[Callable[[str, bool, str, str, dict], None]] = None,
+              is_canceled: Optional[Callable[[], bool]] = None,
+              manifest: Optional[JobManifest] = None) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Georreferencia `image_paths` em paralelo contra uma referência já montada.
+
+    Com `use_processes`, as imagens são processadas em processos separados
+    (sem QGIS, iniciados em milissegundos), que recebem uma cópia do contexto
+    de referência; caso contrário, em threads que o compartilham (OpenCV
+    libera o GIL nas etapas pesadas). Com threads, o lote é um pipeline:
+    uma thread de leitura carrega até `options.prefetch_frames` imagens à
+    frente, as threads de trabalho localizam e warpam, e uma thread de
+    gravação comprime e grava as saídas, com filas limitadas entre as
+    etapas. `progress_callback(percent, message)` recebe o progresso total
+    do lote, `result_callback(image_path, success, message, output_path, stats)`
+    é chamado assim que cada imagem termina, com as estatísticas da imagem
+    (tempo por etapa, memória, contagens; ver georeference_file), e
+    `is_canceled()` é consultado periodicamente para cancelamento cooperativo.
+    O resultado de cada imagem é registrado em `manifest`, se informado
+    (as imagens já concluídas são filtradas antes, com skip_completed).
+    """
+    options = options or GeorefOptions()
+    successful = []
+    failed = []
+    total = len(image_paths)
+    is_canceled = is_canceled or (lambda: False)
+
+    progress_lock = threading.Lock()
+    image_progress = [0.0] * total
+
+    def report(index: int, percentage: float, message: str):
+        with progress_lock:
+            image_progress[index] = percentage
+            overall = sum(image_progress) / max(1, total)
+        if progress_callback:
+            progress_callback(overall, f"{os.path.basename(image_paths[index])}: {message}")
+
+    max_workers = max(1, min(max_workers, total))
+    progress_queue = None
+    prefetcher = writer = None
+    if use_processes:
+        mp_context = _process_pool_context()
+        cancel_event = mp_context.Event()
+        progress_queue = mp_context.Queue()
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=mp_context, initializer=_init_process_worker,
+            initargs=(portable_reference_context(reference_context), options, cancel_event, progress_queue))
+        submit = lambda i: executor.submit(_process_job, i, image_paths[i], output_paths[i])
+    elif options.prefetch_frames > 0:
+        cancel_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="georef")
+        # No modo VRT a imagem só é lida reduzida: não vale decodificá-la inteira
+        frame_bytes = (PREFETCH_FRAME_BUDGETS * options.warp_memory_mb * 1024 * 1024
+                       if options.output_mode == OUTPUT_MODE_WARP else 0)
+        prefetcher = Prefetcher(image_paths, partial(_load_input, max_bytes=frame_bytes), options.prefetch_frames,
+                                release=lambda loaded: loaded[0].close())
+        writer = WriteBehind(WRITE_BEHIND_CHUNKS * max_workers)
+        submit = lambda i: executor.submit(_pipeline_job, reference_context, options, prefetcher, i, image_paths[i],
+                                           output_paths[i], cancel_event, partial(report, i), writer.submit)
+    else:
+        cancel_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="georef")
+        submit = lambda i: executor.submit(_georeference_job, reference_context, options, image_paths[i],
+                                           output_paths[i], cancel_event, partial(report, i))
+
+    def drain_progress():
+        while progress_queue is not None:
+            try:
+                index, percentage, message = progress_queue.get_nowait()
+            except Empty:
+                break
+            if image_progress[index] < 100:  # Ignore updates that arrive after the result
+                report(index, percentage, message)
+
+    logging.info(f"Processando {total} imagem(ns) com {max_workers} "
+                 f"{'processo(s)' if use_processes else 'thread(s)'}"
+                 f"{f', {options.prefetch_frames} imagem(ns) lida(s) à frente' if prefetcher else ''}.")
+    try:
+        with executor:
+            # Resultado de cada imagem -> trabalho no executor (no pipeline, o resultado
+            # só sai depois da gravação, que continua após o fim do trabalho)
+            jobs = {}
+            for i in range(total):
+                job = submit(i)
+                result = flatten(job) if writer is not None else job
+                jobs[result] = (i, job)
+            pending = set(jobs)
+            while pending:
+                done, pending = wait(pending, timeout=_POLL_INTERVAL_S, return_when=FIRST_COMPLETED)
+                drain_progress()
+                if is_canceled() and not cancel_event.is_set():
+                    # Cancela o que ainda não começou; o que está em execução para na próxima etapa
+                    cancel_event.set()
+                    for result in pending:
+                        jobs[result][1].cancel()
+
+                for future in done:
+                    i = jobs[future][0]
+                    img_path = image_paths[i]
+                    try:
+                        success, message, stats = future.result()
+                    except CancelledError:
+                        success, message, stats = False, CANCELED_MESSAGE, {}
+                    except Exception as e:
+                        success, message, stats = False, f"Erro inesperado: {str(e)}", {}
+
+                    if success:
+                        successful.append(output_paths[i])
+                    else:
+                        failed.append((os.path.basename(img_path), message))
+                    if manifest is not None:
+                        status = STATUS_OK if success else STATUS_CANCELED if message == CANCELED_MESSAGE else STATUS_FAILED
+                        manifest.record(img_path, output_paths[i], status, message, stats)
+                    report(i, 100, "concluído" if success else message)
+                    if result_callback:
+                        result_callback(img_path, success, message, output_paths[i] if success else "", stats)
+    finally:
+        # O executor já terminou: nada mais é enviado ao gravador nem lido à frente
+        if writer is not None:
+            writer.close()
+        if prefetcher is not None:
+            prefetcher.close()
+        if manifest is not None:
+            manifest.save()
+
+    if cancel_event.is_set():
+        logging.info("Processo cancelado pelo usuário.")
+    return successful, failed
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Processing algorithm for batch georeferencing (usable from qgis_process)."""
+
+import os
+
+from qgis.core import (
+    QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException,
+    QgsProcessingParameterString, QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterRasterLayer, QgsProcessingParameterFolderDestination, QgsProcessingParameterFileDestination,
+    QgsProcessingParameterNumber, QgsProcessingParameterBoolean, QgsProcessingParameterEnum,
+    QgsProcessingOutputNumber, QgsProcessingParameterDefinition
+)
+
+from .georeferencing import (
+    batch_georeference, default_output_path, expand_image_inputs, polygon_from_features,
+    get_area_in_square_km, MAX_POLYGON_AREA, DEFAULT_MAX_WORKERS, DEFAULT_WARP_MEMORY_MB, DEFAULT_PREFETCH_FRAMES,
+    GeorefOptions, OUTPUT_MODE_WARP, OUTPUT_MODE_VRT, OUTPUT_COMPRESSIONS, PRESETS, DESCRIPTOR_STORAGES, ESTIMATORS,
+    DEFAULT_CONFIDENCE, DEFAULT_MAX_ITERATIONS, MIN_FEATURES, PRECHECK_MIN_INLIERS, PRECHECK_MIN_RATIO,
+    report_row, write_report
+)
+
+
+class BatchGeoreferenceAlgorithm(QgsProcessingAlgorithm):
+    """Georeference a batch of aerial images against a reference raster inside a bounding polygon."""
+
+    INPUT_IMAGES = "INPUT_IMAGES"
+    POLYGON = "POLYGON"
+    REFERENCE = "REFERENCE"
+    WORKERS = "WORKERS"
+    USE_PROCESSES = "USE_PROCESSES"
+    RESUME = "RESUME"
+    OUTPUT_MODE = "OUTPUT_MODE"
+    RESOLUTION = "RESOLUTION"
+    PRESET = "PRESET"
+    NFEATURES = "NFEATURES"
+    DESCRIPTOR_STORAGE = "DESCRIPTOR_STORAGE"
+    ESTIMATOR = "ESTIMATOR"
+    CONFIDENCE = "CONFIDENCE"
+    MAX_ITERATIONS = "MAX_ITERATIONS"
+    PRECHECK = "PRECHECK"
+    PRECHECK_MIN_INLIERS = "PRECHECK_MIN_INLIERS"
+    PRECHECK_MIN_RATIO = "PRECHECK_MIN_RATIO"
+    COMPRESSION = "COMPRESSION"
+    COG = "COG"
+    WARP_MEMORY = "WARP_MEMORY"
+    PREFETCH = "PREFETCH"
+    OUTPUT_FOLDER = "OUTPUT_FOLDER"
+    STATS = "STATS"
+    OUTPUT_MODES = [OUTPUT_MODE_WARP, OUTPUT_MODE_VRT]
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+
+    def name(self):
+        return "batch_georeference"
+
+    def displayName(self):
+        return "Batch georeference aerial images"
+
+    def group(self):
+        return "Georeferencing"
+
+    def groupId(self):
+        return "georeferencing"
+
+    def shortHelpString(self):
+        return (
+            "Automatically georeferences aerial images by matching them (RootSIFT, FLANN, RANSAC) "
+            "against a reference raster inside a bounding polygon.\n\n"
+            "Input images accepts a glob pattern (e.g. /data/flight/*.tif), a directory, "
+            "a ';'-separated list of paths or a .txt/.lst file with one path per line.\n\n"
+            "Workers run as threads by default. A reader thread then loads the next frames "
+            "while they compute and a writer thread encodes the outputs. Separate processes "
+            "scale better on many cores and start without loading QGIS.\n\n"
+            "Each output is written to the output folder as <image name>_georef.tif. The VRT output "
+            "mode skips resampling: it writes <image name>_georef.vrt, which references the untouched "
+            "original with ground control points, in milliseconds per image.\n\n"
+            "Warped outputs are Cloud-Optimized GeoTIFFs with internal overviews, so they display "
+            "instantly and can be served straight from object storage.\n\n"
+            "The optional stage statistics file (CSV or JSON) records, per image, the time of each "
+            "stage, the peak and growth of the process memory, the keypoint, match and inlier counts "
+            "and the output size.\n\n"
+            "A job manifest (georef_manifest.json) in the output folder records the result of each "
+            "image. When resuming, images whose output is still valid and whose input, parameters "
+            "and reference are unchanged are skipped; only the rest, including failures, are processed."
+        )
+
+    def createInstance(self):
+        return BatchGeoreferenceAlgorithm()
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterString(
+            self.INPUT_IMAGES, "Input images (glob, directory, ';'-separated list or list file)"))
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.POLYGON, "Bounding polygon", [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterRasterLayer(
+            self.REFERENCE, "Reference raster"))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.WORKERS, "Parallel workers", QgsProcessingParameterNumber.Integer,
+            defaultValue=DEFAULT_MAX_WORKERS, minValue=1))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.PRESET, "Speed / accuracy preset",
+            ["Accurate (RootSIFT)", "Balanced (AKAZE)", "Fast (ORB, quick look)"], defaultValue=0))
+        nfeatures = QgsProcessingParameterNumber(
+            self.NFEATURES, "Maximum features per image or reference tile (0 = preset default)",
+            QgsProcessingParameterNumber.Integer, defaultValue=0, minValue=0)
+        nfeatures.setFlags(nfeatures.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(nfeatures)
+        storage = QgsProcessingParameterEnum(
+            self.DESCRIPTOR_STORAGE, "Reference descriptor storage (RootSIFT)",
+            ["float32", "float16 (half the memory)", "uint8 (a quarter of the memory)"], defaultValue=0)
+        storage.setFlags(storage.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(storage)
+        estimators = list(ESTIMATORS)
+        estimator = QgsProcessingParameterEnum(
+            self.ESTIMATOR, "Robust estimator", [ESTIMATORS[e][1] for e in estimators],
+            defaultValue=estimators.index("magsac"))
+        estimator.setFlags(estimator.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(estimator)
+        confidence = QgsProcessingParameterNumber(
+            self.CONFIDENCE, "Estimator confidence", QgsProcessingParameterNumber.Double,
+            defaultValue=DEFAULT_CONFIDENCE, minValue=0.0, maxValue=1.0)
+        confidence.setFlags(confidence.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(confidence)
+        max_iterations = QgsProcessingParameterNumber(
+            self.MAX_ITERATIONS, "Estimator iteration cap", QgsProcessingParameterNumber.Integer,
+            defaultValue=DEFAULT_MAX_ITERATIONS, minValue=1)
+        max_iterations.setFlags(max_iterations.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(max_iterations)
+        precheck = QgsProcessingParameterBoolean(
+            self.PRECHECK, "Reject hopeless images early (similarity pre-check)", defaultValue=True)
+        precheck.setFlags(precheck.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(precheck)
+        precheck_min_inliers = QgsProcessingParameterNumber(
+            self.PRECHECK_MIN_INLIERS, "Pre-check: consistent matches that always keep an image",
+            QgsProcessingParameterNumber.Integer, defaultValue=PRECHECK_MIN_INLIERS, minValue=MIN_FEATURES)
+        precheck_min_inliers.setFlags(precheck_min_inliers.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(precheck_min_inliers)
+        precheck_min_ratio = QgsProcessingParameterNumber(
+            self.PRECHECK_MIN_RATIO, "Pre-check: share of consistent matches that keeps an image with fewer",
+            QgsProcessingParameterNumber.Double, defaultValue=PRECHECK_MIN_RATIO, minValue=0.0, maxValue=1.0)
+        precheck_min_ratio.setFlags(precheck_min_ratio.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(precheck_min_ratio)
+        self.addParameter(QgsProcessingParameterEnum(
+            self.OUTPUT_MODE, "Output",
+            ["Warped GeoTIFF", "Original image + GCPs (VRT, no resampling)"], defaultValue=0))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.RESOLUTION, "Output resolution (reference CRS units per pixel, 0 = native ground resolution)",
+            QgsProcessingParameterNumber.Double, defaultValue=0.0, minValue=0.0))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.COMPRESSION, "Compression", list(OUTPUT_COMPRESSIONS), defaultValue=0))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.COG, "Write Cloud-Optimized GeoTIFFs with overviews", defaultValue=True))
+        warp_memory = QgsProcessingParameterNumber(
+            self.WARP_MEMORY, "Warp memory budget per output chunk (MB)",
+            QgsProcessingParameterNumber.Double, defaultValue=DEFAULT_WARP_MEMORY_MB, minValue=1.0)
+        warp_memory.setFlags(warp_memory.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(warp_memory)
+        prefetch = QgsProcessingParameterNumber(
+            self.PREFETCH, "Frames read ahead of the workers (0 = no reader and writer threads)",
+            QgsProcessingParameterNumber.Integer, defaultValue=DEFAULT_PREFETCH_FRAMES, minValue=0)
+        prefetch.setFlags(prefetch.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(prefetch)
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.USE_PROCESSES, "Run workers as separate processes", defaultValue=False))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.RESUME, "Skip images already georeferenced (job manifest)", defaultValue=True))
+        self.addParameter(QgsProcessingParameterFolderDestination(
+            self.OUTPUT_FOLDER, "Output folder"))
+        self.addParameter(QgsProcessingParameterFileDestination(
+            self.STATS, "Stage statistics", "CSV files (*.csv);;JSON files (*.json)",
+            optional=True, createByDefault=False))
+        self.addOutput(QgsProcessingOutputNumber(self.SUCCEEDED, "Images georeferenced"))
+        self.addOutput(QgsProcessingOutputNumber(self.FAILED, "Images failed"))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        image_paths = expand_image_inputs(self.parameterAsString(parameters, self.INPUT_IMAGES, context))
+        if not image_paths:
+            raise QgsProcessingException("No input images found.")
+
+        reference_layer = self.parameterAsRasterLayer(parameters, self.REFERENCE, context)
+        if reference_layer is None or not reference_layer.isValid():
+            raise QgsProcessingException("Invalid reference raster.")
+
+        source = self.parameterAsSource(parameters, self.POLYGON, context)
+        if source is None:
+            raise QgsProcessingException("Invalid bounding polygon.")
+        try:
+            polygon_geom = polygon_from_features(
+                source.getFeatures(), source.sourceCrs(), reference_layer.crs(), context.transformContext())
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+
+        area_km2 = get_area_in_square_km(polygon_geom, reference_layer.crs().authid())
+        if area_km2 > MAX_POLYGON_AREA:
+            raise QgsProcessingException(
+                f"Polygon area ({area_km2:.2f} km²) exceeds the maximum allowed ({MAX_POLYGON_AREA:,.0f} km²).")
+
+        output_dir = self.parameterAsString(parameters, self.OUTPUT_FOLDER, context)
+        os.makedirs(output_dir, exist_ok=True)
+        try:
+            options = GeorefOptions(
+                output_mode=self.OUTPUT_MODES[self.parameterAsEnum(parameters, self.OUTPUT_MODE, context)],
+                output_resolution=self.parameterAsDouble(parameters, self.RESOLUTION, context) or None,
+                warp_memory_mb=self.parameterAsDouble(parameters, self.WARP_MEMORY, context),
+                compression=OUTPUT_COMPRESSIONS[self.parameterAsEnum(parameters, self.COMPRESSION, context)],
+                cog=self.parameterAsBool(parameters, self.COG, context),
+                feature_preset=PRESETS[self.parameterAsEnum(parameters, self.PRESET, context)],
+                nfeatures=self.parameterAsInt(parameters, self.NFEATURES, context) or None,
+                descriptor_storage=DESCRIPTOR_STORAGES[
+                    self.parameterAsEnum(parameters, self.DESCRIPTOR_STORAGE, context)],
+                estimator=list(ESTIMATORS)[self.parameterAsEnum(parameters, self.ESTIMATOR, context)],
+                confidence=self.parameterAsDouble(parameters, self.CONFIDENCE, context),
+                max_iterations=self.parameterAsInt(parameters, self.MAX_ITERATIONS, context),
+                precheck=self.parameterAsBool(parameters, self.PRECHECK, context),
+                precheck_min_inliers=self.parameterAsInt(parameters, self.PRECHECK_MIN_INLIERS, context),
+                precheck_min_ratio=self.parameterAsDouble(parameters, self.PRECHECK_MIN_RATIO, context),
+                prefetch_frames=self.parameterAsInt(parameters, self.PREFETCH, context))
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+        output_paths = [default_output_path(p, output_dir, options.output_extension) for p in image_paths]
+        feedback.pushInfo(f"Georeferencing {len(image_paths)} image(s) into {output_dir}")
+
+        stats_path = self.parameterAsFileOutput(parameters, self.STATS, context)
+        stats_rows = []
+
+        def report_result(image_path, success, message, output_path, stats):
+            if success:
+                feedback.pushInfo(f"OK     {os.path.basename(image_path)} -> {output_path}")
+            else:
+                feedback.reportError(f"FAILED {os.path.basename(image_path)}: {message}")
+            stats_rows.append(report_row(image_path, success, message, output_path, stats))
+
+        successful, failed = batch_georeference(
+            image_paths,
+            polygon_geom,
+            reference_layer,
+            output_paths=output_paths,
+            max_workers=self.parameterAsInt(parameters, self.WORKERS, context),
+            progress_callback=lambda percentage, message: feedback.setProgress(percentage),
+            result_callback=report_result,
+            is_canceled=feedback.isCanceled,
+            use_processes=self.parameterAsBool(parameters, self.USE_PROCESSES, context),
+            options=options,
+            resume=self.parameterAsBool(parameters, self.RESUME, context),
+        )
+
+        feedback.pushInfo(f"Finished: {len(successful)} succeeded, {len(failed)} failed.")
+        results = {
+            self.OUTPUT_FOLDER: output_dir,
+            self.SUCCEEDED: len(successful),
+            self.FAILED: len(failed),
+        }
+        if stats_path:
+            write_report(stats_rows, stats_path)
+            results[self.STATS] = stats_path
+        return results
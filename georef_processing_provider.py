@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Processing provider exposing GeorefAuto algorithms to the toolbox and qgis_process."""
+
+import os
+
+from qgis.core import QgsProcessingProvider
+from qgis.PyQt.QtGui import QIcon
+
+from .georef_processing_algorithm import BatchGeoreferenceAlgorithm
+
+
+class GeorefAutoProvider(QgsProcessingProvider):
+    """Provider for the GeorefAuto Processing algorithms."""
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(BatchGeoreferenceAlgorithm())
+
+    def id(self):
+        return "georef_auto"
+
+    def name(self):
+        return "GeorefAuto"
+
+    def icon(self):
+        return QIcon(os.path.join(os.path.dirname(__file__), "icon.png"))
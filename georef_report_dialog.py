@@ -1,38 +1,122 @@
 # -*- coding: utf-8 -*-
 
-from qgis.PyQt.QtWidgets import QDialog, QListWidgetItem
+from qgis.PyQt.QtWidgets import QDialog, QFileDialog, QHeaderView, QListWidgetItem, QMessageBox, QTableWidgetItem
+from qgis.PyQt.QtCore import Qt, pyqtSignal
 from .georef_report_dialog_base import Ui_GeorefReportDialog
+from .stage_metrics import REPORT_COLUMNS, report_row, write_report
 import os
 
 class GeorefReportDialog(QDialog, Ui_GeorefReportDialog):
-    """Dialog to display the results of the batch georeferencing process."""
-    def __init__(self, successful_outputs, failed_images, parent=None):
+    """Dialog to display the results of the batch georeferencing process.
+
+    Results can be given up front (finished batch) or streamed in with
+    add_result() while a background task is running. Streamed results also
+    fill the stage statistics table (time per stage, memory, counts), which
+    can be exported as CSV or JSON.
+    """
+
+    cancel_requested = pyqtSignal()
+
+    def __init__(self, successful_outputs=None, failed_images=None, parent=None):
         """Constructor."""
         super(GeorefReportDialog, self).__init__(parent)
         self.setupUi(self)
-        
-        self.populate_lists(successful_outputs, failed_images)
-        
+
+        self.successful_count = 0
+        self.failed_count = 0
+        self.stats_rows = []
+        self.listSuccess.clear()
+        self.listFailed.clear()
+        self.tableStats.setColumnCount(len(REPORT_COLUMNS))
+        self.tableStats.setHorizontalHeaderLabels([header for _, header in REPORT_COLUMNS])
+        self.tableStats.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+
         # Connect signals
         self.buttonBox.accepted.connect(self.accept)
+        self.btnCancelBatch.clicked.connect(self.request_cancel)
+        self.btnExportStats.clicked.connect(self.export_stats)
+
+        if successful_outputs is not None or failed_images is not None:
+            self.populate_lists(successful_outputs or [], failed_images or [])
+            self.finish()
 
     def populate_lists(self, successful_outputs, failed_images):
         """Populate the success and failure list widgets."""
-        self.listSuccess.clear()
-        self.listFailed.clear()
-        
-        if successful_outputs:
-            for output_path in successful_outputs:
-                item = QListWidgetItem(f"✅ {os.path.basename(output_path)}")
-                self.listSuccess.addItem(item)
+        for output_path in successful_outputs:
+            self.add_success(output_path)
+        for img_name, message in failed_images:
+            self.add_failure(img_name, message)
+
+    def add_success(self, output_path):
+        """Append a successfully georeferenced output to the list."""
+        self.listSuccess.addItem(QListWidgetItem(f"✅ {os.path.basename(output_path)}"))
+        self.successful_count += 1
+
+    def add_failure(self, img_name, message):
+        """Append a failed image, with the reason, to the list."""
+        self.listFailed.addItem(QListWidgetItem(f"❌ {img_name}: {message}"))
+        self.failed_count += 1
+
+    def add_result(self, image_path, success, message, output_path, stats=None):
+        """Slot for BatchGeoreferenceTask.image_finished."""
+        if success:
+            self.add_success(output_path)
         else:
+            self.add_failure(os.path.basename(image_path), message)
+        self.add_stats(report_row(image_path, success, message, output_path, stats))
+
+    def add_stats(self, row):
+        """Append a row (stage_metrics.report_row) to the stage statistics table."""
+        self.stats_rows.append(row)
+        self.tableStats.setSortingEnabled(False)  # Rows inserted while sorted land in the wrong place
+        index = self.tableStats.rowCount()
+        self.tableStats.insertRow(index)
+        for column, (key, _) in enumerate(REPORT_COLUMNS):
+            value = row.get(key)
+            item = QTableWidgetItem()
+            if value is not None:
+                item.setData(Qt.DisplayRole, value)  # Numbers sort as numbers
+            self.tableStats.setItem(index, column, item)
+        self.tableStats.setSortingEnabled(True)
+        self.btnExportStats.setEnabled(True)
+
+    def export_stats(self):
+        """Save the stage statistics table as CSV or JSON."""
+        path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Export Stage Statistics", "georef_stats.csv", "CSV files (*.csv);;JSON files (*.json)")
+        if not path:
+            return
+        if not path.lower().endswith((".csv", ".json")):
+            path += ".json" if "json" in selected_filter else ".csv"
+        try:
+            write_report(self.stats_rows, path)
+        except OSError as e:
+            QMessageBox.warning(self, "Export Stage Statistics", f"Could not save {path}: {e}")
+
+    def set_progress(self, percentage):
+        """Slot for QgsTask.progressChanged."""
+        self.progressBar.setValue(int(percentage))
+
+    def set_status(self, message):
+        """Slot for BatchGeoreferenceTask.status_changed."""
+        self.labelStatus.setText(message)
+
+    def request_cancel(self):
+        """Ask the running batch to stop; images already in progress stop at their next stage."""
+        self.btnCancelBatch.setEnabled(False)
+        self.labelStatus.setText("Canceling...")
+        self.cancel_requested.emit()
+
+    def finish(self, canceled=False):
+        """Mark the batch as finished and add placeholders to empty lists."""
+        self.progressBar.setValue(100)
+        self.btnCancelBatch.setVisible(False)
+        self.labelStatus.setText(
+            f"{'Canceled' if canceled else 'Finished'}: "
+            f"{self.successful_count} succeeded, {self.failed_count} failed."
+        )
+        if self.successful_count == 0:
             self.listSuccess.addItem("No images were successfully georeferenced.")
-            
-        if failed_images:
-            for img_name in failed_images:
-                item = QListWidgetItem(f"❌ {img_name}")
-                self.listFailed.addItem(item)
-        else:
+        if self.failed_count == 0:
             self.listFailed.addItem("No images failed during the process.")
             self.labelFailedInfo.setVisible(False) # Hide info label if no failures
-
@@ -14,7 +14,7 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 class Ui_GeorefReportDialog(object):
     def setupUi(self, GeorefReportDialog):
         GeorefReportDialog.setObjectName("GeorefReportDialog")
-        GeorefReportDialog.resize(600, 400)
+        GeorefReportDialog.resize(900, 600)
         self.verticalLayout = QtWidgets.QVBoxLayout(GeorefReportDialog)
         self.verticalLayout.setObjectName("verticalLayout")
         self.labelTitle = QtWidgets.QLabel(GeorefReportDialog)
@@ -26,6 +26,20 @@ class Ui_GeorefReportDialog(object):
         self.labelTitle.setAlignment(QtCore.Qt.AlignCenter)
         self.labelTitle.setObjectName("labelTitle")
         self.verticalLayout.addWidget(self.labelTitle)
+        self.labelStatus = QtWidgets.QLabel(GeorefReportDialog)
+        self.labelStatus.setWordWrap(True)
+        self.labelStatus.setObjectName("labelStatus")
+        self.verticalLayout.addWidget(self.labelStatus)
+        self.horizontalLayoutProgress = QtWidgets.QHBoxLayout()
+        self.horizontalLayoutProgress.setObjectName("horizontalLayoutProgress")
+        self.progressBar = QtWidgets.QProgressBar(GeorefReportDialog)
+        self.progressBar.setProperty("value", 0)
+        self.progressBar.setObjectName("progressBar")
+        self.horizontalLayoutProgress.addWidget(self.progressBar)
+        self.btnCancelBatch = QtWidgets.QPushButton(GeorefReportDialog)
+        self.btnCancelBatch.setObjectName("btnCancelBatch")
+        self.horizontalLayoutProgress.addWidget(self.btnCancelBatch)
+        self.verticalLayout.addLayout(self.horizontalLayoutProgress)
         self.labelSuccess = QtWidgets.QLabel(GeorefReportDialog)
         self.labelSuccess.setObjectName("labelSuccess")
         self.verticalLayout.addWidget(self.labelSuccess)
@@ -42,6 +56,25 @@ class Ui_GeorefReportDialog(object):
         self.labelFailedInfo.setWordWrap(True)
         self.labelFailedInfo.setObjectName("labelFailedInfo")
         self.verticalLayout.addWidget(self.labelFailedInfo)
+        self.horizontalLayoutStats = QtWidgets.QHBoxLayout()
+        self.horizontalLayoutStats.setObjectName("horizontalLayoutStats")
+        self.labelStats = QtWidgets.QLabel(GeorefReportDialog)
+        self.labelStats.setObjectName("labelStats")
+        self.horizontalLayoutStats.addWidget(self.labelStats)
+        spacerItem = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayoutStats.addItem(spacerItem)
+        self.btnExportStats = QtWidgets.QPushButton(GeorefReportDialog)
+        self.btnExportStats.setEnabled(False)
+        self.btnExportStats.setObjectName("btnExportStats")
+        self.horizontalLayoutStats.addWidget(self.btnExportStats)
+        self.verticalLayout.addLayout(self.horizontalLayoutStats)
+        self.tableStats = QtWidgets.QTableWidget(GeorefReportDialog)
+        self.tableStats.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.tableStats.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.tableStats.setObjectName("tableStats")
+        self.tableStats.setColumnCount(0)
+        self.tableStats.setRowCount(0)
+        self.verticalLayout.addWidget(self.tableStats)
         self.buttonBox = QtWidgets.QDialogButtonBox(GeorefReportDialog)
         self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
         self.buttonBox.setStandardButtons(QtWidgets.QDialogButtonBox.Ok)
@@ -57,6 +90,11 @@ class Ui_GeorefReportDialog(object):
         _translate = QtCore.QCoreApplication.translate
         GeorefReportDialog.setWindowTitle(_translate("GeorefReportDialog", "Georeferencing Report"))
         self.labelTitle.setText(_translate("GeorefReportDialog", "Georeferencing Process Report"))
+        self.labelStatus.setText(_translate("GeorefReportDialog", "Preparing reference area..."))
+        self.btnCancelBatch.setText(_translate("GeorefReportDialog", "Cancel"))
         self.labelSuccess.setText(_translate("GeorefReportDialog", "Successfully Georeferenced Images:"))
         self.labelFailed.setText(_translate("GeorefReportDialog", "Failed Images:"))
         self.labelFailedInfo.setText(_translate("GeorefReportDialog", "For failed images, please review the bounding polygon and reference layer."))
+        self.labelStats.setText(_translate("GeorefReportDialog", "Stage Statistics:"))
+        self.btnExportStats.setText(_translate("GeorefReportDialog", "Export..."))
+        self.tableStats.setSortingEnabled(True)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Background QgsTask that runs batch georeferencing off the GUI thread."""
+
+import logging
+import traceback
+
+from qgis.core import QgsTask, QgsGeometry
+from qgis.PyQt.QtCore import pyqtSignal
+
+from .georeferencing import batch_georeference, DEFAULT_MAX_WORKERS
+
+
+class BatchGeoreferenceTask(QgsTask):
+    """Runs batch_georeference() in a QgsTaskManager thread and streams per-image results.
+
+    Signals are emitted from worker threads; Qt queues them to receivers
+    living in the GUI thread (e.g. GeorefReportDialog).
+    """
+
+    image_finished = pyqtSignal(str, bool, str, str, dict)  # input path, success, message, output path, stage statistics
+    status_changed = pyqtSignal(str)
+
+    def __init__(self, image_paths, polygon_geom, reference_layer, output_paths,
+                 max_workers=DEFAULT_MAX_WORKERS, use_processes=False, options=None, resume=True):
+        """Constructor. Must be called from the GUI thread.
+
+        Args:
+            image_paths: Input images
+            polygon_geom: Bounding polygon, in the reference layer CRS
+            reference_layer: Reference map layer
+            output_paths: Output GeoTIFF path for each input image
+            max_workers: Number of images processed in parallel
+            use_processes: Run the workers as separate processes instead of threads
+            options: GeorefOptions for the outputs (defaults to a warped GeoTIFF)
+            resume: Skip the images the job manifest of the output directory
+                records as done with the same inputs and parameters
+        """
+        super().__init__("Automatic Georeferencing", QgsTask.CanCancel)
+        self.image_paths = list(image_paths)
+        self.output_paths = list(output_paths)
+        # Own copies: the task thread must not touch objects used by the GUI
+        self.polygon_geom = QgsGeometry(polygon_geom)
+        self.reference_layer = reference_layer.clone()
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.options = options
+        self.resume = resume
+
+        self.successful = []
+        self.failed = []
+        self.exception = None
+
+    def run(self):
+        """Process the batch (task thread). Returns False if canceled or on error."""
+        try:
+            self.successful, self.failed = batch_georeference(
+                self.image_paths,
+                self.polygon_geom,
+                self.reference_layer,
+                output_paths=self.output_paths,
+                max_workers=self.max_workers,
+                progress_callback=self._report_progress,
+                result_callback=self.image_finished.emit,
+                is_canceled=self.isCanceled,
+                use_processes=self.use_processes,
+                options=self.options,
+                resume=self.resume,
+            )
+        except Exception as e:
+            self.exception = e
+            logging.error(f"Unexpected error in batch georeferencing task: {e}")
+            logging.error(traceback.format_exc())
+            return False
+        return not self.isCanceled()
+
+    def _report_progress(self, percentage, message):
+        self.setProgress(percentage)
+        self.status_changed.emit(message)
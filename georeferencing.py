@@ -1,29 +1,47 @@
 # -*- coding: utf-8 -*-
-"""Module for georeferencing logic, merging georef_auto2's working method with georef_auto_new's structure."""
+"""QGIS adapters for the georeferencing core (georef_core).
+
+Renders reference layers, converts QgsGeometry/layers into the plain
+bounds, CRS strings and callables the core works with, and keeps the
+historical entry points (georeference_image, batch_georeference).
+"""
 
 import cv2
 import numpy as np
-import rasterio
-import rasterio.warp # Adicionado
-import rasterio.transform # Adicionado
 import os
-from qgis.PyQt.QtWidgets import QMessageBox, QProgressDialog, QApplication
 from qgis.core import (
     QgsRectangle, QgsMapSettings, QgsMapRendererCustomPainterJob,
     QgsCoordinateReferenceSystem, QgsDistanceArea, QgsCoordinateTransform,
-    QgsProject, QgsUnitTypes, QgsGeometry, QgsPointXY, QgsMapLayerType
+    QgsProject, QgsGeometry, QgsMapLayerType,
+    QgsApplication, QgsMapLayerStyle
 )
-from PyQt5.QtGui import QImage, QPainter, QColor
+from PyQt5.QtGui import QImage, QPainter
 from PyQt5.QtCore import QSize, Qt
 import traceback
 import logging
-from typing import Tuple, List, Optional, Dict
+import hashlib
+from typing import Callable, Tuple, List, Optional
+from .feature_backends import (
+    FeatureBackend, RootSiftFeatures, PRESETS, PRESET_ACCURATE, PRESET_BALANCED, PRESET_FAST, DESCRIPTOR_STORAGES
+)
+from .job_manifest import JobManifest, default_manifest_path, parameters_fingerprint
+from .reference_cache import ReferenceCache, TileCacheKey
+from .reference_raster import CACHE_VERSION as RASTER_CACHE_VERSION, RasterTileReader, open_reference_raster
+from .reference_pyramid import ReferenceContext
+from .stage_metrics import report_row, write_report
+from . import georef_core
+from .georef_core import (
+    RENDER_WIDTH_PX, DEFAULT_MAX_WORKERS, DEFAULT_WARP_MEMORY_MB, DEFAULT_PREFETCH_FRAMES,
+    OUTPUT_MODE_WARP, OUTPUT_MODE_VRT, OUTPUT_COMPRESSIONS, ESTIMATORS, DEFAULT_CONFIDENCE, DEFAULT_MAX_ITERATIONS,
+    MIN_FEATURES, PRECHECK_MIN_INLIERS, PRECHECK_MIN_RATIO, GeorefOptions, expand_image_inputs, default_output_path
+)
 
 # Configurações
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-MAX_POLYGON_AREA = 3050.0  # km²
-MIN_FEATURES = 4 # Minimum matches for homography
-RENDER_WIDTH_PX = 2000 # Width for rendering reference image
+MAX_POLYGON_AREA = 10000.0  # km² (the tiled reference pyramid keeps memory bounded)
+REFERENCE_CACHE_SUBDIR = os.path.join("cache", "georef_auto") # Relative to the QGIS profile directory
+
+_reference_cache = None
 
 # --- Funções Auxiliares ---
 
@@ -66,361 +84,289 @@ def get_area_in_square_km(geometry: QgsGeometry, crs_authid: str) -> float:
         logging.error(f"Erro no cálculo de área: {e}")
         return 0.0
 
-# --- Lógica de Georreferenciamento ---
-
-def root_sift_detect_and_compute(image_gray):
-    """Detect SIFT features and compute RootSIFT descriptors."""
-    try:
-        sift = cv2.SIFT_create() # Requires opencv-contrib-python
-        keypoints, descriptors = sift.detectAndCompute(image_gray, None)
-        if descriptors is None or len(descriptors) == 0:
-            logging.warning("RootSIFT: Nenhum descritor encontrado.")
-            return keypoints, None
-        # Apply RootSIFT normalization
-        descriptors /= (descriptors.sum(axis=1, keepdims=True) + 1e-7)
-        descriptors = np.sqrt(descriptors)
-        logging.info(f"RootSIFT: {len(keypoints)} keypoints detectados.")
-        return keypoints, descriptors
-    except Exception as e:
-        logging.error(f"Erro no RootSIFT: {e}")
-        # Check if SIFT is available (common issue if opencv-contrib-python is missing)
-        if not hasattr(cv2, 'SIFT_create'):
-             logging.error("cv2.SIFT_create() não encontrado. Verifique se 'opencv-contrib-python' está instalado.")
-        raise
-
-def render_reference_image(layer, polygon_geom, target_width_px=RENDER_WIDTH_PX) -> Tuple[Optional[np.ndarray], Optional[QgsRectangle], Optional[str]]:
-    """Renders the reference layer section defined by the polygon to an image array."""
+def polygon_from_features(features, source_crs: QgsCoordinateReferenceSystem,
+                          target_crs: QgsCoordinateReferenceSystem, transform_context=None) -> QgsGeometry:
+    """União das geometrias das feições, reprojetada para o CRS da camada de referência."""
+    geometries = [f.geometry() for f in features if f.hasGeometry() and not f.geometry().isEmpty()]
+    if not geometries:
+        raise ValueError("Nenhuma geometria de polígono encontrada.")
+    geometry = QgsGeometry.unaryUnion(geometries)
+    if source_crs != target_crs:
+        if transform_context is None:
+            transform_context = QgsProject.instance().transformContext()
+        geometry.transform(QgsCoordinateTransform(source_crs, target_crs, transform_context))
+    return geometry
+
+# --- Renderização da Referência ---
+
+def render_layer_extent(layer, extent: QgsRectangle, width_px: int, height_px: int) -> np.ndarray:
+    """Renders `extent` of the layer (in the layer CRS) to a BGR array of `width_px` x `height_px`."""
+    map_settings = QgsMapSettings()
+    map_settings.setLayers([layer])
+    map_settings.setExtent(extent)
+    map_settings.setOutputSize(QSize(width_px, height_px))
+    # Use layer CRS for rendering
+    map_settings.setDestinationCrs(layer.crs())
+    # map_settings.setOutputDpi(96) # DPI might not be critical here
+
+    # Create QImage and QPainter
+    img = QImage(width_px, height_px, QImage.Format_ARGB32_Premultiplied)
+    img.fill(Qt.transparent) # Use transparent background
+    painter = QPainter(img)
+
+    # Render using QgsMapRendererCustomPainterJob
+    job = QgsMapRendererCustomPainterJob(map_settings, painter)
+    job.start()
+    job.waitForFinished() # Wait for rendering to complete
+    painter.end()
+
+    # Convert QImage to NumPy array (handle potential format differences)
+    img_format = img.format()
+    if img_format == QImage.Format_ARGB32_Premultiplied or img_format == QImage.Format_ARGB32:
+        ptr = img.constBits()
+        ptr.setsize(img.sizeInBytes())
+        arr = np.array(ptr).reshape(height_px, width_px, 4) # BGRA
+        # Convert BGRA to BGR (standard for OpenCV)
+        rgb = arr[..., :3][..., ::-1] # Select BGR, reverse order
+    elif img_format == QImage.Format_RGB32:
+        ptr = img.constBits()
+        ptr.setsize(img.sizeInBytes())
+        arr = np.array(ptr).reshape(height_px, width_px, 4) # BGRA (or RGBA? depends on system endianness)
+        rgb = arr[..., :3][..., ::-1] # Assume BGRA, convert to BGR
+    elif img_format == QImage.Format_RGB888:
+        ptr = img.constBits()
+        ptr.setsize(img.sizeInBytes())
+        arr = np.array(ptr).reshape(height_px, width_px, 3) # RGB
+        rgb = arr[..., ::-1] # Convert RGB to BGR
+    else:
+        # Fallback: convert to a known format first
+        logging.warning(f"Formato QImage não suportado diretamente: {img_format}. Tentando conversão.")
+        img = img.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+        ptr = img.constBits()
+        ptr.setsize(img.sizeInBytes())
+        arr = np.array(ptr).reshape(height_px, width_px, 4) # BGRA
+        rgb = arr[..., :3][..., ::-1] # Select BGR, reverse order
+
+    if rgb is None or rgb.size == 0:
+        raise ValueError("Falha ao converter imagem renderizada para array NumPy.")
+    return rgb
+
+def render_reference_tile(layer, tile_bounds: Tuple[float, float, float, float],
+                          width_px: int, height_px: int) -> Optional[np.ndarray]:
+    """Renders one tile of the reference pyramid to a grayscale array."""
     try:
-        if not layer or not layer.isValid():
-            raise ValueError("Camada de referência inválida")
-        if not polygon_geom or polygon_geom.isEmpty():
-            raise ValueError("Geometria do polígono inválida")
-
-        bounds = polygon_geom.boundingBox()
-        if bounds.isEmpty() or bounds.width() == 0 or bounds.height() == 0:
-             raise ValueError("Extensão (bounding box) do polígono inválida ou com dimensão zero.")
-
-        # Calculate height based on aspect ratio
-        target_height_px = int((bounds.height() / bounds.width()) * target_width_px)
-        if target_height_px <= 0:
-             raise ValueError(f"Altura calculada para renderização é inválida: {target_height_px}")
-
-        logging.info(f"Renderizando área de referência: {bounds.toString()} para {target_width_px}x{target_height_px} pixels.")
-
-        map_settings = QgsMapSettings()
-        map_settings.setLayers([layer])
-        map_settings.setExtent(bounds)
-        map_settings.setOutputSize(QSize(target_width_px, target_height_px))
-        # Use layer CRS for rendering
-        map_settings.setDestinationCrs(layer.crs())
-        # map_settings.setOutputDpi(96) # DPI might not be critical here
-
-        # Create QImage and QPainter
-        img = QImage(target_width_px, target_height_px, QImage.Format_ARGB32_Premultiplied)
-        img.fill(Qt.transparent) # Use transparent background
-        painter = QPainter(img)
-
-        # Render using QgsMapRendererCustomPainterJob
-        job = QgsMapRendererCustomPainterJob(map_settings, painter)
-        job.start()
-        job.waitForFinished() # Wait for rendering to complete
-        painter.end()
-
-        # Convert QImage to NumPy array (handle potential format differences)
-        img_format = img.format()
-        if img_format == QImage.Format_ARGB32_Premultiplied or img_format == QImage.Format_ARGB32:
-            ptr = img.constBits()
-            ptr.setsize(img.sizeInBytes())
-            arr = np.array(ptr).reshape(target_height_px, target_width_px, 4) # BGRA
-            # Convert BGRA to BGR (standard for OpenCV)
-            rgb = arr[..., :3][..., ::-1] # Select BGR, reverse order
-        elif img_format == QImage.Format_RGB32:
-            ptr = img.constBits()
-            ptr.setsize(img.sizeInBytes())
-            arr = np.array(ptr).reshape(target_height_px, target_width_px, 4) # BGRA (or RGBA? depends on system endianness)
-            rgb = arr[..., :3][..., ::-1] # Assume BGRA, convert to BGR
-        elif img_format == QImage.Format_RGB888:
-            ptr = img.constBits()
-            ptr.setsize(img.sizeInBytes())
-            arr = np.array(ptr).reshape(target_height_px, target_width_px, 3) # RGB
-            rgb = arr[..., ::-1] # Convert RGB to BGR
-        else:
-            # Fallback: convert to a known format first
-            logging.warning(f"Formato QImage não suportado diretamente: {img_format}. Tentando conversão.")
-            img = img.convertToFormat(QImage.Format_ARGB32_Premultiplied)
-            ptr = img.constBits()
-            ptr.setsize(img.sizeInBytes())
-            arr = np.array(ptr).reshape(target_height_px, target_width_px, 4) # BGRA
-            rgb = arr[..., :3][..., ::-1] # Select BGR, reverse order
-
-        if rgb is None or rgb.size == 0:
-            raise ValueError("Falha ao converter imagem renderizada para array NumPy.")
-
-        epsg_code = layer.crs().authid().replace("EPSG:", "")
-        logging.info(f"Renderização da referência concluída. CRS: EPSG:{epsg_code}")
-        return rgb, bounds, epsg_code
-
+        rgb = render_layer_extent(layer, QgsRectangle(*tile_bounds), width_px, height_px)
+        return cv2.cvtColor(np.ascontiguousarray(rgb), cv2.COLOR_BGR2GRAY)
     except Exception as e:
-        logging.error(f"Erro ao renderizar imagem de referência: {e}")
+        logging.error(f"Erro ao renderizar tile de referência: {e}")
         logging.error(traceback.format_exc())
-        return None, None, None
+        return None
+
+def layer_native_pixel_size(layer) -> Optional[float]:
+    """Native pixel size (layer CRS units) of file-backed rasters; None for WMS/XYZ/vector layers."""
+    if layer.type() == QgsMapLayerType.RasterLayer and layer.providerType() == "gdal":
+        size = layer.rasterUnitsPerPixelX()
+        if size and size > 0:
+            return size
+    return None
+
+def layer_raster_reader(layer) -> Optional[RasterTileReader]:
+    """Leitor rasterio direto para camadas raster GDAL (GeoTIFF, VRT...); None para as demais.
+
+    WMS/XYZ, camadas vetoriais e rasters cujo CRS foi alterado no QGIS
+    continuam usando o renderizador do QGIS.
+    """
+    if layer.type() != QgsMapLayerType.RasterLayer or layer.providerType() != "gdal":
+        return None
+    return open_reference_raster(layer.source(), layer_crs_string(layer))
+
+# --- Cache de Referência ---
+
+def get_reference_cache() -> Optional[ReferenceCache]:
+    """Retorna o cache em disco do perfil QGIS atual (ou None se indisponível)."""
+    global _reference_cache
+    if _reference_cache is None:
+        cache_dir = os.path.join(QgsApplication.qgisSettingsDirPath(), REFERENCE_CACHE_SUBDIR)
+        try:
+            _reference_cache = ReferenceCache(cache_dir)
+        except OSError as e:
+            logging.warning(f"Cache de referência indisponível em {cache_dir}: {e}")
+            return None
+    return _reference_cache
+
+def layer_style_fingerprint(layer) -> str:
+    """Hash do estilo da camada, para que mudanças de simbologia invalidem o cache."""
+    style = QgsMapLayerStyle()
+    style.readFromLayer(layer)
+    return hashlib.sha1(style.xmlData().encode("utf-8")).hexdigest()
+
+def reference_cache_key(layer, bbox: Tuple[float, float, float, float], width_px: int,
+                        style_fingerprint: Optional[str] = None) -> str:
+    """Chave do cache para a renderização de `layer` na extensão `bbox` (xmin, ymin, xmax, ymax)."""
+    if style_fingerprint is None:
+        style_fingerprint = layer_style_fingerprint(layer)
+    return ReferenceCache.make_key(layer.source(), layer.crs().authid(), bbox,
+                                   width_px, style_fingerprint)
+
+def invalidate_reference_cache(layer=None) -> int:
+    """Invalida as entradas de `layer` no cache (ou todo o cache se `layer` for None)."""
+    cache = get_reference_cache()
+    if cache is None:
+        return 0
+    if layer is None:
+        return cache.clear()
+    return cache.invalidate(layer.source())
+
+def layer_crs_string(layer) -> str:
+    """CRS da camada como texto aceito pelo rasterio: o authid EPSG ou, na falta dele, WKT."""
+    crs = layer.crs()
+    authid = crs.authid()
+    return authid if authid.upper().startswith("EPSG:") else crs.toWkt()
+
+def build_reference_context(layer, polygon_geom: QgsGeometry,
+                            target_width_px=RENDER_WIDTH_PX,
+                            use_cache: bool = True,
+                            features: Optional[FeatureBackend] = None) -> ReferenceContext:
+    """Monta a pirâmide de referência em tiles e caracteriza o nível de visão geral.
+
+    Os níveis mais finos (até a resolução nativa da camada) são renderizados e
+    caracterizados sob demanda, tile a tile, e lidos do cache em disco quando a
+    mesma camada, estilo, extensão, resolução e backend de características
+    (RootSIFT por padrão) já foram processados.
+    """
+    if not layer or not layer.isValid():
+        raise ValueError("Camada de referência inválida")
+    if not polygon_geom or polygon_geom.isEmpty():
+        raise ValueError("Geometria do polígono inválida")
+
+    bounds = polygon_geom.boundingBox()
+    if bounds.isEmpty() or bounds.width() == 0 or bounds.height() == 0:
+        raise ValueError("Extensão (bounding box) do polígono inválida ou com dimensão zero.")
+    bbox = (bounds.xMinimum(), bounds.yMinimum(), bounds.xMaximum(), bounds.yMaximum())
+
+    # Rasters em arquivo são lidos diretamente com rasterio; o renderizador do QGIS fica como alternativa
+    reader = layer_raster_reader(layer)
+    if reader is not None:
+        logging.info("Referência lida diretamente do arquivo com rasterio (sem o renderizador do QGIS).")
+        render_tile, native_pixel_size = reader, reader.pixel_size
+    else:
+        render_tile = lambda tile_bbox, w, h: render_reference_tile(layer, tile_bbox, w, h)
+        native_pixel_size = layer_native_pixel_size(layer)
+
+    features = features or RootSiftFeatures()
+    cache = get_reference_cache() if use_cache else None
+    cache_key = None
+    if cache is not None:
+        version = RASTER_CACHE_VERSION if reader is not None else layer_style_fingerprint(layer)
+        cache_key = TileCacheKey(layer.source(), layer.crs().authid(), f"{version}|{features.cache_tag}")
+
+    return georef_core.build_reference_context(
+        bbox, layer_crs_string(layer),
+        render_tile=render_tile,
+        native_pixel_size=native_pixel_size,
+        target_width_px=target_width_px,
+        cache=cache, cache_key=cache_key,
+        features=features,
+    )
 
 def georeference_image(image_path: str, polygon_geom: QgsGeometry,
                       reference_layer, output_path: str,
-                      progress_callback=None) -> Tuple[bool, str]:
-    """Função principal de georreferenciamento usando a lógica da versão antiga."""
-    try:
+                      progress_callback=None,
+                      reference_context: Optional[ReferenceContext] = None,
+                      options: Optional[GeorefOptions] = None) -> Tuple[bool, str]:
+    """Função principal de georreferenciamento de uma imagem.
+
+    Se `reference_context` for informado, a renderização e a extração de
+    características da referência são reaproveitadas em vez de refeitas.
+    """
+    if reference_context is None:
         if progress_callback:
             progress_callback(5, "Renderizando área de referência...")
+        try:
+            reference_context = build_reference_context(
+                reference_layer, polygon_geom, features=(options or GeorefOptions()).feature_backend())
+        except Exception as e:
+            logging.error(f"Erro ao construir o contexto de referência: {e}")
+            logging.error(traceback.format_exc())
+            return False, str(e)
+    return georef_core.georeference_file(image_path, reference_context, output_path, progress_callback, options)
+
+# --- Função de Lote ---
+
+def open_job_manifest(reference_layer, polygon_geom: QgsGeometry, output_paths: List[str],
+                      options: GeorefOptions) -> Optional[JobManifest]:
+    """Manifesto do lote no diretório de saída, com a impressão digital dos parâmetros e da referência.
+
+    A referência é identificada pela fonte (e sua data de modificação),
+    CRS, estilo e extensão do polígono. Devolve None se a camada ou o
+    polígono forem inválidos (o erro é informado ao montar a referência).
+    """
+    if not output_paths or not reference_layer or not reference_layer.isValid():
+        return None
+    if not polygon_geom or polygon_geom.isEmpty():
+        return None
+    bounds = polygon_geom.boundingBox()
+    bbox = (bounds.xMinimum(), bounds.yMinimum(), bounds.xMaximum(), bounds.yMaximum())
+    reference = reference_cache_key(reference_layer, bbox, RENDER_WIDTH_PX)
+    return JobManifest(default_manifest_path(output_paths), parameters_fingerprint(options, reference))
 
-        # 1. Renderizar imagem de referência
-        img_ref_crop, bounds_crop, epsg = render_reference_image(reference_layer, polygon_geom)
-        if img_ref_crop is None or bounds_crop is None or epsg is None:
-            raise ValueError("Falha ao renderizar a imagem de referência.")
-
-        if progress_callback:
-            progress_callback(15, "Carregando imagem de entrada...")
-
-        # 2. Carregar imagem de entrada
-        img_original_color = cv2.imread(image_path)
-        if img_original_color is None:
-            raise ValueError(f"Não foi possível carregar a imagem não georreferenciada: {image_path}")
-
-        # 3. Converter para escala de cinza
-        img_original_gray = cv2.cvtColor(img_original_color, cv2.COLOR_BGR2GRAY)
-        img_ref_gray = cv2.cvtColor(img_ref_crop, cv2.COLOR_BGR2GRAY)
-
-        if progress_callback:
-            progress_callback(25, "Detectando características (RootSIFT)...")
-
-        # 4. Detectar características e descritores (RootSIFT)
-        kp1, desc1 = root_sift_detect_and_compute(img_original_gray)
-        kp2, desc2 = root_sift_detect_and_compute(img_ref_gray)
-
-        if desc1 is None or desc2 is None or len(kp1) < MIN_FEATURES or len(kp2) < MIN_FEATURES:
-            raise ValueError("Não foi possível extrair descritores suficientes com RootSIFT em uma ou ambas as imagens.")
-
-        if progress_callback:
-            progress_callback(50, "Correspondendo características (FLANN)...")
-
-        # 5. Corresponder características (FLANN)
-        index_params = dict(algorithm=1, trees=5)
-        search_params = dict(checks=50)
-        flann = cv2.FlannBasedMatcher(index_params, search_params)
-        # Ensure descriptors are float32
-        desc1 = np.float32(desc1)
-        desc2 = np.float32(desc2)
-        raw_matches = flann.knnMatch(desc1, desc2, k=2)
-
-        # Filter matches using Lowe's ratio test
-        good_matches = []
-        for m, n in raw_matches:
-            if m.distance < 0.75 * n.distance:
-                good_matches.append(m)
-
-        logging.info(f"FLANN: {len(raw_matches)} matches brutos, {len(good_matches)} matches bons após filtro de razão.")
-
-        if len(good_matches) < MIN_FEATURES:
-            raise ValueError(f"Poucos matches válidos ({len(good_matches)}) encontrados para estimar homografia (mínimo: {MIN_FEATURES}).")
-
-        if progress_callback:
-            progress_callback(70, "Estimando transformação (Homografia)...")
-
-        # 6. Estimar Homografia (RANSAC)
-        pts1 = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-        pts2 = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-
-        H, mask = cv2.findHomography(pts1, pts2, cv2.RANSAC, 5.0) # 5.0 pixel reprojection error threshold
-        if H is None:
-            raise ValueError("Homografia não pôde ser estimada com RANSAC.")
-
-        # Count inliers
-        inliers = np.sum(mask)
-        logging.info(f"Homografia estimada com {inliers} inliers de {len(good_matches)} matches.")
-        if inliers < MIN_FEATURES:
-             raise ValueError(f"Poucos inliers ({inliers}) após RANSAC para homografia (mínimo: {MIN_FEATURES}).")
-
-        if progress_callback:
-            progress_callback(85, "Aplicando transformação (warp)...")
-
-        # 7. Aplicar Warp Perspective
-        h_ref, w_ref = img_ref_crop.shape[:2]
-        img_warped_full = cv2.warpPerspective(img_original_color, H, (w_ref, h_ref))
-
-        # 8. Recorte final após warp (para remover bordas pretas)
-        # Use a máscara para encontrar a área válida
-        mask_valid = np.any(img_warped_full != [0, 0, 0], axis=2)
-        coords = np.argwhere(mask_valid)
-
-        if coords.size == 0:
-            # Se a imagem resultante for toda preta, use a imagem warpada completa
-            logging.warning("A imagem transformada parece estar vazia (toda preta). Usando a imagem completa sem recorte.")
-            img_recortada = img_warped_full
-            y_min, x_min = 0, 0
-            nova_altura, nova_largura = img_recortada.shape[:2]
-        else:
-            y_min, x_min = coords.min(axis=0)
-            y_max, x_max = coords.max(axis=0)
-            img_recortada = img_warped_full[y_min:y_max+1, x_min:x_max+1]
-            nova_altura, nova_largura = img_recortada.shape[:2]
-            logging.info(f"Imagem recortada para remover bordas: {nova_largura}x{nova_altura} pixels.")
-
-        if nova_altura <= 0 or nova_largura <= 0:
-            raise ValueError("Dimensões da imagem recortada são inválidas.")
-
-        if progress_callback:
-            progress_callback(95, "Salvando imagem georreferenciada...")
-
-# 9. Calcular transformação final e reamostrar para resolução desejada
-        from rasterio.warp import reproject, Resampling
-        import rasterio.transform
-
-        target_resolution = 1.0 # Resolução desejada em metros/unidade do CRS
-        logging.info(f"Resolução alvo definida para: {target_resolution} unidades do CRS.")
-
-        # Calcular resolução da imagem de referência renderizada (necessária para coordenadas)
-        x_res_ref = bounds_crop.width() / w_ref
-        y_res_ref = bounds_crop.height() / h_ref
-
-        # Calcular coordenadas geográficas do retângulo da imagem recortada (img_recortada)
-        # x_min, y_min, x_max, y_max são os índices de pixel em img_warped_full
-        nova_xmin = bounds_crop.xMinimum() + x_min * x_res_ref
-        nova_ymax = bounds_crop.yMaximum() - y_min * y_res_ref
-        nova_xmax = bounds_crop.xMinimum() + (x_max + 1) * x_res_ref # Canto superior direito X
-        nova_ymin = bounds_crop.yMaximum() - (y_max + 1) * y_res_ref # Canto inferior esquerdo Y
-
-        geo_width = nova_xmax - nova_xmin
-        geo_height = nova_ymax - nova_ymin
-
-        # Calcular dimensões em pixels para a resolução alvo
-        final_width = max(1, round(geo_width / target_resolution))
-        final_height = max(1, round(geo_height / target_resolution))
-
-        logging.info(f"Calculadas dimensões finais: {final_width}x{final_height} pixels para resolução {target_resolution}.")
-
-        # Definir propriedades da fonte (imagem recortada como está)
-        # A imagem recortada (img_recortada) tem pixels que correspondem à grade da referência
-        src_transform = rasterio.transform.from_origin(nova_xmin, nova_ymax, x_res_ref, y_res_ref)
-        src_crs = f"EPSG:{epsg}"
-        # img_recortada tem shape (nova_altura, nova_largura, 3) e ordem BGR
-
-        # Definir propriedades do destino (nova grade com resolução alvo)
-        dst_transform = rasterio.transform.from_origin(nova_xmin, nova_ymax, target_resolution, target_resolution)
-        dst_crs = src_crs
-        destination_array = np.zeros((3, final_height, final_width), dtype=img_recortada.dtype) # Formato CHW
-
-        # Reamostrar cada banda de BGR (OpenCV) para RGB (Rasterio) e para a nova grade/resolução
-        # Banda 0 (B) -> destination_array[2]
-        # Banda 1 (G) -> destination_array[1]
-        # Banda 2 (R) -> destination_array[0]
-        source_bands_rgb_order = [img_recortada[:, :, 2], img_recortada[:, :, 1], img_recortada[:, :, 0]] # R, G, B
-
-        logging.info("Iniciando reamostragem com Resampling.cubic...")
-        for i in range(3):
-             reproject(
-                 source=source_bands_rgb_order[i], # Banda fonte (R, G ou B)
-                 destination=destination_array[i],  # Banda destino correspondente
-                 src_transform=src_transform,
-                 src_crs=src_crs,
-                 src_nodata=0, # Assumir que pixels pretos na imagem recortada são nodata
-                 dst_transform=dst_transform,
-                 dst_crs=dst_crs,
-                 dst_nodata=0, # Manter nodata como 0 no destino
-                 resampling=Resampling.cubic # Usar cúbico para melhor qualidade visual
-             )
-        logging.info("Reamostragem concluída.")
-
-        # Salvar o array reamostrado
-        with rasterio.open(
-            output_path,
-            'w',
-            driver='GTiff',
-            height=final_height,
-            width=final_width,
-            count=3,
-            dtype=destination_array.dtype,
-            crs=dst_crs,
-            transform=dst_transform,
-            nodata=0, # Definir valor nodata no metadado
-            compress='JPEG',
-            jpeg_quality=85, # Qualidade JPEG (75-95 é um bom intervalo)
-            photometric='YCBCR' # Necessário para compressão JPEG em GeoTIFF
-        ) as dst:
-            dst.write(destination_array) # Escrever array (CHW)
-
-        logging.info(f"Imagem georreferenciada e reamostrada salva com sucesso em: {output_path}")
-        return True, f"Georreferenciamento concluído com sucesso (resolução ~{target_resolution}m): {os.path.basename(output_path)}"
-
-    except ValueError as ve:
-        logging.error(f"Erro de valor durante georreferenciamento: {ve}")
-        logging.error(traceback.format_exc())
-        return False, str(ve)
-    except ImportError as ie:
-         logging.error(f"Erro de importação: {ie}. Verifique as dependências (ex: opencv-contrib-python, rasterio).")
-         return False, f"Erro de dependência: {ie}"
+def batch_georeference(image_paths: List[str], polygon_geom: QgsGeometry,
+                      reference_layer, output_dir: Optional[str] = None,
+                      output_paths: Optional[List[str]] = None,
+                      max_workers: int = DEFAULT_MAX_WORKERS,
+                      progress_callback: Optional[Callable[[float, str], None]] = None,
+                      result_callback: Optional[Callable[[str, bool, str, str, dict], None]] = None,
+                      is_canceled: Optional[Callable[[], bool]] = None,
+                      use_processes: bool = False,
+                      options: Optional[GeorefOptions] = None,
+                      resume: bool = True) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Processamento em lote, sem interface gráfica.
+
+    A referência é renderizada e caracterizada uma única vez, aqui; as
+    imagens são processadas pelo núcleo (georef_core.run_batch) em
+    `max_workers` threads ou, com `use_processes`, processos sem QGIS.
+    O resultado de cada imagem é registrado no manifesto do diretório de
+    saída (job_manifest); com `resume`, as imagens que ele dá como
+    concluídas com os mesmos parâmetros e a mesma referência são puladas
+    e só as demais (inclusive falhas e cancelamentos) são processadas.
+    """
+    options = options or GeorefOptions()
+    if output_paths is None:
+        output_paths = [default_output_path(p, output_dir, options.output_extension) for p in image_paths]
+
+    manifest = open_job_manifest(reference_layer, polygon_geom, output_paths, options)
+    skipped = []
+    if manifest is not None and resume:
+        image_paths, output_paths, skipped = georef_core.skip_completed(image_paths, output_paths, manifest,
+                                                                        result_callback)
+        if not image_paths:
+            if progress_callback:
+                progress_callback(100, "Todas as imagens já estavam georreferenciadas (manifesto do lote).")
+            return skipped, []
+
+    # Renderiza e caracteriza a referência uma única vez para todo o lote
+    if progress_callback:
+        progress_callback(0, "Renderizando e caracterizando a área de referência...")
+    try:
+        reference_context = build_reference_context(reference_layer, polygon_geom,
+                                                    features=options.feature_backend())
     except Exception as e:
-        logging.error(f"Erro inesperado durante georreferenciamento: {e}")
+        logging.error(f"Erro ao construir o contexto de referência: {e}")
         logging.error(traceback.format_exc())
-        # Check for common OpenCV/SIFT issues
-        if "SIFT" in str(e) and not hasattr(cv2, 'SIFT_create'):
-             msg = "Erro: SIFT não disponível. Instale 'opencv-contrib-python'."
-             logging.error(msg)
-             return False, msg
-        return False, f"Erro inesperado: {str(e)}"
-
-# --- Função de Lote (mantida da versão nova, chama a nova georeference_image) ---
-
-def batch_georeference(image_paths: List[str], polygon_geom: QgsGeometry,
-                      reference_layer, dialog_instance) -> Tuple[List[str], List[Tuple[str, str]]]:
-    """Processamento em lote com relatório."""
-    successful = []
-    failed = []
-    total = len(image_paths)
-
-    # Use o dialog_instance (GeorefAutoDialog) como parent para o QProgressDialog
-    progress = QProgressDialog("Georreferenciando imagens...", "Cancelar", 0, total * 100, dialog_instance)
-    progress.setWindowModality(Qt.WindowModal)
-    progress.setWindowTitle("Progresso do Georreferenciamento")
-    progress.setValue(0)
-    QApplication.processEvents() # Ensure dialog shows up
-
-    for i, img_path in enumerate(image_paths):
-        if progress.wasCanceled():
-            logging.info("Processo cancelado pelo usuário.")
-            break
-
-        current_progress_base = i * 100
-        progress.setValue(current_progress_base)
-        progress.setLabelText(f"Processando {i+1}/{total}: {os.path.basename(img_path)}")
-        QApplication.processEvents()
-
-        # Define output path based on dialog's batch_output_dir
-        output_filename = f"{os.path.splitext(os.path.basename(img_path))[0]}_georef.tif"
-        output_path = os.path.join(dialog_instance.batch_output_dir, output_filename)
-
-        # Define the progress callback function for this image
-        def report_progress(percentage, message):
-            progress.setValue(current_progress_base + percentage)
-            progress.setLabelText(f"Processando {i+1}/{total}: {os.path.basename(img_path)} - {message}")
-            QApplication.processEvents()
-
-        # Chama a função de georreferenciamento principal (a nova, baseada na antiga)
-        success, message = georeference_image(
-            img_path, polygon_geom, reference_layer, output_path,
-            progress_callback=report_progress
-        )
-
-        if success:
-            successful.append(output_path)
-        else:
-            failed.append((os.path.basename(img_path), message))
-
-        # Ensure progress bar reaches 100 for this item if successful
-        if success and not progress.wasCanceled():
-             progress.setValue(current_progress_base + 100)
-             QApplication.processEvents()
-
-    progress.setValue(total * 100) # Mark as complete
-    progress.close() # Close the progress dialog
-
-    return successful, failed
+        failed = [(os.path.basename(p), str(e)) for p in image_paths]
+        if result_callback:
+            for p, (_, msg) in zip(image_paths, failed):
+                result_callback(p, False, msg, "", {})
+        return skipped, failed
+
+    successful, failed = georef_core.run_batch(
+        image_paths, reference_context, output_paths,
+        max_workers=max_workers,
+        use_processes=use_processes,
+        options=options,
+        progress_callback=progress_callback,
+        result_callback=result_callback,
+        is_canceled=is_canceled,
+        manifest=manifest,
+    )
+    return skipped + successful, failed
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""Decimated and windowed reads of input frames.
+
+Frames are read through rasterio/GDAL instead of ``cv2.imread``: feature
+detection gets a gray image already reduced to the size it needs (GDAL
+reads from internal overviews when the file has them), and the warp reads
+only the source window, at the resolution, that each output chunk needs.
+A frame is therefore never held in memory at full resolution, whatever
+its size, bit depth or band count, unless :meth:`InputImage.load` is
+asked to (the batch reader stage does so for frames below a size limit,
+so compressed frames are decoded once instead of once per window). 16-bit and float frames are stretched
+to 8 bits for detection only; the warp keeps their values. Arrays already
+in memory get the same interface through :class:`ArrayImage`. This module
+has no QGIS dependency.
+"""
+
+import logging
+import warnings
+from typing import Tuple
+
+import cv2
+import numpy as np
+import rasterio
+from rasterio.enums import ColorInterp, Resampling
+from rasterio.errors import NotGeoreferencedWarning, RasterioIOError
+from rasterio.windows import Window
+
+from .reference_raster import gray_band_indexes, gray_from_bands, read_gray, stretch_range
+from .stage_metrics import stage
+
+_RESIZABLE_DTYPES = (np.uint8, np.uint16, np.int16, np.float32, np.float64) # Dtypes cv2.resize averages
+
+
+def _reduced_shape(height: int, width: int, scale: float) -> Tuple[int, int]:
+    return max(1, int(round(height * scale))), max(1, int(round(width * scale)))
+
+
+def _resize_bands(bands: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """(bands, rows, cols) averaged down to `shape` (rows, cols), keeping the dtype."""
+    if bands.shape[1:] == tuple(shape):
+        return bands
+    work = bands if bands.dtype in _RESIZABLE_DTYPES else bands.astype(np.float32)
+    resized = np.stack([cv2.resize(band, (shape[1], shape[0]), interpolation=cv2.INTER_AREA) for band in work])
+    return resized.astype(bands.dtype, copy=False)
+
+
+class InputImage:
+    """Input frame read from a file by decimated (detection) and windowed (warp) reads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", NotGeoreferencedWarning)
+            self._ds = rasterio.open(path)
+        ds = self._ds
+        self.height, self.width = ds.height, ds.width
+        self.dtype = np.dtype(ds.dtypes[0])
+        self.gray_indexes = gray_band_indexes(ds)
+        # Every band is warped except alpha: pixels outside the frame are nodata instead
+        self.band_indexes = tuple(i for i, ci in enumerate(ds.colorinterp, start=1)
+                                  if ci != ColorInterp.alpha) or (1,)
+        self.value_range = None if self.dtype == np.uint8 else stretch_range(ds, self.gray_indexes[0])
+        self._bands = None # Output bands in memory, once load() has read them
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the output bands at full resolution."""
+        return self.height * self.width * self.count * self.dtype.itemsize
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.height, self.width
+
+    @property
+    def count(self) -> int:
+        """Bands written to the output."""
+        return len(self.band_indexes)
+
+    def load(self, max_bytes: float) -> bool:
+        """Read the output bands into memory if they fit in `max_bytes`; later reads then skip the file.
+
+        Returns whether the frame is in memory.
+        """
+        if self._bands is None and self.nbytes <= max_bytes and set(self.gray_indexes) <= set(self.band_indexes):
+            with stage("read"):
+                self._bands = self._ds.read(self.band_indexes)
+        return self._bands is not None
+
+    def read_gray(self, scale: float = 1.0) -> np.ndarray:
+        """Whole frame as 8-bit gray, reduced by `scale` (never enlarged)."""
+        shape = _reduced_shape(self.height, self.width, min(1.0, scale))
+        if self._bands is not None:
+            gray_bands = self._bands[[self.band_indexes.index(i) for i in self.gray_indexes]]
+            return gray_from_bands(_resize_bands(gray_bands, shape), self.value_range)
+        with stage("read"):
+            return read_gray(self._ds, self.gray_indexes, self.value_range, None, shape)
+
+    def read_window(self, window: Window, out_shape: Tuple[int, int]) -> np.ndarray:
+        """Output bands of `window`, averaged down to `out_shape` (rows, cols), as (bands, rows, cols)."""
+        if self._bands is not None:
+            row0, col0 = int(window.row_off), int(window.col_off)
+            part = self._bands[:, row0:row0 + int(window.height), col0:col0 + int(window.width)]
+            return _resize_bands(part, out_shape)
+        with stage("read"):
+            return self._ds.read(self.band_indexes, window=window, out_shape=(self.count,) + tuple(out_shape),
+                                 resampling=Resampling.average)
+
+    def close(self):
+        self._bands = None
+        self._ds.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArrayImage:
+    """InputImage interface over a frame already in memory (OpenCV BGR, BGRA or gray array)."""
+
+    def __init__(self, array: np.ndarray):
+        self._array = array
+        self.height, self.width = array.shape[:2]
+        self.dtype = array.dtype
+        self.count = 1 if array.ndim == 2 else min(array.shape[2], 3)  # Alpha is dropped
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.height, self.width
+
+    def load(self, max_bytes: float) -> bool:
+        """Already in memory."""
+        return True
+
+    def read_gray(self, scale: float = 1.0) -> np.ndarray:
+        """Whole frame as gray, reduced by `scale` (never enlarged)."""
+        if self._array.ndim == 2:
+            gray = self._array
+        else:
+            code = cv2.COLOR_BGRA2GRAY if self._array.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+            gray = cv2.cvtColor(self._array, code)
+        if gray.dtype != np.uint8:  # Detectors need 8 bits
+            gray = cv2.normalize(gray, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+        if scale >= 1.0:
+            return gray
+        height, width = _reduced_shape(self.height, self.width, scale)
+        return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+
+    def read_window(self, window: Window, out_shape: Tuple[int, int]) -> np.ndarray:
+        """Bands of `window` in RGB order, averaged down to `out_shape` (rows, cols), as (bands, rows, cols)."""
+        row0, col0 = int(window.row_off), int(window.col_off)
+        part = self._array[row0:row0 + int(window.height), col0:col0 + int(window.width)]
+        if part.shape[:2] != tuple(out_shape):
+            part = cv2.resize(part, (out_shape[1], out_shape[0]), interpolation=cv2.INTER_AREA)
+        if part.ndim == 2:
+            return part[np.newaxis]
+        return part[:, :, 2::-1].transpose(2, 0, 1)  # BGR(A) -> RGB
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_input_image(path: str):
+    """InputImage for `path`, or an ArrayImage from cv2.imread if GDAL cannot read it."""
+    try:
+        return InputImage(path)
+    except RasterioIOError as e:
+        logging.info(f"Leitura da imagem com rasterio indisponível ({path}): {e}; usando OpenCV.")
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError(f"Não foi possível carregar a imagem não georreferenciada: {path}")
+    return ArrayImage(image)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Job manifest of a batch, so that interrupted or partly failed runs can be resumed.
+
+The manifest is a JSON file in the output directory with one entry per
+input image: its size, modification time and SHA-1, a fingerprint of the
+parameters it was processed with, the status and message of its last run,
+the estimated image-to-map homography and the output path, size and
+modification time. A re-run skips the images whose last run succeeded,
+whose output is still there unchanged and whose input and parameters are
+the same; failed and canceled images are processed again. The file is
+replaced atomically, so a crash leaves the previous version intact. This
+module has no QGIS dependency.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, Optional, Sequence
+
+MANIFEST_FILENAME = "georef_manifest.json"
+MANIFEST_VERSION = 1
+SAVE_INTERVAL_S = 2.0  # Minimum time between saves while a batch runs (a crash redoes at most these images)
+EXECUTION_OPTIONS = ("prefetch_frames", "warp_memory_mb")  # GeorefOptions that never change the outputs
+STATUS_OK, STATUS_FAILED, STATUS_CANCELED = "ok", "failed", "canceled"
+_RECORDED_STATS = ("keypoints", "reference_keypoints", "matches", "inliers", "output_mb")
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_sha1(path: str) -> str:
+    """SHA-1 of the contents of the file at `path`."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parameters_fingerprint(options, reference: str) -> str:
+    """Token that changes whenever `options` (a GeorefOptions) or the `reference` identity change the outputs.
+
+    `reference` should identify the reference layer contents, style and
+    extent, e.g. a ReferenceCache key.
+    """
+    values = {name: value for name, value in vars(options).items() if name not in EXECUTION_OPTIONS}
+    text = json.dumps([MANIFEST_VERSION, reference, values], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def default_manifest_path(output_paths: Sequence[str]) -> str:
+    """Manifest of the directory holding `output_paths` (their common directory)."""
+    directories = [os.path.dirname(os.path.abspath(p)) for p in output_paths]
+    try:
+        directory = os.path.commonpath(directories)
+    except ValueError:  # Different drives
+        directory = directories[0]
+    return os.path.join(directory, MANIFEST_FILENAME)
+
+
+def _key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _json_value(value):
+    return value.item() if hasattr(value, "item") else str(value)  # NumPy scalars
+
+
+class JobManifest:
+    """Entries of the images of a batch, loaded from and saved to `path`.
+
+    Not thread-safe: run_batch reads and records it from the thread that
+    collects the results.
+    """
+
+    def __init__(self, path: str, parameters: str):
+        """Constructor.
+
+        Args:
+            path: Manifest file; it is created on the first save if missing
+            parameters: Fingerprint of the parameters of this run, from
+                parameters_fingerprint(); entries recorded with other
+                parameters are kept but never skipped
+        """
+        self.path = path
+        self.parameters = parameters
+        self._entries = self._load()
+        self._dirty = False
+        self._saved_at = 0.0
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Manifesto ilegível ({self.path}), todas as imagens serão processadas: {e}")
+            return {}
+        if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+            logging.warning(f"Manifesto de versão desconhecida ({self.path}), todas as imagens serão processadas.")
+            return {}
+        return {_key(entry["input"]): entry for entry in data.get("images", []) if "input" in entry}
+
+    def entry(self, image_path: str) -> Optional[dict]:
+        """Last recorded entry of `image_path`, if any."""
+        return self._entries.get(_key(image_path))
+
+    def completed(self, image_path: str, output_path: str) -> Optional[dict]:
+        """Entry of `image_path` if it can be skipped, None if it must be (re)processed.
+
+        It can be skipped if its last run succeeded with the same parameters
+        and output path, the output still has its recorded size and
+        modification time, and the input has the same contents (the SHA-1
+        is only recomputed if the input was touched).
+        """
+        entry = self.entry(image_path)
+        if (entry is None or entry.get("status") != STATUS_OK or entry.get("parameters") != self.parameters
+                or _key(entry.get("output", "")) != _key(output_path)):
+            return None
+        try:
+            output_stat = os.stat(output_path)
+            input_stat = os.stat(image_path)
+        except OSError:
+            return None
+        if (output_stat.st_size, output_stat.st_mtime_ns) != (entry.get("output_size"), entry.get("output_mtime_ns")):
+            return None
+        if input_stat.st_size != entry.get("input_size"):
+            return None
+        if input_stat.st_mtime_ns != entry.get("input_mtime_ns"):
+            try:
+                if file_sha1(image_path) != entry.get("input_sha1"):
+                    return None
+            except OSError:
+                return None
+            entry["input_mtime_ns"] = input_stat.st_mtime_ns  # Touched or copied, same contents
+            self._dirty = True
+        return entry
+
+    def record(self, image_path: str, output_path: str, status: str, message: str, stats: Optional[dict] = None):
+        """Record the result of `image_path` (one of the STATUS_* values) and save now and then."""
+        stats = stats or {}
+        entry = {"input": os.path.abspath(image_path), "parameters": self.parameters, "status": status,
+                 "message": message, "output": os.path.abspath(output_path),
+                 "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        if status == STATUS_OK:
+            previous = self.entry(image_path) or {}
+            try:
+                input_stat = os.stat(image_path)
+                output_stat = os.stat(output_path)
+                if (input_stat.st_size, input_stat.st_mtime_ns) == (previous.get("input_size"),
+                                                                    previous.get("input_mtime_ns")):
+                    sha1 = previous.get("input_sha1")
+                else:
+                    sha1 = file_sha1(image_path)
+                entry.update(input_size=input_stat.st_size, input_mtime_ns=input_stat.st_mtime_ns, input_sha1=sha1,
+                             output_size=output_stat.st_size, output_mtime_ns=output_stat.st_mtime_ns)
+            except OSError as e:
+                logging.warning(f"Manifesto: não foi possível identificar {image_path} ou sua saída: {e}")
+            entry["homography"] = stats.get("image_to_map")
+            entry["stats"] = {key: stats[key] for key in _RECORDED_STATS if key in stats}
+        self._entries[_key(image_path)] = entry
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= SAVE_INTERVAL_S:
+            self.save()
+
+    def save(self):
+        """Write the manifest if anything changed, atomically; failures are only logged."""
+        if not self._dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        data = {"version": MANIFEST_VERSION, "images": list(self._entries.values())}
+        self._saved_at = time.monotonic()
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".georef_manifest", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=1, ensure_ascii=False, default=_json_value)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Não foi possível gravar o manifesto {self.path}: {e}")
+            return
+        self._dirty = False
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Persistent on-disk cache of the features of reference renders and their FLANN indexes.
+
+Entries are compressed ``.npz`` files keyed by the layer source, CRS,
+polygon bounding box and render width; entries derived from them (trained
+FLANN indexes) share their source prefix. The cache is size-bounded and
+evicts least-recently-used entries first. This module has no QGIS
+dependency.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+CACHE_FORMAT_VERSION = 1
+_SUFFIX = ".npz"
+
+
+def source_fingerprint(source: str) -> str:
+    """Return a token that changes whenever a file-backed source is modified.
+
+    Non-file sources (WMS, XYZ, databases) yield an empty token and must be
+    invalidated explicitly with :meth:`ReferenceCache.invalidate`.
+    """
+    path = source.split("|")[0]
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return ""
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def keypoints_to_array(keypoints: Sequence[cv2.KeyPoint]) -> np.ndarray:
+    """Pack cv2.KeyPoint objects into an (N, 7) float32 array."""
+    return np.array(
+        [(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id) for kp in keypoints],
+        dtype=np.float32,
+    ).reshape(-1, 7)
+
+
+def array_to_keypoints(array: np.ndarray) -> List[cv2.KeyPoint]:
+    """Rebuild cv2.KeyPoint objects from an (N, 7) array made by keypoints_to_array."""
+    return [
+        cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave), int(class_id))
+        for x, y, size, angle, response, octave, class_id in array
+    ]
+
+
+class ReferenceCache:
+    """Size-bounded LRU cache of the features of rendered reference images."""
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(source: str, crs_authid: str, bbox: Tuple[float, float, float, float],
+                 width_px: int, version: str = "") -> str:
+        """Build the cache key for a render of `source` over `bbox`.
+
+        The key is ``<source hash>_<parameters hash>`` so that every entry of a
+        source can be found (and invalidated) by its prefix. `version` should
+        change whenever the rendered pixels would change (file modification,
+        layer style); it is combined with :func:`source_fingerprint`.
+        """
+        source_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+        params = "|".join([
+            str(CACHE_FORMAT_VERSION),
+            crs_authid,
+            ",".join(f"{v:.6f}" for v in bbox),
+            str(int(width_px)),
+            source_fingerprint(source),
+            version,
+        ])
+        params_hash = hashlib.sha1(params.encode("utf-8")).hexdigest()[:24]
+        return f"{source_hash}_{params_hash}"
+
+    @staticmethod
+    def derived_key(key: str, *parts: str) -> str:
+        """Key of an entry computed from the entry `key` (and `parts`), invalidated along with its source."""
+        source_hash = key.split("_", 1)[0]
+        params_hash = hashlib.sha1("|".join((key,) + parts).encode("utf-8")).hexdigest()[:24]
+        return f"{source_hash}_{params_hash}"
+
+    @staticmethod
+    def source_prefix(source: str) -> str:
+        """Key prefix shared by every entry of `source`."""
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()[:16] + "_"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + _SUFFIX)
+
+    def _entries(self) -> List[Tuple[str, os.stat_result]]:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((path, os.stat(path)))
+            except OSError:
+                continue  # Removed concurrently
+        return entries
+
+    def load(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """Return the cached arrays for `key`, or None on a miss."""
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Cache de referência: entrada corrompida removida ({key}): {e}")
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)  # Mark as recently used for LRU eviction
+        except OSError:
+            pass
+        logging.info(f"Cache de referência: acerto para {key}.")
+        return entry
+
+    def store(self, key: str, **arrays: np.ndarray) -> None:
+        """Write `arrays` under `key` atomically, then enforce the size limit."""
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, path)
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        logging.info(f"Cache de referência: entrada gravada ({key}, {os.path.getsize(path) / 1e6:.1f} MB).")
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete least-recently-used entries until the cache fits `max_bytes`."""
+        entries = sorted(self._entries(), key=lambda e: e[1].st_mtime)
+        total = sum(st.st_size for _, st in entries)
+        removed = 0
+        while entries and total > self.max_bytes:
+            path, st = entries.pop(0)
+            if self._remove(path):
+                total -= st.st_size
+                removed += 1
+        if removed:
+            logging.info(f"Cache de referência: {removed} entrada(s) removida(s) por LRU.")
+        return removed
+
+    def invalidate(self, source: str) -> int:
+        """Delete every entry rendered from `source`. Returns the number removed."""
+        prefix = self.source_prefix(source)
+        removed = sum(
+            1 for path, _ in self._entries()
+            if os.path.basename(path).startswith(prefix) and self._remove(path)
+        )
+        logging.info(f"Cache de referência: {removed} entrada(s) invalidada(s) para {source}.")
+        return removed
+
+    def clear(self) -> int:
+        """Delete every entry in the cache."""
+        removed = sum(1 for path, _ in self._entries() if self._remove(path))
+        logging.info(f"Cache de referência: {removed} entrada(s) removida(s).")
+        return removed
+
+    def total_bytes(self) -> int:
+        """Current size of the cache on disk."""
+        return sum(st.st_size for _, st in self._entries())
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+class TileCacheKey:
+    """Picklable ``(bbox, width_px) -> key`` callable for one source, CRS and style version."""
+
+    def __init__(self, source: str, crs_authid: str, version: str = ""):
+        self.source = source
+        self.crs_authid = crs_authid
+        self.version = version
+
+    def __call__(self, bbox: Tuple[float, float, float, float], width_px: int) -> str:
+        return ReferenceCache.make_key(self.source, self.crs_authid, bbox, width_px, self.version)
@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+"""Tiled, multi-resolution reference pyramid.
+
+The reference area is split into levels whose pixel size halves from a
+coarse overview (level 0) down to the native ground sample distance of
+the reference layer. Every level is a regular grid of tiles, which also
+serves as its spatial index. Tiles are rendered and featurized lazily, on
+first use, and only their features are kept in memory, so memory is
+bounded by the tiles actually touched rather than by the polygon area.
+
+A level searched without a predicted footprint (the overview of a very
+large area, or a finer level when the overview is too coarse for a frame)
+can be narrowed to its most likely tiles first: :class:`TileRetrievalIndex`
+ranks tiles by bag-of-visual-words similarity to the frame, so detailed
+matching only builds and searches FLANN indexes over a few tiles.
+
+FLANN indexes are trained once per set of tiles and kept in memory for the
+batch; with a disk cache, KD-tree indexes over a whole level (the overview
+every image is located on) are also saved next to the tile features and
+loaded instead of retrained in later runs.
+
+This module has no QGIS dependency: rendering and feature detection are
+delegated to callables supplied by the caller. A context can be pickled
+(for worker processes) as long as those callables can; otherwise
+:meth:`ReferenceContext.detached` gives a copy that no longer needs them.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from .reference_cache import ReferenceCache, keypoints_to_array
+from .stage_metrics import stage
+
+REFERENCE_TILE_PX = 2048  # Side of a reference tile, in pixels
+TILE_OVERLAP_PX = 32  # Extra context rendered around each tile so border keypoints are not lost
+MAX_PYRAMID_LEVELS = 10
+DEFAULT_PYRAMID_LEVELS = 4  # Used when the layer has no native resolution (WMS, vector)
+DETACHED_MAX_TILES = 16  # Tiles featurized up front when detaching a context from its renderer
+_MAX_CACHED_MATCHERS = 8  # FLANN indexes kept per context, least recently used evicted first
+_FLANN_INDEX_PARAMS = dict(algorithm=1, trees=5)  # Randomized KD-trees
+_FLANN_SEARCH_PARAMS = dict(checks=50)
+RETRIEVAL_WORDS = 1024  # Visual words of the tile retrieval vocabulary
+RETRIEVAL_CELLS = 4  # Retrieval vectors per tile side: cells closer to a frame footprint than whole tiles
+_VOCABULARY_SAMPLE = 50000  # Descriptors sampled to train the vocabulary
+_VOCABULARY_ITERATIONS = 8  # k-means iterations
+_ASSIGN_CHUNK = 8192  # Descriptors assigned to words at a time
+
+Bounds = Tuple[float, float, float, float]  # xmin, ymin, xmax, ymax (map units)
+Window = Tuple[int, int, int, int]  # x0, y0, x1, y1 (level pixels, end exclusive)
+TileId = Tuple[int, int]  # col, row
+RenderTileFn = Callable[[Bounds, int, int], Optional[np.ndarray]]
+DetectFn = Callable[[np.ndarray], Tuple[list, Optional[np.ndarray]]]
+CacheKeyFn = Callable[[Bounds, int], str]
+
+
+class ReferenceLevel:
+    """One level of the pyramid: a square-pixel grid anchored at the top-left of the reference bounds."""
+
+    def __init__(self, index: int, origin_x: float, origin_y: float, pixel_size: float,
+                 width: int, height: int, tile_px: int = REFERENCE_TILE_PX):
+        self.index = index
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+        self.pixel_size = pixel_size
+        self.width = width
+        self.height = height
+        self.tile_px = tile_px
+        self.n_cols = max(1, math.ceil(width / tile_px))
+        self.n_rows = max(1, math.ceil(height / tile_px))
+
+    @property
+    def n_tiles(self) -> int:
+        return self.n_cols * self.n_rows
+
+    def tile_window(self, col: int, row: int) -> Window:
+        """Pixel window covered by a tile (without overlap)."""
+        x0, y0 = col * self.tile_px, row * self.tile_px
+        return x0, y0, min(x0 + self.tile_px, self.width), min(y0 + self.tile_px, self.height)
+
+    def window_bounds(self, window: Window) -> Bounds:
+        """Map bounds of a pixel window."""
+        x0, y0, x1, y1 = window
+        return (self.origin_x + x0 * self.pixel_size, self.origin_y - y1 * self.pixel_size,
+                self.origin_x + x1 * self.pixel_size, self.origin_y - y0 * self.pixel_size)
+
+    def tiles_in_window(self, x0: float, y0: float, x1: float, y1: float) -> List[TileId]:
+        """Tiles intersecting a pixel window (clipped to the level)."""
+        c0 = max(0, int(math.floor(x0 / self.tile_px)))
+        r0 = max(0, int(math.floor(y0 / self.tile_px)))
+        c1 = min(self.n_cols - 1, int(math.floor((x1 - 1) / self.tile_px)))
+        r1 = min(self.n_rows - 1, int(math.floor((y1 - 1) / self.tile_px)))
+        return [(c, r) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+    def all_tiles(self) -> List[TileId]:
+        return [(c, r) for r in range(self.n_rows) for c in range(self.n_cols)]
+
+
+def build_pyramid_levels(bounds: Bounds, base_width_px: int,
+                         native_pixel_size: Optional[float] = None,
+                         tile_px: int = REFERENCE_TILE_PX) -> List[ReferenceLevel]:
+    """Build the pyramid from a `base_width_px` overview down to `native_pixel_size`.
+
+    Each level halves the pixel size of the previous one; the last level is
+    clamped to the native pixel size so the reference is never rendered
+    finer than the layer itself. Without a native size, DEFAULT_PYRAMID_LEVELS
+    levels are built.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    base_pixel = (xmax - xmin) / base_width_px
+    if native_pixel_size and 0 < native_pixel_size < base_pixel:
+        n_levels = 1 + math.ceil(math.log2(base_pixel / native_pixel_size) - 1e-9)
+    elif native_pixel_size:
+        n_levels = 1
+    else:
+        n_levels = DEFAULT_PYRAMID_LEVELS
+    n_levels = min(n_levels, MAX_PYRAMID_LEVELS)
+
+    levels = []
+    for i in range(n_levels):
+        pixel = base_pixel / (2 ** i)
+        if native_pixel_size:
+            pixel = max(pixel, native_pixel_size)
+        width = max(1, math.ceil((xmax - xmin) / pixel - 1e-9))
+        height = max(1, math.ceil((ymax - ymin) / pixel - 1e-9))
+        levels.append(ReferenceLevel(i, xmin, ymax, pixel, width, height, tile_px))
+    return levels
+
+
+class ReferenceTile:
+    """Keypoint positions, as an (N, 2) float32 array in level pixel coordinates, and descriptors of one tile."""
+
+    def __init__(self, level: int, col: int, row: int, points: np.ndarray, descriptors: Optional[np.ndarray]):
+        self.level = level
+        self.col = col
+        self.row = row
+        self.points = np.float32(points).reshape(-1, 2)
+        # As stored by the backend: float32/float16/uint8 (RootSIFT) or uint8 (binary)
+        self.descriptors = None if descriptors is None or len(descriptors) == 0 else np.asarray(descriptors)
+
+
+class TileRetrievalIndex:
+    """Bag-of-visual-words vectors of a level's tiles, to shortlist the tiles a frame may overlap.
+
+    Descriptors are quantized to the nearest of `words` visual words, the
+    k-means centres of a sample of the level's descriptors. Each tile is
+    split into `cells` x `cells` cells with one tf-idf vector each, so a
+    frame much smaller than a tile still stands out, and a tile scores as
+    its best cell. Only plain arrays are kept: the index can be pickled.
+    """
+
+    def __init__(self, tile_ids: Sequence[TileId], points: Sequence[np.ndarray], vectors: Sequence[np.ndarray],
+                 tile_px: int, words: int = RETRIEVAL_WORDS, cells: int = RETRIEVAL_CELLS, seed: int = 0):
+        """Constructor.
+
+        Args:
+            tile_ids: Tiles indexed
+            points: Keypoints of each tile, (N, 2) in level pixels
+            vectors: Descriptors of each tile as float32 vectors (see ReferenceContext.retrieval_vectors)
+            tile_px: Tile side, in level pixels
+        """
+        self.tile_ids = list(tile_ids)
+        self.cells = cells
+        self.words = self._train_vocabulary(np.concatenate([v for v in vectors if len(v)]), words, seed)
+
+        counts = np.zeros((len(self.tile_ids), cells * cells, len(self.words)), np.float32)
+        for i, ((col, row), tile_points, tile_vectors) in enumerate(zip(self.tile_ids, points, vectors)):
+            if not len(tile_vectors):
+                continue
+            cx = np.clip(((tile_points[:, 0] - col * tile_px) * (cells / tile_px)).astype(np.int64), 0, cells - 1)
+            cy = np.clip(((tile_points[:, 1] - row * tile_px) * (cells / tile_px)).astype(np.int64), 0, cells - 1)
+            cell_word = (cy * cells + cx) * len(self.words) + self.assign(tile_vectors)
+            counts[i] = np.bincount(cell_word, minlength=counts[i].size).reshape(cells * cells, -1)
+        # Rare words weigh more (idf); square-rooted counts damp repeated patterns
+        cell_counts = counts.reshape(-1, len(self.words))
+        occupied = np.count_nonzero(cell_counts.any(axis=1))
+        self.idf = np.log((occupied + 1) / (np.count_nonzero(cell_counts, axis=0) + 1)).astype(np.float32)
+        self.cell_vectors = self._normalize(np.sqrt(counts) * self.idf)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    @staticmethod
+    def _train_vocabulary(vectors: np.ndarray, words: int, seed: int) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        if len(vectors) > _VOCABULARY_SAMPLE:
+            vectors = vectors[rng.choice(len(vectors), _VOCABULARY_SAMPLE, replace=False)]
+        words = min(words, len(vectors))
+        centres = vectors[rng.choice(len(vectors), words, replace=False)].copy()
+        for _ in range(_VOCABULARY_ITERATIONS):
+            labels = TileRetrievalIndex._nearest(vectors, centres)
+            sums = np.zeros_like(centres)
+            np.add.at(sums, labels, vectors)
+            sizes = np.bincount(labels, minlength=words)
+            filled = sizes > 0  # Empty clusters keep their centre
+            centres[filled] = sums[filled] / sizes[filled, None]
+        return centres
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centres: np.ndarray) -> np.ndarray:
+        # argmin |v - c|^2 = argmax (v.c - |c|^2 / 2), in chunks to bound memory
+        half_norms = 0.5 * np.einsum("ij,ij->i", centres, centres)
+        return np.concatenate([np.argmax(vectors[i:i + _ASSIGN_CHUNK] @ centres.T - half_norms, axis=1)
+                               for i in range(0, len(vectors), _ASSIGN_CHUNK)] or [np.zeros(0, np.int64)])
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Visual word of each descriptor vector."""
+        return self._nearest(vectors, self.words)
+
+    def shortlist(self, vectors: np.ndarray, top_k: int) -> List[TileId]:
+        """The `top_k` tiles most similar to a frame described by `vectors`, best first."""
+        counts = np.bincount(self.assign(vectors), minlength=len(self.words)).astype(np.float32)
+        query = self._normalize(np.sqrt(counts) * self.idf)
+        scores = (self.cell_vectors @ query).max(axis=1)
+        return [self.tile_ids[i] for i in np.argsort(-scores, kind="stable")[:top_k]]
+
+
+class ReferenceContext:
+    """Reference pyramid rendered and featurized once and reused by every image of a batch."""
+
+    def __init__(self, bounds: Bounds, crs: str, levels: List[ReferenceLevel],
+                 render_tile: Optional[RenderTileFn], detect: DetectFn,
+                 cache: Optional[ReferenceCache] = None, cache_key: Optional[CacheKeyFn] = None):
+        """Constructor.
+
+        Args:
+            bounds: Reference area (xmin, ymin, xmax, ymax) in `crs` units
+            crs: CRS of the reference, as understood by rasterio ("EPSG:31983" or WKT)
+            levels: Pyramid levels, coarsest first (see build_pyramid_levels)
+            render_tile: ``(bounds, width, height) -> gray array``; None if every tile is already loaded
+            detect: ``gray -> (keypoints, descriptors)``, e.g. a feature_backends.FeatureBackend;
+                its optional ``binary``, ``index_params`` and ``search_params`` attributes
+                select how descriptors are indexed (L2 KD-trees by default)
+            cache: Optional disk cache of tile features and trained FLANN indexes
+            cache_key: ``(bounds, width) -> key`` for `cache`
+        """
+        self.bounds = bounds
+        self.crs = crs
+        self.levels = levels
+        self.render_tile = render_tile
+        self.detect = detect
+        self.cache = cache
+        self.cache_key = cache_key
+        self._tiles: Dict[Tuple[int, int, int], ReferenceTile] = {}
+        self._matchers: Dict[Tuple[int, Tuple[TileId, ...]], Tuple[Optional[cv2.flann_Index], np.ndarray]] = OrderedDict()
+        self._retrieval: Dict[int, TileRetrievalIndex] = {}
+        # Worker threads share the context: one lock per tile/matcher being built,
+        # and rendering serialized because map layers are not thread-safe
+        self._lock = threading.Lock()
+        self._key_locks: Dict[tuple, threading.Lock] = {}
+        self._render_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks and FLANN matchers cannot be pickled; workers rebuild them on demand
+        state = self.__dict__.copy()
+        for name in ("_matchers", "_lock", "_key_locks", "_render_lock"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._matchers = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._render_lock = threading.Lock()
+
+    def detached(self, max_tiles: int = DETACHED_MAX_TILES) -> "ReferenceContext":
+        """Copy that no longer needs `render_tile`, e.g. to ship to worker processes.
+
+        Levels are featurized coarse to fine while their total tile count fits
+        in `max_tiles` (the overview always does); finer levels are dropped,
+        so the fine stage of matching stops at the last level kept.
+        """
+        n_levels, budget = 0, max_tiles
+        for level in self.levels:
+            if n_levels and level.n_tiles > budget:
+                break
+            self.tiles(level.index)
+            budget -= level.n_tiles
+            n_levels += 1
+        if n_levels < len(self.levels):
+            logging.info(f"Contexto de referência destacado com {n_levels} de {len(self.levels)} níveis "
+                         f"(até {self.levels[n_levels - 1].pixel_size:.3f} unidades/pixel).")
+        copy = ReferenceContext(self.bounds, self.crs, self.levels[:n_levels], None, self.detect)
+        copy._tiles = {key: tile for key, tile in self._tiles.items() if key[0] < n_levels}
+        copy._retrieval = {index: retrieval for index, retrieval in self._retrieval.items() if index < n_levels}
+        return copy
+
+    def _key_lock(self, key: tuple) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def tile(self, level_index: int, col: int, row: int) -> ReferenceTile:
+        """Return a tile's features, rendering and featurizing it on first use."""
+        key = (level_index, col, row)
+        tile = self._tiles.get(key)
+        if tile is None:
+            with self._key_lock(("tile",) + key):
+                tile = self._tiles.get(key)
+                if tile is None:
+                    tile = self._load_tile(self.levels[level_index], col, row)
+                    self._tiles[key] = tile
+        return tile
+
+    def tiles(self, level_index: int, tile_ids: Optional[Sequence[TileId]] = None) -> List[ReferenceTile]:
+        """Features of `tile_ids` (all tiles of the level by default)."""
+        level = self.levels[level_index]
+        if tile_ids is None:
+            tile_ids = level.all_tiles()
+        return [self.tile(level_index, c, r) for c, r in tile_ids]
+
+    @staticmethod
+    def _render_request(level: ReferenceLevel, col: int, row: int) -> Tuple[Bounds, int, int]:
+        """Map bounds, width and height of a tile's render, overlap included."""
+        x0, y0, x1, y1 = level.tile_window(col, row)
+        m = TILE_OVERLAP_PX
+        return level.window_bounds((x0 - m, y0 - m, x1 + m, y1 + m)), x1 - x0 + 2 * m, y1 - y0 + 2 * m
+
+    def _load_tile(self, level: ReferenceLevel, col: int, row: int) -> ReferenceTile:
+        x0, y0, x1, y1 = level.tile_window(col, row)
+        m = TILE_OVERLAP_PX
+        render_bounds, width, height = self._render_request(level, col, row)
+
+        key = self.cache_key(render_bounds, width) if self.cache is not None and self.cache_key else None
+        with stage("render"):
+            entry = self.cache.load(key) if key else None
+        if entry is not None:
+            points = entry["keypoints"][:, :2]
+            descriptors = entry["descriptors"]
+        else:
+            if self.render_tile is None:
+                raise ValueError(f"Tile de referência nível {level.index} ({col}, {row}) indisponível sem renderizador.")
+            logging.info(f"Renderizando tile de referência nível {level.index} ({col}, {row}): {width}x{height} px.")
+            # Map layers are not thread-safe; readers that are say so with a `thread_safe` attribute
+            thread_safe = getattr(self.render_tile, "thread_safe", False)
+            with stage("render"), nullcontext() if thread_safe else self._render_lock:
+                gray = self.render_tile(render_bounds, width, height)
+            if gray is None:
+                raise ValueError("Falha ao renderizar a imagem de referência.")
+            with stage("detect"):
+                keypoints, descriptors = self.detect(gray)
+            if descriptors is None:
+                keypoints, descriptors = [], np.zeros((0, 128), np.float32)
+            # Compact storage type (float16/uint8) if the backend asks for it
+            pack = getattr(self.detect, "pack", None)
+            if pack is not None:
+                descriptors = pack(descriptors)
+            keypoint_array = keypoints_to_array(keypoints)
+            points = keypoint_array[:, :2]
+            if key:
+                try:
+                    # Only the features: a hit never needs the rendered pixels, which would
+                    # take most of the cache budget
+                    self.cache.store(key, keypoints=keypoint_array, descriptors=descriptors)
+                except OSError as e:
+                    logging.warning(f"Não foi possível gravar no cache de referência: {e}")
+
+        # Move keypoints to level coordinates and keep only those in the tile core,
+        # so overlapping margins do not produce duplicates across neighbours
+        points = points + np.float32([x0 - m, y0 - m])
+        inside = ((points[:, 0] >= x0) & (points[:, 0] < x1) &
+                  (points[:, 1] >= y0) & (points[:, 1] < y1))
+        kept_desc = np.asarray(descriptors)[inside] if inside.any() else None
+        return ReferenceTile(level.index, col, row, points[inside], kept_desc)
+
+    def knn_match(self, query_descriptors: np.ndarray, level_index: int,
+                  tile_ids: Optional[Sequence[TileId]] = None,
+                  k: int = 2) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """k-NN search of `query_descriptors` over the given tiles of a level.
+
+        Returns ``(distances, indices, points)`` as arrays: ``distances`` and
+        ``indices`` are (N, k') with k' = min(k, number of reference features),
+        sorted by distance (L2, or Hamming for binary descriptors); ``indices``
+        (-1 where FLANN found no neighbour) index the (M, 2) float32
+        ``points`` (level pixel coordinates of the reference features).
+        """
+        if tile_ids is None:
+            tile_ids = self.levels[level_index].all_tiles()
+        cache_key = (level_index, tuple(tile_ids))
+        with self._lock:
+            cached = self._matchers.get(cache_key)
+            if cached is not None:
+                self._matchers.move_to_end(cache_key)  # LRU: the overview index stays while it is in use
+        if cached is None:
+            with self._key_lock(("matcher",) + cache_key):
+                cached = self._matchers.get(cache_key)
+                if cached is None:
+                    cached = self._build_matcher(level_index, tile_ids)
+                    with self._lock:
+                        while len(self._matchers) >= _MAX_CACHED_MATCHERS:
+                            self._matchers.popitem(last=False)
+                        self._matchers[cache_key] = cached
+        index, points = cached
+        k = min(k, len(points))  # FLANN cannot return more neighbours than it indexes
+        if index is None or k == 0:
+            empty = np.zeros((len(query_descriptors), 0))
+            return empty.astype(np.float32), empty.astype(np.int32), points
+        search_params = getattr(self.detect, "search_params", _FLANN_SEARCH_PARAMS)
+        if getattr(self.detect, "binary", False):
+            indices, distances = index.knnSearch(np.uint8(query_descriptors), k, params=search_params)
+            return np.float32(distances), indices, points
+        indices, squared = index.knnSearch(np.float32(query_descriptors), k, params=search_params)
+        return np.sqrt(squared), indices, points
+
+    def _build_matcher(self, level_index: int, tile_ids: Sequence[TileId]):
+        tiles = [t for t in self.tiles(level_index, tile_ids) if t.descriptors is not None]
+        if not tiles:
+            return None, np.zeros((0, 2), np.float32)
+        # Índice FLANN treinado uma única vez sobre os descritores destes tiles,
+        # com os pontos concatenados na mesma ordem (LSH para descritores binários).
+        # Descritores compactos voltam a float32 só aqui, na hora do match
+        unpack = getattr(self.detect, "unpack", lambda d: d.astype(np.float32, copy=False))
+        descriptors = np.concatenate([unpack(t.descriptors) for t in tiles])
+        points = np.concatenate([t.points for t in tiles])
+        index_params = getattr(self.detect, "index_params", _FLANN_INDEX_PARAMS)
+        # Only whole-level indexes (the overview) are saved: footprint and
+        # shortlisted tile sets change from image to image
+        whole_level = len(tile_ids) == self.levels[level_index].n_tiles
+        key = self._index_cache_key(tiles[0], descriptors, index_params) if whole_level else None
+        index = self._load_index(key, descriptors) if key else None
+        if index is None:
+            index = cv2.flann_Index(descriptors, index_params)
+            if key:
+                self._store_index(key, index)
+        return index, points
+
+    def _index_cache_key(self, first_tile: ReferenceTile, descriptors: np.ndarray, index_params: Dict) -> Optional[str]:
+        if self.cache is None or not self.cache_key or not getattr(self.detect, "persist_index", False):
+            return None
+        render_bounds, width, _ = self._render_request(self.levels[first_tile.level], first_tile.col, first_tile.row)
+        # The index belongs to these exact descriptors, whichever tiles they came from
+        digest = hashlib.sha1(descriptors).hexdigest()
+        return ReferenceCache.derived_key(self.cache_key(render_bounds, width), "flann",
+                                          repr(sorted(index_params.items())), digest)
+
+    def _load_index(self, key: str, descriptors: np.ndarray) -> Optional[cv2.flann_Index]:
+        entry = self.cache.load(key)
+        if entry is None:
+            return None
+        fd, path = tempfile.mkstemp(suffix=".flann")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(entry["index"].tobytes())
+            index = cv2.flann_Index()
+            if index.load(descriptors, path):
+                return index
+        except (OSError, cv2.error) as e:
+            logging.warning(f"Índice FLANN do cache não pôde ser carregado: {e}")
+        finally:
+            os.remove(path)
+        return None
+
+    def _store_index(self, key: str, index: cv2.flann_Index) -> None:
+        fd, path = tempfile.mkstemp(suffix=".flann")
+        os.close(fd)
+        try:
+            index.save(path)
+            self.cache.store(key, index=np.fromfile(path, np.uint8))
+        except (OSError, cv2.error) as e:
+            logging.warning(f"Não foi possível gravar o índice FLANN no cache de referência: {e}")
+        finally:
+            os.remove(path)
+
+    def retrieval_vectors(self, descriptors: np.ndarray) -> np.ndarray:
+        """Descriptors as float32 vectors for TileRetrievalIndex: bits for binary descriptors."""
+        if getattr(self.detect, "binary", False):
+            return np.unpackbits(np.uint8(descriptors), axis=1).astype(np.float32)
+        unpack = getattr(self.detect, "unpack", lambda d: d.astype(np.float32, copy=False))
+        return unpack(descriptors)
+
+    def candidate_tiles(self, query_descriptors: np.ndarray, level_index: int, top_k: int) -> List[TileId]:
+        """Shortlist of the `top_k` tiles of a level most likely to contain a frame.
+
+        Every tile of the level is featurized, and the retrieval index built,
+        on the first call for that level; afterwards the cost per frame does
+        not depend on the number of tiles. Levels with at most `top_k` tiles
+        are returned whole.
+        """
+        level = self.levels[level_index]
+        if level.n_tiles <= top_k:
+            return level.all_tiles()
+        retrieval = self._retrieval.get(level_index)
+        if retrieval is None:
+            with self._key_lock(("retrieval", level_index)):
+                retrieval = self._retrieval.get(level_index)
+                if retrieval is None:
+                    tiles = [t for t in self.tiles(level_index) if t.descriptors is not None]
+                    if not tiles:
+                        return level.all_tiles()  # Nothing to rank; matching will report the lack of features
+                    logging.info(f"Indexando {len(tiles)} tiles do nível {level_index} para a pré-seleção de tiles.")
+                    retrieval = TileRetrievalIndex(
+                        [(t.col, t.row) for t in tiles], [t.points for t in tiles],
+                        [self.retrieval_vectors(t.descriptors) for t in tiles], level.tile_px)
+                    self._retrieval[level_index] = retrieval
+        return sorted(retrieval.shortlist(self.retrieval_vectors(query_descriptors), top_k))
+
+    def feature_count(self, level_index: int, tile_ids: Optional[Sequence[TileId]] = None) -> int:
+        return sum(len(t.points) for t in self.tiles(level_index, tile_ids))
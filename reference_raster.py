@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""Direct windowed reads of file-backed reference rasters.
+
+For GeoTIFF/VRT references, pyramid tiles are read straight from the file
+with rasterio instead of going through the QGIS map renderer: GDAL picks
+the closest overview, resamples into the requested tile size and the
+grayscale result is returned without intermediate image copies. Readers
+are picklable and thread-safe (one dataset handle per thread), so they
+also work in worker processes. This module has no QGIS dependency.
+"""
+
+import logging
+import threading
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.enums import ColorInterp, Resampling
+from rasterio.windows import Window, from_bounds
+
+Bounds = Tuple[float, float, float, float]  # xmin, ymin, xmax, ymax (raster CRS units)
+
+_STRETCH_SAMPLE_PX = 1024  # Longest side of the overview sampled to stretch non-8-bit rasters
+_STRETCH_PERCENTILES = (2, 98)
+_GRAY_WEIGHTS = (0.299, 0.587, 0.114)  # R, G, B
+CACHE_VERSION = "rasterio-1"  # Cache key version of tiles read directly (they ignore the layer style)
+
+
+class RasterTileReader:
+    """``(bounds, width, height) -> uint8 gray`` tile renderer reading a raster file directly."""
+
+    thread_safe = True  # ReferenceContext need not serialize calls
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with rasterio.open(path) as ds:
+            self.crs = ds.crs.to_string()  # "EPSG:n" when the CRS has a code, WKT otherwise
+            self.bounds = tuple(ds.bounds)
+            self.pixel_size = min(abs(ds.transform.a), abs(ds.transform.e))
+            self.indexes = gray_band_indexes(ds)
+            self.value_range = None if ds.dtypes[0] == "uint8" else stretch_range(ds, self.indexes[0])
+
+    def __getstate__(self):
+        # Dataset handles cannot be pickled; each process opens its own
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _dataset(self):
+        ds = getattr(self._local, "dataset", None)
+        if ds is None:
+            ds = self._local.dataset = rasterio.open(self.path)
+        return ds
+
+    def __call__(self, bounds: Bounds, width: int, height: int) -> np.ndarray:
+        ds = self._dataset()
+        full = from_bounds(*bounds, transform=ds.transform)
+        # Intersect with the raster and find where that part lands in the tile
+        col0, row0 = max(0.0, full.col_off), max(0.0, full.row_off)
+        col1 = min(float(ds.width), full.col_off + full.width)
+        row1 = min(float(ds.height), full.row_off + full.height)
+        sx, sy = width / full.width, height / full.height
+        dx0, dx1 = int(round((col0 - full.col_off) * sx)), int(round((col1 - full.col_off) * sx))
+        dy0, dy1 = int(round((row0 - full.row_off) * sy)), int(round((row1 - full.row_off) * sy))
+        if dx1 <= dx0 or dy1 <= dy0:
+            return np.zeros((height, width), np.uint8)
+
+        gray = self._read_gray(ds, Window(col0, row0, col1 - col0, row1 - row0), (dy1 - dy0, dx1 - dx0))
+        if (dx0, dy0, dx1, dy1) == (0, 0, width, height):
+            return gray
+        tile = np.zeros((height, width), np.uint8)
+        tile[dy0:dy1, dx0:dx1] = gray
+        return tile
+
+    def _read_gray(self, ds, window: Window, shape: Tuple[int, int]) -> np.ndarray:
+        return read_gray(ds, self.indexes, self.value_range, window, shape)
+
+
+def gray_band_indexes(ds) -> Tuple[int, ...]:
+    """Band indexes averaged into gray: red, green and blue if present, otherwise band 1."""
+    interp = {ci: i + 1 for i, ci in enumerate(ds.colorinterp)}
+    rgb = tuple(interp.get(ci) for ci in (ColorInterp.red, ColorInterp.green, ColorInterp.blue))
+    if all(rgb):
+        return rgb
+    if ds.count >= 3 and ds.colorinterp[0] not in (ColorInterp.gray, ColorInterp.palette):
+        return 1, 2, 3
+    return 1,
+
+
+def stretch_range(ds, band: int) -> Tuple[float, float]:
+    """Percentile range of a decimated read of `band`, used to map 16-bit/float data to 8 bits."""
+    scale = min(1.0, _STRETCH_SAMPLE_PX / max(ds.width, ds.height))
+    shape = (max(1, int(ds.height * scale)), max(1, int(ds.width * scale)))
+    sample = ds.read(band, out_shape=shape, resampling=Resampling.average, masked=True)
+    values = sample.compressed()
+    if values.size == 0:
+        return 0.0, 1.0
+    low, high = np.percentile(values, _STRETCH_PERCENTILES)
+    return float(low), float(max(high, low + 1e-6))
+
+
+def read_gray(ds, indexes: Tuple[int, ...], value_range: Optional[Tuple[float, float]],
+              window: Optional[Window], shape: Tuple[int, int]) -> np.ndarray:
+    """8-bit gray of `window` (the whole raster if None) resampled to `shape` (rows, cols).
+
+    `indexes` and `value_range` come from gray_band_indexes and, for
+    non-8-bit data, stretch_range.
+    """
+    # out_shape lets GDAL read from the closest overview and resample in one pass
+    bands = ds.read(indexes, window=window, out_shape=(len(indexes),) + tuple(shape),
+                    resampling=Resampling.average)
+    return gray_from_bands(bands, value_range)
+
+
+def gray_from_bands(bands: np.ndarray, value_range: Optional[Tuple[float, float]]) -> np.ndarray:
+    """8-bit gray of the (bands, rows, cols) array read by read_gray."""
+    if value_range is not None:
+        low, high = value_range
+        bands = np.clip((bands - low) * (255.0 / (high - low)), 0, 255).astype(np.uint8)
+    if len(bands) == 1:
+        return bands[0]
+    r, g, b = bands[:3]
+    gray = cv2.addWeighted(r, _GRAY_WEIGHTS[0], g, _GRAY_WEIGHTS[1], 0)
+    return cv2.addWeighted(gray, 1.0, b, _GRAY_WEIGHTS[2], 0)
+
+
+def open_reference_raster(path: str, crs: Optional[str] = None) -> Optional[RasterTileReader]:
+    """Reader for `path`, or None if rasterio cannot read it directly.
+
+    Returns None for rotated/sheared rasters and, when `crs` is given, for
+    rasters whose CRS differs from it (e.g. a layer CRS overridden in QGIS).
+    """
+    try:
+        with rasterio.open(path) as ds:
+            t = ds.transform
+            if ds.crs is None or t.b != 0 or t.d != 0 or t.e >= 0:
+                return None
+            if crs is not None and CRS.from_user_input(crs) != ds.crs:
+                return None
+        return RasterTileReader(path)
+    except Exception as e:
+        logging.info(f"Leitura direta da referência indisponível ({path}): {e}")
+        return None
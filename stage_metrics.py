@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Per-image stage timings, memory and counts of the georeferencing pipeline.
+
+Each stage runs inside ``with stage(name):``, which adds its wall time to
+the statistics of the image the current thread is working on, as set by
+:func:`recording`. Nested stages are exclusive: a reference tile rendered
+during matching counts as ``render`` only, not as ``match`` as well. The
+stages of an image therefore add up to the time its threads spent on it.
+Outside :func:`recording` the timers do nothing. The resident memory of
+the process is sampled at every stage boundary, giving the peak reached
+while the image was processed and its growth over the memory in use when
+the image started. This module also turns the statistics into report rows
+and exports them as CSV or JSON for regression tracking. It has no QGIS
+dependency.
+
+In batch pipelines the reader and writer threads record into the same
+image as its worker does. Their stages overlap the worker's stages, so the
+sum of the stages can exceed the total time of the image. Memory is that
+of the whole process: with thread workers, the peak of an image includes
+what the other images in flight held at the same time.
+"""
+
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Timed stages, in pipeline order. "estimation" is timed by match_and_estimate
+# itself, so that its time is also known when nothing is being recorded
+STAGES = ("read", "render", "detect", "match", "estimation", "warp", "write", "wait")
+REPORT_COLUMNS = (  # (key, header) of each report row, in dialog and CSV order
+    ("image", "Image"),
+    ("status", "Status"),
+    ("total_s", "Total (s)"),
+    *((f"{name}_s", f"{name.capitalize()} (s)") for name in STAGES),
+    ("peak_rss_mb", "Peak RSS (MB)"),
+    ("rss_growth_mb", "RSS growth (MB)"),
+    ("keypoints", "Keypoints"),
+    ("reference_keypoints", "Reference keypoints"),
+    ("matches", "Matches"),
+    ("inliers", "Inliers"),
+    ("output_mb", "Output (MB)"),
+    ("output", "Output"),
+    ("message", "Message"),
+)
+
+_local = threading.local()
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+@contextmanager
+def recording(stats: Optional[dict]):
+    """Time the stages run by this thread into `stats` (nothing if None)."""
+    if stats is not None and stats is getattr(_local, "stats", None):
+        yield stats  # Already recording into it: keep the stage stack
+        return
+    previous = getattr(_local, "stats", None), getattr(_local, "stack", None)
+    _local.stats, _local.stack = stats, []
+    if stats is not None and "rss_start_mb" not in stats:
+        rss = current_rss_mb()
+        if rss is not None:
+            stats["rss_start_mb"] = stats["peak_rss_mb"] = rss
+    try:
+        yield stats
+    finally:
+        _local.stats, _local.stack = previous
+
+
+def current() -> Optional[dict]:
+    """Statistics this thread is recording into, if any."""
+    return getattr(_local, "stats", None)
+
+
+def _add(stats: dict, name: str, seconds: float):
+    key = f"{name}_s"
+    stats[key] = stats.get(key, 0.0) + seconds
+
+
+def sample_memory(stats: dict):
+    """Raise the peak memory of `stats` to the current resident memory, and update its growth."""
+    rss = current_rss_mb()
+    if rss is None:
+        return
+    peak = max(stats.get("peak_rss_mb", 0.0), rss)
+    stats["peak_rss_mb"] = peak
+    stats["rss_growth_mb"] = peak - stats.get("rss_start_mb", peak)
+
+
+@contextmanager
+def stage(name: str):
+    """Add the wall time of the block to stage `name`, pausing the enclosing stage meanwhile."""
+    stats = getattr(_local, "stats", None)
+    if stats is None:
+        yield
+        return
+    stack = _local.stack
+    sample_memory(stats)
+    now = time.perf_counter()
+    if stack:
+        _add(stats, stack[-1][0], now - stack[-1][1])
+    entry = [name, now]
+    stack.append(entry)
+    try:
+        yield
+    finally:
+        now = time.perf_counter()
+        _add(stats, name, now - entry[1])
+        stack.pop()
+        if stack:
+            stack[-1][1] = now
+        sample_memory(stats)
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident memory of this process now, in MB (None where unknown)."""
+    try:
+        with open("/proc/self/statm") as f:  # Linux: sizes in pages, resident second
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    if sys.platform == "win32":
+        return _windows_rss_mb()
+    try:
+        import psutil  # Optional, e.g. on macOS
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def _windows_rss_mb() -> Optional[float]:
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32, psapi = ctypes.windll.kernel32, ctypes.windll.psapi
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+        if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize / (1024 * 1024)
+    except (AttributeError, OSError):
+        return None
+
+
+def report_row(image_path: str, success: bool, message: str, output_path: str,
+               stats: Optional[dict]) -> Dict[str, object]:
+    """One report row (keys of REPORT_COLUMNS) for an image of a batch."""
+    row = {"image": os.path.basename(image_path), "status": "ok" if success else "failed",
+           "output": output_path, "message": message}
+    for key, _ in REPORT_COLUMNS:
+        value = (stats or {}).get(key)
+        if isinstance(value, float):
+            row[key] = round(value, 3)
+        elif value is not None:
+            row[key] = value
+    return row
+
+
+def write_report(rows: List[Dict[str, object]], path: str):
+    """Save report rows as JSON (``.json``) or CSV (any other extension)."""
+    keys = [key for key, _ in REPORT_COLUMNS]
+    if path.lower().endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([{key: row.get(key) for key in keys} for row in rows], f, indent=1, ensure_ascii=False)
+        return
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=keys, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)